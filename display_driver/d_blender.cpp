@@ -22,6 +22,8 @@
 
 #include <vector>
 #include <array>
+#include <algorithm>
+#include <mutex>
 #include <stdlib.h>
 #include "libndspy/Dspy.h"
 
@@ -54,6 +56,7 @@ struct BlenderImage
         isXpu = false;
         framebuffer = nullptr;
         denoiseFrameBuffer = nullptr;
+        hasDirtyRegion = false;
     }
 
     int width;
@@ -71,6 +74,16 @@ struct BlenderImage
     int entrysize;
     int entrytype;
     bool useActiveRegion;
+
+    // union of the regions that have been written to since the
+    // last call to GetDirtyRegion, in framebuffer (flipped) rows
+    int dirtyXMin;
+    int dirtyXMax;
+    int dirtyYMin;
+    int dirtyYMax;
+    bool hasDirtyRegion;
+    std::mutex dirtyMutex;
+
     unsigned char* framebuffer;
     unsigned char* denoiseFrameBuffer;
     size_t size;
@@ -161,6 +174,30 @@ bool DenoiseBuffer(BlenderImage* blenderImage)
     return false;
 }
 
+// Add the given region to the dirty region
+void MarkDirtyRegion(BlenderImage* blenderImage, int xmin, int xmax, int ymin, int ymax)
+{
+    std::lock_guard<std::mutex> lock(blenderImage->dirtyMutex);
+    if (!blenderImage->hasDirtyRegion)
+    {
+        blenderImage->dirtyXMin = xmin;
+        blenderImage->dirtyXMax = xmax;
+        blenderImage->dirtyYMin = ymin;
+        blenderImage->dirtyYMax = ymax;
+        blenderImage->hasDirtyRegion = true;
+        return;
+    }
+    blenderImage->dirtyXMin = std::min(blenderImage->dirtyXMin, xmin);
+    blenderImage->dirtyXMax = std::max(blenderImage->dirtyXMax, xmax);
+    blenderImage->dirtyYMin = std::min(blenderImage->dirtyYMin, ymin);
+    blenderImage->dirtyYMax = std::max(blenderImage->dirtyYMax, ymax);
+}
+
+void MarkFullFrameDirty(BlenderImage* blenderImage)
+{
+    MarkDirtyRegion(blenderImage, 0, blenderImage->width-1, 0, blenderImage->height-1);
+}
+
 // Copy from the XPU shared memory framebuffer to our framebuffer
 void CopyXpuBuffer(BlenderImage* blenderImage)
 {
@@ -309,6 +346,78 @@ void GetFloatFramebuffer(size_t pos, size_t pybuffersize, float* pybuffer)
     memcpy(pybuffer, blenderImage->framebuffer, sizeof(float) * pybuffersize);
 }
 
+// Return the union of the regions that have been updated since the
+// last call, and reset it. The region is in framebuffer rows, i.e.: the
+// same layout GetFloatFramebuffer returns. Returns false if nothing
+// has been updated.
+PRMANEXPORT
+bool GetDirtyRegion(size_t pos, int& xmin, int& xmax, int& ymin, int& ymax)
+{
+    if (s_blenderImages.empty() || pos >= s_blenderImages.size())
+        return false;
+
+    BlenderImage* blenderImage = s_blenderImages[pos];
+
+    if (blenderImage == nullptr)
+        return false;
+
+    std::lock_guard<std::mutex> lock(blenderImage->dirtyMutex);
+    if (!blenderImage->hasDirtyRegion)
+        return false;
+
+    if (blenderImage->use_denoiser)
+    {
+        // the denoiser touches every pixel
+        xmin = 0;
+        xmax = blenderImage->width-1;
+        ymin = 0;
+        ymax = blenderImage->height-1;
+    }
+    else
+    {
+        xmin = blenderImage->dirtyXMin;
+        xmax = blenderImage->dirtyXMax;
+        ymin = blenderImage->dirtyYMin;
+        ymax = blenderImage->dirtyYMax;
+    }
+    blenderImage->hasDirtyRegion = false;
+    return true;
+}
+
+// Copy a region of the float buffer for this display. The region
+// is packed tightly into pybuffer, row by row.
+PRMANEXPORT
+void GetFloatFramebufferRegion(size_t pos, int xmin, int xmax, int ymin, int ymax, size_t pybuffersize, float* pybuffer)
+{
+    if (s_blenderImages.empty() || pos >= s_blenderImages.size())
+        return;
+
+    BlenderImage* blenderImage = s_blenderImages[pos];
+
+    if (blenderImage == nullptr)
+        return;
+
+    if (xmin < 0 || ymin < 0 || xmax >= blenderImage->width || ymax >= blenderImage->height
+        || xmin > xmax || ymin > ymax)
+        return;
+
+    size_t rowsize = (xmax - xmin + 1) * blenderImage->entrysize;
+    if (rowsize * (ymax - ymin + 1) > sizeof(float) * pybuffersize)
+        return;
+
+    const unsigned char* src = blenderImage->framebuffer;
+    if (DenoiseBuffer(blenderImage)) {
+        src = blenderImage->denoiseFrameBuffer;
+    }
+
+    unsigned char* dst = (unsigned char*) pybuffer;
+    for (int y = ymin; y <= ymax; ++y)
+    {
+        memcpy(dst, src + (y * blenderImage->width + xmin) * blenderImage->entrysize, rowsize);
+        dst += rowsize;
+    }
+}
+
 // Return the active region that RenderMan is currently working on
 PRMANEXPORT
 void GetActiveRegion(size_t pos, int& arXMin, int& arXMax, int& arYMin, int& arYMax)
@@ -571,6 +680,7 @@ DspyImageOpen(
     /* Reserve a framebuffer */
     blenderImage->size = blenderImage->width * blenderImage->height * blenderImage->entrysize;
     blenderImage->framebuffer = (unsigned char*) std::malloc(blenderImage->size);
+    MarkFullFrameDirty(blenderImage);
 
     *ppvImage = blenderImage;
     s_blenderImages.push_back(blenderImage);
@@ -673,6 +783,12 @@ DspyImageData(
         }
     }
 
+    MarkDirtyRegion(blenderImage,
+                    blenderImage->cropXMin + xmin,
+                    blenderImage->cropXMin + xmax_plus_1 - 1,
+                    (blenderImage->height-1) - (blenderImage->cropYMin + ymax_plus_1 - 1),
+                    (blenderImage->height-1) - (blenderImage->cropYMin + ymin));
+
     blenderImage->arXMin = blenderImage->cropXMin + xmin;
     blenderImage->arXMax = blenderImage->cropXMin + xmax_plus_1 - 1;
     blenderImage->arYMin = blenderImage->cropYMin + ymin;
@@ -853,6 +969,7 @@ bool DisplayBlender::Rebind(const uint32_t width, const uint32_t height,
    {
         m_image->denoiseFrameBuffer = (unsigned char*) std::malloc(m_image->size);
    }
+   MarkFullFrameDirty(m_image);
    return true; 
 }
 
@@ -884,6 +1001,7 @@ void DisplayBlender::Notify(const uint32_t iteration,
         return;
     }
     CopyXpuBuffer(m_image);
+    MarkFullFrameDirty(m_image);
     m_image->bufferUpdated = true;
     if (tag_redraw_func)
     {
@@ -60,6 +60,7 @@ __DEFAULTS__ = {
     'rman_preview_renders_pixelVariance': 0.15,
     'rman_viewport_draw_lights_textured': True,
     'rman_viewport_lights_draw_wireframe': True,
+    'rman_viewport_light_texture_budget': 512,
     'rman_viewport_draw_bucket': True,
     'rman_viewport_draw_progress': True,
     'rman_viewport_crop_color': (0.0, 0.498, 1.0, 1.0),       
@@ -73,6 +74,10 @@ __DEFAULTS__ = {
     'rman_show_advanced_params': False,      
     'rman_config_dir': "",
     'rman_viewport_refresh_rate': 0.01,
+    'rman_primvar_buffer_mode': True,
+    'rman_hair_chunk_size': 100000,
+    'rman_gpencil_batch_strokes': True,
+    'rman_share_identical_materials': True,
     'rman_solo_collapse_nodes': True,
     'rman_use_blend_dir_token': True,          
     'rman_ui_framework': "NATIVE",
@@ -419,6 +424,13 @@ class RendermanPreferences(AddonPreferences):
         default=True
     )             
 
+    rman_viewport_light_texture_budget: IntProperty(
+        name="Light Texture Budget (MB)",
+        description="How much memory, in megabytes, the textures drawn on lights in the viewport can use. The textures that have not been drawn for the longest time are freed first.",
+        default=512,
+        min=16
+    )
+
     rman_viewport_draw_bucket: BoolProperty(
         name="Draw Bucket Marker",    
         description="Unchechk this if you do not want the bucket markers in the viewport",
@@ -508,6 +520,31 @@ class RendermanPreferences(AddonPreferences):
         max=0.1
     )    
 
+    rman_primvar_buffer_mode: BoolProperty(
+        name="Buffer Primvars",
+        default=True,
+        description="Pass geometry primvars to RenderMan as contiguous arrays, rather than converting them to Python lists first. Turning this off is only useful for debugging purposes."
+    )
+
+    rman_hair_chunk_size: IntProperty(
+        name="Hair Chunk Size",
+        default=100000,
+        min=1000,
+        description="Hair and curves are split into separate curve primitives after this many vertices."
+    )
+
+    rman_gpencil_batch_strokes: BoolProperty(
+        name="Batch Grease Pencil Strokes",
+        default=True,
+        description="Merge all of the strokes of a grease pencil layer that use the same material into a single primitive, rather than exporting each stroke separately."
+    )
+
+    rman_share_identical_materials: BoolProperty(
+        name="Share Identical Materials",
+        default=True,
+        description="Materials that are exact copies of each other (ex: Material.001, Material.002) are exported once, and share the same RenderMan material. Note that shared materials also share the same material ID."
+    )
+
     rman_solo_collapse_nodes: BoolProperty(
         name="Collapse Non-Solo Nodes",
         default=True,
@@ -810,6 +847,7 @@ class RendermanPreferences(AddonPreferences):
         col = row.column()
         col.prop(self, 'rman_viewport_draw_lights_textured')
         col.prop(self, 'rman_viewport_lights_draw_wireframe')
+        col.prop(self, 'rman_viewport_light_texture_budget')
         col.prop(self, 'rman_viewport_crop_color')
         col.prop(self, 'rman_viewport_draw_bucket')
         if self.rman_viewport_draw_bucket:
@@ -910,6 +948,10 @@ class RendermanPreferences(AddonPreferences):
             col.label(text='Other', icon_value=rman_r_icon.icon_id)
 
             col.prop(self, 'rman_viewport_refresh_rate')  
+            col.prop(self, 'rman_primvar_buffer_mode')
+            col.prop(self, 'rman_hair_chunk_size')
+            col.prop(self, 'rman_gpencil_batch_strokes')
+            col.prop(self, 'rman_share_identical_materials')
             col.prop(self, 'rman_config_dir')   
             if self.rman_do_preview_renders:
                 col.prop(self, 'rman_preview_renders_minSamples')
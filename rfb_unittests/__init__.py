@@ -1,8 +1,21 @@
 import unittest
 from RenderManForBlender.rfb_unittests.test_string_expr import StringExprTest
+from RenderManForBlender.rfb_unittests.test_mesh_vgroups import MeshVertexGroupTest
+from RenderManForBlender.rfb_unittests.test_nurbs import NurbsTest
+from RenderManForBlender.rfb_unittests.bench_mesh_export import MeshExportBenchmark
+from RenderManForBlender.rfb_unittests.bench_framebuffer import FramebufferBenchmark
+from RenderManForBlender.rfb_unittests.bench_string_expr import StringExprBenchmark
 
 classes = [
-    StringExprTest
+    StringExprTest,
+    MeshVertexGroupTest,
+    NurbsTest
+]
+
+benchmarks = [
+    MeshExportBenchmark,
+    FramebufferBenchmark,
+    StringExprBenchmark
 ]
 
 def suite():
@@ -13,9 +26,21 @@ def suite():
 
     return suite
 
+def benchmark_suite():
+    suite = unittest.TestSuite()
+
+    for cls in benchmarks:
+        cls.add_tests(suite)
+
+    return suite
+
 def run_rfb_unittests():
     runner = unittest.TextTestRunner()
     runner.run(suite())
 
+def run_rfb_benchmarks():
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(benchmark_suite())
+
 if __name__ == '__main__':
-    run_rfb_unittests()
\ No newline at end of file
+    run_rfb_unittests()
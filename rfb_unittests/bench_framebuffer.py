@@ -0,0 +1,68 @@
+import unittest
+import time
+import numpy
+from ..rfb_utils import framebuffer_utils
+
+class _BorderSettings:
+    # stand-in for bpy.types.RenderSettings
+    def __init__(self, min_x, max_x, min_y, max_y):
+        self.border_min_x = min_x
+        self.border_max_x = max_x
+        self.border_min_y = min_y
+        self.border_max_y = max_y
+
+class FramebufferBenchmark(unittest.TestCase):
+
+    @classmethod
+    def add_tests(self, suite):
+        suite.addTest(FramebufferBenchmark('bench_update_latency'))
+        suite.addTest(FramebufferBenchmark('bench_dirty_region'))
+
+    # time the per-AOV work done by BlRenderResultHelper.update_passes
+    def bench_update_latency(self):
+        render = _BorderSettings(0.25, 0.75, 0.25, 0.75)
+        num_updates = 10
+        for (width, height) in [(1920, 1080), (3840, 2160)]:
+            window = framebuffer_utils.get_border_window(width, height, render)
+            start_x, end_x, start_y, end_y = window
+            npixels = (end_x-start_x)*(end_y-start_y)
+            for num_channels in [1, 3, 4]:
+                buffer = numpy.random.rand(width*height*num_channels).astype(numpy.float32)
+                pool = framebuffer_utils.FramebufferPool()
+
+                start = time.perf_counter()
+                for i in range(num_updates):
+                    pixels = pool.get('crop', (npixels, num_channels))
+                    framebuffer_utils.crop_pixels(buffer, width, height, num_channels, window, out=pixels)
+                    framebuffer_utils.expand_to_rgba(buffer, num_channels, out=pool.get('rgba', (width*height, 4), fill=1.0))
+                elapsed = (time.perf_counter() - start) / num_updates
+                print('%dx%d, %d channel(s): %.2f ms per AOV update' % (width, height, num_channels, elapsed * 1000.0))
+
+                expected = numpy.reshape(buffer, (height, width, num_channels))[start_y:end_y, start_x:end_x]
+                self.assertTrue(numpy.array_equal(pixels, numpy.reshape(expected, (-1, num_channels))))
+
+    # compare a full viewport copy against copying only a dirty bucket
+    def bench_dirty_region(self):
+        num_updates = 10
+        bucket = 64
+        for (width, height) in [(1920, 1080), (3840, 2160)]:
+            for num_channels in [1, 4]:
+                buffer = numpy.random.rand(width*height*num_channels).astype(numpy.float32)
+                full = numpy.ones((height, width, 4), dtype=numpy.float32)
+                partial = numpy.ones((height, width, 4), dtype=numpy.float32)
+                xmin, ymin = width // 2, height // 2
+                xmax, ymax = xmin + bucket - 1, ymin + bucket - 1
+
+                start = time.perf_counter()
+                for i in range(num_updates):
+                    framebuffer_utils.expand_to_rgba(buffer, num_channels, out=full)
+                full_time = (time.perf_counter() - start) / num_updates
+
+                start = time.perf_counter()
+                for i in range(num_updates):
+                    region = numpy.reshape(buffer, (height, width, num_channels))[ymin:ymax+1, xmin:xmax+1].copy()
+                    framebuffer_utils.expand_to_rgba(region, num_channels, out=partial[ymin:ymax+1, xmin:xmax+1])
+                region_time = (time.perf_counter() - start) / num_updates
+                print('%dx%d, %d channel(s): full %.2f ms, dirty region %.3f ms' % (width, height, num_channels, full_time * 1000.0, region_time * 1000.0))
+
+                self.assertTrue(numpy.array_equal(partial[ymin:ymax+1, xmin:xmax+1], full[ymin:ymax+1, xmin:xmax+1]))
@@ -0,0 +1,84 @@
+import unittest
+import time
+import bpy
+import numpy as np
+from ..rfb_utils import mesh_utils
+from ..rman_translators import rman_mesh_translator
+
+def _make_grid_mesh(name, res):
+    '''
+    Create a synthetic res x res quad grid mesh.
+    '''
+    nverts = (res+1) * (res+1)
+    xs, ys = np.meshgrid(np.arange(res+1, dtype=np.float32), np.arange(res+1, dtype=np.float32))
+    P = np.column_stack((xs.ravel(), ys.ravel(), np.zeros(nverts, dtype=np.float32)))
+
+    row = np.arange(res, dtype=np.int32)
+    col = np.arange(res, dtype=np.int32)
+    base = (row[:, None] * (res+1) + col[None, :]).ravel()
+    verts = np.column_stack((base, base+1, base+res+2, base+res+1)).ravel()
+    npolys = res * res
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(nverts)
+    mesh.vertices.foreach_set('co', P.ravel())
+    mesh.loops.add(len(verts))
+    mesh.loops.foreach_set('vertex_index', verts)
+    mesh.polygons.add(npolys)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, npolys*4, 4, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(npolys, 4, dtype=np.int32))
+    mesh.update()
+    return mesh
+
+def _time_it(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+class MeshExportBenchmark(unittest.TestCase):
+
+    @classmethod
+    def add_tests(self, suite):
+        suite.addTest(MeshExportBenchmark('bench_list_vs_buffer'))
+        suite.addTest(MeshExportBenchmark('bench_facesets'))
+
+    # compare list and buffer primvar export on synthetic meshes
+    def bench_list_vs_buffer(self):
+        for res in [100, 500, 1000]:
+            mesh = _make_grid_mesh('MeshExportBenchmark', res)
+            try:
+                list_time = _time_it(mesh_utils.get_mesh, mesh, get_normals=True, as_buffer=False)
+                buffer_time = _time_it(mesh_utils.get_mesh, mesh, get_normals=True, as_buffer=True)
+                print('%d polygons: list %.4fs, buffer %.4fs' % (res*res, list_time, buffer_time))
+
+                (nverts, verts, P, N) = mesh_utils.get_mesh(mesh, get_normals=True, as_buffer=False)
+                (b_nverts, b_verts, b_P, b_N) = mesh_utils.get_mesh(mesh, get_normals=True, as_buffer=True)
+                self.assertEqual(nverts, b_nverts.tolist())
+                self.assertEqual(verts, b_verts.tolist())
+                self.assertEqual(P, b_P.tolist())
+                self.assertTrue(b_P.flags['C_CONTIGUOUS'])
+                self.assertEqual(b_P.dtype, np.float32)
+                self.assertEqual(b_verts.dtype, np.int32)
+            finally:
+                bpy.data.meshes.remove(mesh)
+
+    # time the faceset builder against a per-face python loop
+    def bench_facesets(self):
+        for nfaces in [100000, 1000000, 5000000]:
+            material_ids = np.random.randint(0, 12, size=nfaces).astype(np.int32)
+
+            def _loop_facesets():
+                mats = {}
+                for face_id, mat_id in enumerate(material_ids.tolist()):
+                    mats.setdefault(mat_id, []).append(face_id)
+                return mats
+
+            loop_time = _time_it(_loop_facesets)
+            numpy_time = _time_it(rman_mesh_translator._get_mats_faces_, material_ids)
+            print('%d faces: loop %.4fs, numpy %.4fs' % (nfaces, loop_time, numpy_time))
+
+            facesets = rman_mesh_translator._get_mats_faces_(material_ids)
+            expected = _loop_facesets()
+            self.assertEqual(sorted(facesets.keys()), sorted(expected.keys()))
+            for mat_id, faces in facesets.items():
+                self.assertEqual(faces.tolist(), expected[mat_id])
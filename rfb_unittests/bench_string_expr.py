@@ -0,0 +1,55 @@
+import unittest
+import time
+from ..rfb_utils import string_utils
+from ..rfb_utils import string_expr
+
+# a mix of the kinds of strings we expand during an export
+_PATHS = [
+    '',
+    'diffuse',
+    '/textures/wood/oak_diffuse.tex',
+    '<OUT>/images/<scene>.<f4>.<ext>',
+    '<OUT>/images/<scene>_<aov>.<f4>.<ext>',
+    '<blend_dir>/textures/brick_<udim>.tex',
+    '<blend_dir>/textures/leaf_<f4>.tex',
+    '$RMANTREE/lib/textures/env.tex',
+    '<OUT>/shaders/<blend>_<layer>_<version>_<take>',
+    '<unittest_asset>/maps/<unittest_asset>_roughness.tex',
+]
+
+class StringExprBenchmark(unittest.TestCase):
+
+    @classmethod
+    def add_tests(self, suite):
+        suite.addTest(StringExprBenchmark('bench_expand_string'))
+
+    # compare expanding with an empty cache against repeated expansions
+    def bench_expand_string(self):
+        string_utils.set_var('unittest_asset', 'StringExprBenchmark')
+        num_params = 5000
+        strings = [_PATHS[i % len(_PATHS)] for i in range(num_params)]
+        string_utils.update_frame_token(1)
+        expected = [string_utils.expand_string(s) for s in strings]
+        expr = string_utils.__SCENE_STRING_CONVERTER__.expr
+
+        uncached_time = 0.0
+        cached_time = 0.0
+        num_frames = 10
+        for frame in range(1, num_frames+1):
+            # the first pass on each frame starts with an empty cache, the way a
+            # frame change does during an export
+            string_utils.update_frame_token(frame)
+            expr._expand_cache.clear()
+            string_expr.compile_expr.cache_clear()
+            start = time.perf_counter()
+            results = [string_utils.expand_string(s) for s in strings]
+            uncached_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = [string_utils.expand_string(s) for s in strings]
+            cached_time += time.perf_counter() - start
+
+            if frame == 1:
+                self.assertEqual(results, expected)
+
+        print('%d strings: first pass %.2f ms, cached %.2f ms per frame' % (num_params, uncached_time * 1000.0 / num_frames, cached_time * 1000.0 / num_frames))
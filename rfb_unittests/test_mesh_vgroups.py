@@ -0,0 +1,66 @@
+import unittest
+import bpy
+from ..rman_translators import rman_mesh_translator
+
+def _loop_vgroup_weights(ob, mesh, name):
+    # the per-vertex loop the batched extractor replaced
+    vgroup = ob.vertex_groups[name]
+    weights = []
+    for v in mesh.vertices:
+        if len(v.groups) == 0:
+            weights.append(0.0)
+        else:
+            weights.extend([g.weight for g in v.groups
+                            if g.group == vgroup.index])
+    return weights
+
+class MeshVertexGroupTest(unittest.TestCase):
+
+    @classmethod
+    def add_tests(self, suite):
+        suite.addTest(MeshVertexGroupTest('test_matches_loop'))
+        suite.addTest(MeshVertexGroupTest('test_overlapping_groups'))
+        suite.addTest(MeshVertexGroupTest('test_missing_group'))
+
+    def setUp(self):
+        verts = [(x, y, 0.0) for y in range(4) for x in range(4)]
+        faces = [(y*4+x, y*4+x+1, (y+1)*4+x+1, (y+1)*4+x) for y in range(3) for x in range(3)]
+        self.mesh = bpy.data.meshes.new('MeshVertexGroupTest')
+        self.mesh.from_pydata(verts, [], faces)
+        self.ob = bpy.data.objects.new('MeshVertexGroupTest', self.mesh)
+
+    def tearDown(self):
+        bpy.data.objects.remove(self.ob)
+        bpy.data.meshes.remove(self.mesh)
+
+    # every vertex is either in the group or in no group at all
+    def test_matches_loop(self):
+        group = self.ob.vertex_groups.new(name='weights')
+        for i in range(len(self.mesh.vertices)):
+            group.add([i], i / 16.0, 'REPLACE')
+
+        weights = rman_mesh_translator._get_mesh_vgroups_(self.ob, self.mesh, ['weights'])
+        expected = _loop_vgroup_weights(self.ob, self.mesh, 'weights')
+        self.assertEqual(len(weights['weights']), len(self.mesh.vertices))
+        for a, b in zip(weights['weights'].tolist(), expected):
+            self.assertAlmostEqual(a, b, places=6)
+
+    # vertices that belong to other groups get a weight of 0.0
+    def test_overlapping_groups(self):
+        group_a = self.ob.vertex_groups.new(name='a')
+        group_b = self.ob.vertex_groups.new(name='b')
+        group_a.add([0, 1, 2, 3], 0.5, 'REPLACE')
+        group_b.add([2, 3, 4, 5], 0.25, 'REPLACE')
+        self.ob.vertex_groups.active_index = group_b.index
+
+        weights = rman_mesh_translator._get_mesh_vgroups_(self.ob, self.mesh, ['a', 'b', ''])
+        expected_a = [0.5]*4 + [0.0]*12
+        expected_b = [0.0]*2 + [0.25]*4 + [0.0]*10
+        self.assertEqual(weights['a'].tolist(), expected_a)
+        self.assertEqual(weights['b'].tolist(), expected_b)
+        self.assertEqual(weights[''].tolist(), expected_b)
+
+    def test_missing_group(self):
+        weights = rman_mesh_translator._get_mesh_vgroups_(self.ob, self.mesh, ['missing', ''])
+        self.assertIsNone(weights['missing'])
+        self.assertIsNone(weights[''])
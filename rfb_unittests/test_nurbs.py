@@ -0,0 +1,46 @@
+import unittest
+import itertools
+from ..rfb_utils import nurbs_utils
+from ..rman_translators import rman_nurbs_translator
+
+class _Spline:
+    # stand-in for a NURBS bpy.types.Spline
+    def __init__(self, npoints, order, use_cyclic, use_endpoint, use_bezier):
+        self.point_count_u = npoints
+        self.point_count_v = 1
+        self.order_u = order
+        self.use_cyclic_u = use_cyclic
+        self.use_endpoint_u = use_endpoint
+        self.use_bezier_u = use_bezier
+
+def _splines():
+    for npoints, order, use_cyclic, use_endpoint, use_bezier in itertools.product([4, 5, 7],
+                                                                                   [2, 3, 4, 5],
+                                                                                   [False, True],
+                                                                                   [False, True],
+                                                                                   [False, True]):
+        if order > npoints:
+            continue
+        yield _Spline(npoints, order, use_cyclic, use_endpoint, use_bezier)
+
+class NurbsTest(unittest.TestCase):
+
+    @classmethod
+    def add_tests(self, suite):
+        suite.addTest(NurbsTest('test_knots'))
+        suite.addTest(NurbsTest('test_knots_cached'))
+
+    # knot vectors match the scalar implementation
+    def test_knots(self):
+        for nu in _splines():
+            expected = rman_nurbs_translator.makeknots(nu)
+            knots = nurbs_utils.get_knots(nu.point_count_u, nu.order_u, nu.use_cyclic_u, nu.use_endpoint_u, nu.use_bezier_u)
+            self.assertEqual(knots.tolist(), expected)
+
+    # knot vectors are cached, and can't be modified by callers
+    def test_knots_cached(self):
+        for nu in _splines():
+            knots = nurbs_utils.get_knots(nu.point_count_u, nu.order_u, nu.use_cyclic_u, nu.use_endpoint_u, nu.use_bezier_u)
+            again = nurbs_utils.get_knots(nu.point_count_u, nu.order_u, nu.use_cyclic_u, nu.use_endpoint_u, nu.use_bezier_u)
+            self.assertIs(knots, again)
+            self.assertFalse(knots.flags.writeable)
@@ -9,6 +9,7 @@ class StringExprTest(unittest.TestCase):
         suite.addTest(StringExprTest('test_get_var'))
         suite.addTest(StringExprTest('test_set_var'))
         suite.addTest(StringExprTest('test_expand_string'))
+        suite.addTest(StringExprTest('test_expand_cache'))
 
     # test getvar 
     def test_get_var(self):
@@ -26,4 +27,14 @@ class StringExprTest(unittest.TestCase):
         string_utils.set_var('OUT', '/var/tmp')
         string_utils.set_var('unittest', 'StringExprTest')
         expanded_str = string_utils.expand_string(s, display='openexr', frame=1)
-        self.assertEqual(expanded_str, compare)
\ No newline at end of file
+        self.assertEqual(expanded_str, compare)
+
+    # test that cached expansions are thrown away when a token changes
+    def test_expand_cache(self):
+        s = '<OUT>/<unittest>.<f4>.<ext>'
+        string_utils.set_var('OUT', '/var/tmp')
+        string_utils.set_var('unittest', 'first')
+        self.assertEqual(string_utils.expand_string(s, frame=1), '/var/tmp/first.0001.exr')
+        string_utils.set_var('unittest', 'second')
+        self.assertEqual(string_utils.expand_string(s, frame=1), '/var/tmp/second.0001.exr')
+        self.assertEqual(string_utils.expand_string(s, frame=2), '/var/tmp/second.0002.exr')
@@ -0,0 +1,64 @@
+import numpy as np
+
+def get_chunk_ranges(nvertices, chunk_size):
+    '''
+    Split strands into chunks, so that no single curves primitive gets
+    too many vertices. A chunk is closed as soon as it has more than
+    chunk_size vertices, so strands are never split.
+
+    Arguments:
+    nvertices (numpy.ndarray) - the number of vertices for each strand
+    chunk_size (int) - the number of vertices after which a new chunk is started
+
+    Returns:
+    (list) - (first strand, last strand + 1, first vertex, last vertex + 1) for each chunk
+    '''
+
+    nstrands = len(nvertices)
+    offsets = np.zeros(nstrands+1, dtype=np.int64)
+    np.cumsum(nvertices, out=offsets[1:])
+
+    chunks = []
+    start = 0
+    while start < nstrands:
+        end = int(np.searchsorted(offsets[1:], offsets[start] + chunk_size, side='right')) + 1
+        end = min(end, nstrands)
+        chunks.append((start, end, int(offsets[start]), int(offsets[end])))
+        start = end
+    return chunks
+
+def get_strand_offsets(nvertices):
+    '''
+    Get the index of the first vertex of each strand, and the index of each
+    vertex within its strand.
+
+    Arguments:
+    nvertices (numpy.ndarray) - the number of vertices for each strand
+
+    Returns:
+    (tuple) - the first vertex of each strand, and the local index of each vertex
+    '''
+
+    starts = np.zeros(len(nvertices), dtype=np.int64)
+    if len(nvertices) > 1:
+        np.cumsum(nvertices[:-1], out=starts[1:])
+    local_index = np.arange(int(np.sum(nvertices)), dtype=np.int64) - np.repeat(starts, nvertices)
+    return (starts, local_index)
+
+def pack_primvar(data, as_buffer=True):
+    '''
+    Get data ready to be handed to the RixParamList Set*Detail functions.
+
+    Arguments:
+    data (numpy.ndarray) - the primvar data. Lists are returned as is.
+    as_buffer (bool) - return a contiguous array, rather than a list
+
+    Returns:
+    (numpy.ndarray) - contiguous array, or a list if as_buffer is False
+    '''
+
+    if isinstance(data, list):
+        return data
+    if as_buffer:
+        return np.ascontiguousarray(data)
+    return data.tolist()
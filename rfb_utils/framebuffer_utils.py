@@ -0,0 +1,120 @@
+import numpy
+
+class FramebufferPool(object):
+    '''
+    Keeps numpy arrays around so they can be reused between framebuffer fetches,
+    rather than allocating new ones on every update.
+
+    Attributes:
+        buffers (dict) - dictionary of key to numpy arrays
+    '''
+
+    def __init__(self):
+        self.buffers = dict()
+
+    def get(self, key, shape, fill=0.0):
+        '''
+        Get a float32 array of the given shape for key. A new array, filled with fill, is
+        only allocated if there's no array for key, or the shape has changed. Callers
+        that rely on fill must leave those values untouched.
+
+        Arguments:
+            key (AnyType) - key to identify this buffer
+            shape (tuple) - shape of the array
+            fill (float) - the value to initialize a new array with
+
+        Returns:
+            (numpy.ndarray) - the array
+        '''
+        buf = self.buffers.get(key, None)
+        if buf is None or buf.shape != shape:
+            buf = numpy.full(shape, fill, dtype=numpy.float32)
+            self.buffers[key] = buf
+        return buf
+
+    def clear(self):
+        self.buffers.clear()
+
+def get_border_window(width, height, render):
+    '''
+    Get the pixel window for a border render.
+
+    Arguments:
+        width (int) - width of the full image
+        height (int) - height of the full image
+        render (bpy.types.RenderSettings) - the Blender render settings
+
+    Returns:
+        (tuple) - start_x, end_x, start_y, end_y. The end values are exclusive.
+    '''
+    start_x = 0
+    end_x = width
+    start_y = 0
+    end_y = height
+
+    if render.border_min_y > 0.0:
+        start_y = round(height * render.border_min_y)-1
+    if render.border_max_y > 0.0:
+        end_y = round(height * render.border_max_y)-1
+    if render.border_min_x > 0.0:
+        start_x = round(width * render.border_min_x)-1
+    if render.border_max_x < 1.0:
+        end_x = round(width * render.border_max_x)-2
+
+    return (start_x, end_x, start_y, end_y)
+
+def crop_pixels(buffer, width, height, num_channels, window, out=None):
+    '''
+    Crop a flat framebuffer to the given window.
+
+    Arguments:
+        buffer (numpy.ndarray) - the flat framebuffer, width * height * num_channels
+        width (int) - width of the image
+        height (int) - height of the image
+        num_channels (int) - number of channels per pixel
+        window (tuple) - start_x, end_x, start_y, end_y
+        out (numpy.ndarray) - optional (npixels, num_channels) array to write into
+
+    Returns:
+        (numpy.ndarray) - the cropped pixels, with a shape of (npixels, num_channels)
+    '''
+    start_x, end_x, start_y, end_y = window
+    if start_x >= 0 and start_y >= 0:
+        pixels = numpy.reshape(buffer, (height, width, num_channels))[start_y:end_y, start_x:end_x]
+        if out is None:
+            return numpy.reshape(pixels, (-1, num_channels))
+        numpy.copyto(numpy.reshape(out, pixels.shape), pixels)
+        return out
+
+    # a window starting at -1 (a border very close to the edge) wraps
+    # around to the previous row, or to the end of the image
+    ys = numpy.arange(start_y, end_y)
+    xs = numpy.arange(start_x, end_x)
+    indices = (ys[:, None] * width + xs[None, :]).ravel()
+    return numpy.take(numpy.reshape(buffer, (-1, num_channels)), indices, axis=0, out=out, mode='wrap')
+
+def expand_to_rgba(pixels, num_channels, out=None):
+    '''
+    Expand pixels with less than 4 channels to RGBA. A single channel is copied
+    to R, G and B. Any channel that is not filled in is left at 1.0.
+
+    Arguments:
+        pixels (numpy.ndarray) - input pixels
+        num_channels (int) - number of channels in pixels
+        out (numpy.ndarray) - optional array to write into, ex: (npixels, 4), or a
+                              (rows, columns, 4) view of a larger image. Channels that
+                              are not written to should already be 1.0.
+
+    Returns:
+        (numpy.ndarray) - the RGBA pixels, with a shape of (npixels, 4), or the shape of out
+    '''
+    if out is None:
+        pixels = numpy.reshape(pixels, (-1, num_channels))
+        out = numpy.ones((pixels.shape[0], 4), dtype=numpy.float32)
+    else:
+        pixels = numpy.reshape(pixels, out.shape[:-1] + (num_channels,))
+    if num_channels == 1:
+        out[..., 0:3] = pixels
+    else:
+        out[..., 0:num_channels] = pixels
+    return out
@@ -1,11 +1,13 @@
 import numpy as np
+import hashlib
 
-def get_mesh_points_(mesh):
+def get_mesh_points_(mesh, as_buffer=False):
     '''
     Get just the points for the input mesh.
 
     Arguments:
     mesh (bpy.types.Mesh) - Blender mesh
+    as_buffer (bool) - return a contiguous float32 array instead of a list
 
     Returns:
     (list) - the points on the mesh
@@ -15,47 +17,165 @@ def get_mesh_points_(mesh):
     P = np.zeros(nvertices*3, dtype=np.float32)
     mesh.vertices.foreach_get('co', P)
     P = np.reshape(P, (nvertices, 3))
+    if as_buffer:
+        return P
     return P.tolist()
 
-def get_mesh(mesh, get_normals=False):
+def get_mesh(mesh, get_normals=False, as_buffer=False):
     '''
     Get the basic primvars needed to render a mesh.
 
     Arguments:
     mesh (bpy.types.Mesh) - Blender mesh
     get_normals (bool) - Whether or not normals are needed
+    as_buffer (bool) - return contiguous float32/int32 arrays, that can
+                       be handed directly to the RixParamList, instead
+                       of lists
 
     Returns:
-    (list) - this includes nverts (the number of vertices for each face), 
+    (list) - this includes nverts (the number of vertices for each face),
             vertices list, points, and normals
     '''
 
-    P = get_mesh_points_(mesh)
-    N = []    
+    P = get_mesh_points_(mesh, as_buffer=as_buffer)
+    N = []
 
     npolygons = len(mesh.polygons)
     fastnvertices = np.zeros(npolygons, dtype=np.int32)
     mesh.polygons.foreach_get('loop_total', fastnvertices)
-    nverts = fastnvertices.tolist()
+    nverts = fastnvertices if as_buffer else fastnvertices.tolist()
 
     loops = len(mesh.loops)
     fastvertices = np.zeros(loops, dtype=np.int32)
     mesh.loops.foreach_get('vertex_index', fastvertices)
-    verts = fastvertices.tolist()
+    verts = fastvertices if as_buffer else fastvertices.tolist()
 
     if get_normals:
-        fastsmooth = np.zeros(npolygons, dtype=np.int32)
-        mesh.polygons.foreach_get('use_smooth', fastsmooth)
-        if mesh.use_auto_smooth or True in fastsmooth:
-            mesh.calc_normals_split()
-            fastnormals = np.zeros(loops*3, dtype=np.float32)
-            mesh.loops.foreach_get('normal', fastnormals)
-            fastnormals = np.reshape(fastnormals, (loops, 3))
-            N = fastnormals.tolist()            
-        else:            
-            fastnormals = np.zeros(npolygons*3, dtype=np.float32)
-            mesh.polygons.foreach_get('normal', fastnormals)
-            fastnormals = np.reshape(fastnormals, (npolygons, 3))
-            N = fastnormals.tolist()
-
-    return (nverts, verts, P, N)
\ No newline at end of file
+        N = get_mesh_normals(mesh, as_buffer=as_buffer)
+
+    return (nverts, verts, P, N)
+
+def get_mesh_normals(mesh, as_buffer=False):
+    '''
+    Get the normals for the input mesh. If the mesh has any smooth faces,
+    these are the facevarying split normals, otherwise they are uniform.
+
+    Arguments:
+    mesh (bpy.types.Mesh) - Blender mesh
+    as_buffer (bool) - return a contiguous float32 array instead of a list
+
+    Returns:
+    (list) - the normals of the mesh
+    '''
+
+    npolygons = len(mesh.polygons)
+    loops = len(mesh.loops)
+    fastsmooth = np.zeros(npolygons, dtype=np.int32)
+    mesh.polygons.foreach_get('use_smooth', fastsmooth)
+    if mesh.use_auto_smooth or True in fastsmooth:
+        mesh.calc_normals_split()
+        fastnormals = np.zeros(loops*3, dtype=np.float32)
+        mesh.loops.foreach_get('normal', fastnormals)
+        fastnormals = np.reshape(fastnormals, (loops, 3))
+    else:
+        fastnormals = np.zeros(npolygons*3, dtype=np.float32)
+        mesh.polygons.foreach_get('normal', fastnormals)
+        fastnormals = np.reshape(fastnormals, (npolygons, 3))
+    if as_buffer:
+        return fastnormals
+    return fastnormals.tolist()
+
+def to_primvar_buffer(data, dtype=np.float32, ncomps=1):
+    '''
+    Make sure the input data is a C-contiguous array of the requested type,
+    suitable to be passed directly to the RixParamList Set*Detail functions.
+    No copy is made if the data already satisfies these requirements.
+
+    Arguments:
+    data (numpy.ndarray) - the input data
+    dtype (numpy.dtype) - the required data type
+    ncomps (int) - number of components per element (ex: 3 for points)
+
+    Returns:
+    (numpy.ndarray) - contiguous array
+    '''
+
+    buf = np.ascontiguousarray(data, dtype=dtype)
+    if ncomps > 1:
+        buf = np.reshape(buf, (-1, ncomps))
+    return buf
+
+__ATTRIBUTE_DATA_KEYS__ = {
+    'FLOAT': ('value', np.float32, 1),
+    'INT': ('value', np.int32, 1),
+    'INT8': ('value', np.int32, 1),
+    'BOOLEAN': ('value', np.bool_, 1),
+    'FLOAT2': ('vector', np.float32, 2),
+    'FLOAT_VECTOR': ('vector', np.float32, 3),
+    'FLOAT_COLOR': ('color', np.float32, 4),
+    'BYTE_COLOR': ('color', np.float32, 4)
+}
+
+def _hash_collection_(hasher, collection, attr, dtype, ncomps=1):
+    count = len(collection)
+    data = np.zeros(count*ncomps, dtype=dtype)
+    if count > 0:
+        collection.foreach_get(attr, data)
+    hasher.update(str(count).encode())
+    hasher.update(data)
+
+def get_mesh_fingerprint(mesh, signature='', reference_pose=None):
+    '''
+    Get a fingerprint of the geometry of the input mesh. Two meshes with the same
+    fingerprint will produce the same points, topology and geometry attributes.
+    The fingerprint is split in two, so that callers can tell when only the
+    points have moved.
+
+    Arguments:
+    mesh (bpy.types.Mesh) - Blender mesh
+    signature (str) - any additional settings that should be part of the fingerprint,
+                      ex: the modifier stack
+    reference_pose (bpy.types.CollectionProperty) - frozen reference pose of the mesh, if any
+
+    Returns:
+    (tuple) - the topology fingerprint (everything but the points), and the
+              points fingerprint
+    '''
+
+    points_hasher = hashlib.blake2b(digest_size=16)
+    _hash_collection_(points_hasher, mesh.vertices, 'co', np.float32, 3)
+
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(signature.encode())
+    _hash_collection_(hasher, mesh.polygons, 'loop_total', np.int32)
+    _hash_collection_(hasher, mesh.polygons, 'material_index', np.int32)
+    _hash_collection_(hasher, mesh.polygons, 'use_smooth', np.bool_)
+    _hash_collection_(hasher, mesh.loops, 'vertex_index', np.int32)
+    if len(mesh.edges) > 0 and hasattr(mesh.edges[0], 'crease'):
+        _hash_collection_(hasher, mesh.edges, 'crease', np.float32)
+    hasher.update(str(getattr(mesh, 'use_auto_smooth', False)).encode())
+
+    for uv_layer in mesh.uv_layers:
+        hasher.update(uv_layer.name.encode())
+        _hash_collection_(hasher, uv_layer.data, 'uv', np.float32, 2)
+
+    for vcol_layer in getattr(mesh, 'vertex_colors', []):
+        hasher.update(vcol_layer.name.encode())
+        _hash_collection_(hasher, vcol_layer.data, 'color', np.float32, 4)
+
+    for attr in mesh.attributes:
+        if attr.name == 'position':
+            continue
+        data_key = __ATTRIBUTE_DATA_KEYS__.get(attr.data_type, None)
+        if data_key is None:
+            continue
+        hasher.update(('%s:%s:%s' % (attr.name, attr.domain, attr.data_type)).encode())
+        _hash_collection_(hasher, attr.data, data_key[0], data_key[1], data_key[2])
+
+    if reference_pose is not None:
+        for attr in ['has_Pref', 'has_WPref', 'has_Nref', 'has_WNref']:
+            _hash_collection_(hasher, reference_pose, attr, np.bool_)
+        for attr in ['rman__Pref', 'rman__WPref', 'rman__Nref', 'rman__WNref']:
+            _hash_collection_(hasher, reference_pose, attr, np.float32, 3)
+
+    return (hasher.digest(), points_hasher.digest())
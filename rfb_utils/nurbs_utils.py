@@ -0,0 +1,77 @@
+from functools import lru_cache
+import numpy as np
+
+'''
+Vectorized versions of the NURBS knot code in rman_nurbs_translator.
+Code reference from: https://blender.stackexchange.com/questions/34145/calculate-points-on-a-nurbs-curve-without-converting-to-mesh
+'''
+
+def get_spline_points(spline):
+    '''
+    Get the homogeneous control points of a spline.
+
+    Arguments:
+    spline (bpy.types.Spline) - the NURBS spline
+
+    Returns:
+    (numpy.ndarray) - (npoints, 4) float32 array
+    '''
+
+    npoints = len(spline.points)
+    Pw = np.zeros(npoints*4, dtype=np.float32)
+    spline.points.foreach_get('co', Pw)
+    return np.reshape(Pw, (npoints, 4))
+
+def _calc_knots_(pnts, order, flag, size):
+    knots = np.zeros(size, dtype=np.float64)
+    pnts_order = pnts + order
+    a = np.arange(pnts_order)
+    if flag == 1:
+        knots[:pnts_order] = np.clip(a + 1 - order, 0, pnts - order + 1)
+    elif flag == 2:
+        if order == 4:
+            knots[:pnts_order] = np.floor(0.34 + a * (1.0 / 3.0))
+        elif order == 3:
+            inner = a[order:pnts+1]
+            knots[inner] = np.floor(0.6 + 0.5 * (inner - order + 1))
+    else:
+        knots[:pnts_order] = a
+    return knots
+
+def _make_cyclic_knots_(knots, pnts, order):
+    order2 = order - 1
+    b = order
+    c = pnts + order + order2
+    for a in range(pnts + order2, c):
+        knots[a] = knots[a - 1] + (knots[b] - knots[b - 1])
+        b -= 1
+
+@lru_cache(maxsize=256)
+def _get_knots_(pnts, order, use_cyclic, use_endpoint, use_bezier):
+    size = 4 + order + pnts + (order - 1 if use_cyclic else 0)
+    if use_cyclic:
+        knots = _calc_knots_(pnts, order, 0, size)
+        _make_cyclic_knots_(knots, pnts, order)
+    else:
+        flag = use_endpoint + (use_bezier << 1)
+        knots = _calc_knots_(pnts, order, flag, size)
+    knots.setflags(write=False)
+    return knots
+
+def get_knots(pnts, order, use_cyclic=False, use_endpoint=False, use_bezier=False):
+    '''
+    Get the knot vector for a spline. Knot vectors only depend on these
+    settings, so they are cached, and only recomputed when a spline changes.
+
+    Arguments:
+    pnts (int) - number of control points
+    order (int) - order of the spline
+    use_cyclic (bool) - whether the spline is cyclic
+    use_endpoint (bool) - whether the spline touches its end points
+    use_bezier (bool) - whether the spline acts like a bezier
+
+    Returns:
+    (numpy.ndarray) - read only knot vector
+    '''
+
+    return _get_knots_(int(pnts), int(order), bool(use_cyclic), bool(use_endpoint), bool(use_bezier))
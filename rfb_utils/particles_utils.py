@@ -1,74 +1,168 @@
-from mathutils import Vector
+import numpy as np
 
-def valid_particle(pa, valid_frames):
-    return pa.die_time >= valid_frames[-1] and pa.birth_time <= valid_frames[0]
+__PARTICLE_ATTRIBUTES__ = {
+    'location': 3,
+    'velocity': 3,
+    'angular_velocity': 3,
+    'size': 1,
+    'birth_time': 1,
+    'die_time': 1,
+    'lifetime': 1
+}
 
-def get_particles(ob, psys, inv_mtx, frame, valid_frames=None, get_next_P=False, get_width=True):
-    P = []
-    next_P = []
-    width = []
+class ParticleData(object):
+    '''
+    Reads the particles of a particle system in bulk, using foreach_get. Each
+    attribute is only read once, on first use, and is filtered with the same
+    validity mask.
+
+    Attributes:
+        psys (bpy.types.ParticleSystem) - the particle system
+        count (int) - total number of particles in the system
+        mask (numpy.ndarray) - boolean array of the particles that are valid for valid_frames
+        ids (numpy.ndarray) - indices of the valid particles
+    '''
+
+    def __init__(self, psys, valid_frames):
+        self.psys = psys
+        self.count = len(psys.particles)
+        self._attributes = dict()
+
+        birth_time = self._read('birth_time')
+        die_time = self._read('die_time')
+        self.mask = (die_time >= valid_frames[-1]) & (birth_time <= valid_frames[0])
+        self.ids = np.flatnonzero(self.mask)
+        self._attributes['birth_time'] = birth_time[self.mask]
+        self._attributes['die_time'] = die_time[self.mask]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _read(self, attr):
+        ncomps = __PARTICLE_ATTRIBUTES__[attr]
+        data = np.zeros(self.count * ncomps, dtype=np.float32)
+        if self.count > 0:
+            self.psys.particles.foreach_get(attr, data)
+        if ncomps > 1:
+            data = np.reshape(data, (self.count, ncomps))
+        return data
+
+    def _read_alive(self):
+        particles = self.psys.particles
+        if self.count < 1:
+            return np.zeros(0, dtype=bool)
+        alive = particles[0].bl_rna.properties['alive_state'].enum_items['ALIVE'].value
+        data = np.zeros(self.count, dtype=np.int32)
+        try:
+            particles.foreach_get('alive_state', data)
+        except (TypeError, RuntimeError):
+            # enums can't be read in bulk in this version of Blender
+            return np.array([pa.alive_state == 'ALIVE' for pa in particles], dtype=bool)
+        return data == alive
+
+    def get(self, attr):
+        '''
+        Get an attribute for the valid particles.
+
+        Args:
+            attr (str) - the particle attribute, ex: 'location'. 'alive'
+                         returns a boolean array of the particles that are alive.
+
+        Returns:
+            (numpy.ndarray) - the attribute values
+        '''
+        data = self._attributes.get(attr, None)
+        if data is None:
+            if attr == 'alive':
+                data = self._read_alive()[self.mask]
+            else:
+                data = self._read(attr)[self.mask]
+            self._attributes[attr] = data
+        return data
+
+def _to_output(data, as_buffer):
+    if as_buffer:
+        return np.ascontiguousarray(data, dtype=np.float32)
+    return data.tolist()
 
+def _transform_points(mtx, points):
+    mtx = np.array(mtx, dtype=np.float32)
+    return points @ mtx[:3, :3].T + mtx[:3, 3]
+
+def get_particles(ob, psys, inv_mtx, frame, valid_frames=None, get_next_P=False, get_width=True, particle_data=None, as_buffer=False):
+    '''
+    Get the points, and optionally the points for the next frame and the widths,
+    of the valid particles of a particle system.
+
+    Args:
+        ob (bpy.types.Object) - the emitter object
+        psys (bpy.types.ParticleSystem) - the particle system
+        inv_mtx (mathutils.Matrix) - the inverse world matrix of ob
+        frame (float) - the current frame
+        valid_frames (tuple) - the first and last frame a particle has to be alive for
+        get_next_P (bool) - whether to compute the points for the next frame, using velocity
+        get_width (bool) - whether to get the widths
+        particle_data (ParticleData) - already read particles to use
+        as_buffer (bool) - return contiguous float32 arrays instead of lists
+
+    Returns:
+        (tuple) - P, next_P, width
+    '''
     valid_frames = (frame,
                     frame) if valid_frames is None else valid_frames
-    
-    for pa in [p for p in psys.particles if valid_particle(p, valid_frames)]:
-        pt = inv_mtx @ pa.location
-        P.append(pt)
-        
-        if get_next_P:
-            # calculate the point for the next frame using velocity
-            vel = Vector(pa.velocity / pa.lifetime )
-            next_P.append( inv_mtx @ (Vector(pa.location) + vel))
-
-        if get_width:
-            if pa.alive_state != 'ALIVE':
-                width.append(0.0)
-            else:
-                width.append(pa.size)
-    return (P, next_P, width)    
+    if particle_data is None:
+        particle_data = ParticleData(psys, valid_frames)
+
+    next_P = []
+    width = []
 
-def get_primvars_particle(primvar, frame, psys, subframes, sample):
+    location = particle_data.get('location')
+    P = _to_output(_transform_points(inv_mtx, location), as_buffer)
+
+    if get_next_P:
+        # calculate the point for the next frame using velocity
+        lifetime = particle_data.get('lifetime')
+        vel = particle_data.get('velocity') / lifetime[:, None]
+        next_P = _to_output(_transform_points(inv_mtx, location + vel), as_buffer)
+
+    if get_width:
+        width = np.where(particle_data.get('alive'), particle_data.get('size'), 0.0)
+        width = _to_output(width, as_buffer)
+
+    return (P, next_P, width)
+
+def get_primvars_particle(primvar, frame, psys, subframes, sample, particle_data=None, as_buffer=False):
     rm = psys.settings.renderman
+    if not rm.prim_vars:
+        return
+
+    if particle_data is None:
+        particle_data = ParticleData(psys, subframes)
 
     for p in rm.prim_vars:
         pvars = []
 
         if p.data_source in ('VELOCITY', 'ANGULAR_VELOCITY'):
             if p.data_source == 'VELOCITY':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.velocity)
+                pvars = particle_data.get('velocity')
             elif p.data_source == 'ANGULAR_VELOCITY':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.angular_velocity)
+                pvars = particle_data.get('angular_velocity')
 
-            primvar.SetVectorDetail(p.name, pvars, "vertex", sample)
+            primvar.SetVectorDetail(p.name, _to_output(pvars, as_buffer), "vertex", sample)
 
         elif p.data_source in \
                 ('SIZE', 'AGE', 'BIRTH_TIME', 'DIE_TIME', 'LIFE_TIME', 'ID'):
             if p.data_source == 'SIZE':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.size)
+                pvars = particle_data.get('size')
             elif p.data_source == 'AGE':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append((frame - pa.birth_time) / pa.lifetime)
+                pvars = (frame - particle_data.get('birth_time')) / particle_data.get('lifetime')
             elif p.data_source == 'BIRTH_TIME':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.birth_time)
+                pvars = particle_data.get('birth_time')
             elif p.data_source == 'DIE_TIME':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.die_time)
+                pvars = particle_data.get('die_time')
             elif p.data_source == 'LIFE_TIME':
-                for pa in \
-                        [p for p in psys.particles if valid_particle(p, subframes)]:
-                    pvars.append(pa.lifetime)
+                pvars = particle_data.get('lifetime')
             elif p.data_source == 'ID':
-                pvars = [id for id, p in psys.particles.items(
-                ) if valid_particle(p, subframes)]
-            
-            primvar.SetFloatDetail(p.name, pvars, "vertex", sample)  
\ No newline at end of file
+                pvars = particle_data.ids
+
+            primvar.SetFloatDetail(p.name, _to_output(pvars, as_buffer), "vertex", sample)
@@ -45,6 +45,9 @@ __LOBES_ENABLE_PARAMS__ = [
     'enableGlow',
 ]
 
+# bl_idname -> list of BlPropExportPlan, see build_export_plan
+__RMAN_EXPORT_PLANS__ = dict()
+
 class BlPropInfo:
 
     def __init__(self, node, prop_name, prop_meta):
@@ -119,6 +122,97 @@ class BlPropInfo:
 
         return True
 
+class BlPropExportPlan:
+    '''
+    The parts of BlPropInfo that only depend on a property's metadata, and
+    not on the node, so that they can be worked out once per node type
+    instead of every time a node is exported. See get_export_plan.
+
+    Attributes:
+        prop_name (str) - name of the Blender property
+        prop_meta (dict) - the property's metadata
+        renderman_name (str) - name of the RenderMan parameter
+        renderman_type (str) - type of the RenderMan parameter
+        renderman_array_type (str) - element type, if this is an array
+        widget (str) - the widget used to draw this property
+        vstructmember (str) - vstruct member this property is a part of, if any
+        is_array (bool) - whether this is a fixed size array
+        array_len (int) - length of the array, or -1
+        linked_only (bool) - only export the property when it's connected
+        is_texture (bool) - whether this property is a texture path
+        options (str) - the options field of the metadata
+        gain_enable (str) - the PxrSurface lobe enable parameter for this gain, if any
+    '''
+
+    def __init__(self, prop_name, prop_meta):
+
+        from . import shadergraph_utils
+
+        self.prop_name = prop_name
+        self.prop_meta = prop_meta
+        self.renderman_name = prop_meta.get('renderman_name', prop_name)
+        self.renderman_type = prop_meta.get('renderman_type', '')
+        self.renderman_array_type = prop_meta.get('renderman_array_type', '')
+        self.widget = prop_meta.get('widget', 'default')
+        self.vstructmember = prop_meta.get('vstructmember', None)
+        arraySize = prop_meta.get('arraySize', None)
+        self.is_array = bool(arraySize)
+        self.array_len = int(arraySize) if arraySize else -1
+        self.linked_only = self.renderman_type in ['struct', 'enum']
+        self.is_texture = shadergraph_utils.is_texture_property(prop_name, prop_meta)
+        self.options = prop_meta.get('options', '')
+        self.gain_enable = __GAINS_TO_ENABLE__.get(prop_name, None)
+
+    @staticmethod
+    def is_exportable(prop_name, prop_meta):
+        # the checks from BlPropInfo.is_exportable that don't depend on
+        # the node
+        if prop_meta.get('widget', 'default') == 'null' and not prop_meta.get('vstructmember', None):
+            return False
+        if prop_meta.get('hideInput', False):
+            return False
+        if prop_meta.get('renderman_type', '') == 'page':
+            return False
+        if prop_name == 'inputMaterial' or \
+            (prop_meta.get('vstruct', False) is True) or (prop_meta.get('type', '') == 'vstruct'):
+            return False
+
+        return True
+
+def build_export_plan(bl_idname, prop_meta):
+    '''
+    Build the export plan for a node type. This is called when the node
+    type is registered.
+
+    Arguments:
+        bl_idname (str) - the bl_idname of the node type
+        prop_meta (dict) - the prop_meta of the node type
+
+    Returns:
+        (list) - a BlPropExportPlan for each property that can be exported
+    '''
+    plan = [BlPropExportPlan(prop_name, meta) for prop_name, meta in prop_meta.items()
+            if BlPropExportPlan.is_exportable(prop_name, meta)]
+    __RMAN_EXPORT_PLANS__[bl_idname] = plan
+    return plan
+
+def get_export_plan(node):
+    '''
+    Get the export plan for node. Classes that didn't get one when they
+    were registered get theirs built here, the first time they are exported.
+
+    Arguments:
+        node (bpy.types.Node) - the node, or property group
+
+    Returns:
+        (list) - a BlPropExportPlan for each property that can be exported
+    '''
+    bl_idname = getattr(node, 'bl_idname', '') or node.__class__.__name__
+    plan = __RMAN_EXPORT_PLANS__.get(bl_idname, None)
+    if plan is None:
+        plan = build_export_plan(bl_idname, node.prop_meta)
+    return plan
+
 
 def get_property_default(node, prop_name):
     bl_prop_name = __RESERVED_BLENDER_NAMES__.get(prop_name, prop_name)
@@ -742,30 +836,35 @@ def set_node_rixparams(node, rman_sg_node, params, ob=None, mat_name=None, group
         return params
 
     is_frame_sensitive = False
-    for prop_name, meta in node.prop_meta.items():
-        bl_prop_info = BlPropInfo(node, prop_name, meta)
-        param_widget = bl_prop_info.widget 
-        param_type = bl_prop_info.renderman_type 
-        param_name = bl_prop_info.renderman_name      
-        is_linked = bl_prop_info.is_linked
-        to_socket = bl_prop_info.socket
-        from_socket = bl_prop_info.from_socket
-        from_node = bl_prop_info.from_node
-        prop = bl_prop_info.prop
-
-        if not bl_prop_info.do_export:
+    inputs = getattr(node, 'inputs', dict())
+    for plan in get_export_plan(node):
+        prop_name = plan.prop_name
+        param_widget = plan.widget
+        param_type = plan.renderman_type
+        param_name = plan.renderman_name
+        is_linked = False
+        to_socket = inputs.get(prop_name, None)
+        from_socket = None
+        from_node = None
+        if to_socket is not None and to_socket.is_linked:
+            is_linked = True
+            link = to_socket.links[0]
+            from_socket = link.from_socket
+            from_node = link.from_node
+
+        if plan.linked_only and not is_linked:
             continue
-                
+
         if param_widget == 'displaymetadata':
             set_dspymeta_params(node, prop_name, params)
             continue
         # array
         elif param_type == 'array':
-            set_array_rixparams(node, rman_sg_node, mat_name, bl_prop_info, prop_name, prop, params)
+            set_array_rixparams(node, rman_sg_node, mat_name, plan, prop_name, getattr(node, prop_name, None), params)
             continue
         # ramps
         elif param_type in ['colorramp', 'floatramp']:
-            set_ramp_rixparams(node, prop_name, prop, param_type, params)        
+            set_ramp_rixparams(node, prop_name, getattr(node, prop_name, None), param_type, params)
             continue
        
         if is_linked:
@@ -794,8 +893,8 @@ def set_node_rixparams(node, rman_sg_node, params, ob=None, mat_name=None, group
                     rfb_log().debug("Could not find connection for: %s.%s" % (node.name, param_name))                  
 
         # see if vstruct linked
-        elif bl_prop_info.is_vstruct_and_linked:
-            vstruct_name, vstruct_member = bl_prop_info.vstructmember.split('.')
+        elif plan.vstructmember and is_vstruct_and_linked(node, prop_name):
+            vstruct_name, vstruct_member = plan.vstructmember.split('.')
             from_socket = node.inputs[
                 vstruct_name].links[0].from_socket
 
@@ -842,20 +941,21 @@ def set_node_rixparams(node, rman_sg_node, params, ob=None, mat_name=None, group
 
             # if this is a gain on PxrSurface and the lobe isn't
             # enabled                    
-            if node.bl_idname == 'PxrSurfaceBxdfNode' and \
-                    prop_name in __GAINS_TO_ENABLE__ and \
-                    not getattr(node, __GAINS_TO_ENABLE__[prop_name]):
+            if plan.gain_enable and \
+                    node.bl_idname == 'PxrSurfaceBxdfNode' and \
+                    not getattr(node, plan.gain_enable):
                 val = [0, 0, 0] if param_type == 'color' else 0
 
             elif param_type == 'string':
                 from . import texture_utils
 
+                prop = getattr(node, prop_name, None)
                 if not is_frame_sensitive:
                     is_frame_sensitive = string_utils.check_frame_sensitive(prop)
 
                 val = string_utils.expand_string(prop)
-                options = meta['options']
-                if bl_prop_info.is_texture:
+                options = plan.options
+                if plan.is_texture:
                     tx_val = texture_utils.get_txmanager().get_output_tex_from_path(node, param_name, val, ob=ob)
                     val = tx_val if tx_val != '' else val
                 elif param_widget == 'assetidoutput':
@@ -864,14 +964,9 @@ def set_node_rixparams(node, rman_sg_node, params, ob=None, mat_name=None, group
                         display = 'texture'
                     val = string_utils.expand_string(prop, display=display, asFilePath=True)
             else:
-                val = string_utils.convert_val(prop, type_hint=param_type)
-            is_array = False 
-            array_len = -1
-            if bl_prop_info.arraySize:
-                is_array = True
-                array_len = int(bl_prop_info.arraySize)
-
-            set_rix_param(params, param_type, param_name, val, is_reference=False, is_array=is_array, array_len=array_len, node=node)
+                val = string_utils.convert_val(getattr(node, prop_name, None), type_hint=param_type)
+
+            set_rix_param(params, param_type, param_name, val, is_reference=False, is_array=plan.is_array, array_len=plan.array_len, node=node)
 
     if rman_sg_node:
         rman_sg_node.is_frame_sensitive = (rman_sg_node.is_frame_sensitive or is_frame_sensitive)
@@ -1130,3 +1130,107 @@ def convert_grease_pencil_mat(mat, nt, output):
             bxdf.emitColor = col
             bxdf.presence = alpha
             nt.links.new(bxdf.outputs[0], output.inputs[0])    
+
+def _get_node_base_props():
+    # properties every node has, that don't change how it's translated
+    global __NODE_BASE_PROPS__
+    if __NODE_BASE_PROPS__ is None:
+        __NODE_BASE_PROPS__ = set(p.identifier for p in bpy.types.Node.bl_rna.properties)
+        __NODE_BASE_PROPS__.discard('name')
+        __NODE_BASE_PROPS__.discard('mute')
+    return __NODE_BASE_PROPS__
+
+__NODE_BASE_PROPS__ = None
+
+def _get_rna_fingerprint(struct, trees, depth=3):
+    base_props = _get_node_base_props()
+    values = []
+    for prop in struct.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier in base_props or identifier.endswith('_uio'):
+            continue
+        val = getattr(struct, identifier, None)
+        if identifier == 'rman_fake_node_group':
+            # every node with ramps gets its own ramp node group, so its
+            # name doesn't tell us anything
+            val = ''
+        elif prop.type == 'POINTER':
+            if isinstance(val, bpy.types.NodeTree):
+                # node groups, and the node groups holding our ramps
+                trees.append(val)
+                val = '' if identifier == 'rman_fake_node_group_ptr' else val.name_full
+            elif isinstance(val, bpy.types.ID):
+                val = val.name_full
+            elif val is not None:
+                if depth < 1:
+                    continue
+                val = _get_rna_fingerprint(val, trees, depth-1)
+        elif prop.type == 'COLLECTION':
+            if depth < 1:
+                continue
+            val = tuple(_get_rna_fingerprint(item, trees, depth-1) for item in val)
+        elif prop.type == 'ENUM' and prop.is_enum_flag:
+            val = tuple(sorted(val))
+        elif getattr(prop, 'array_length', 0) > 0:
+            if prop.array_dimensions[1] > 0:
+                val = tuple(tuple(v) for v in val)
+            else:
+                val = tuple(val)
+        values.append((identifier, val))
+    return tuple(values)
+
+def _get_node_fingerprint(node, trees):
+    values = [node.bl_idname, _get_rna_fingerprint(node, trees)]
+
+    # expanded strings can change with the frame number
+    prop_meta = getattr(node, 'prop_meta', dict())
+    for prop_name, meta in prop_meta.items():
+        if meta.get('renderman_type', '') != 'string':
+            continue
+        val = string_utils.expand_string(getattr(node, prop_name, ''))
+        values.append((prop_name, val))
+
+    for socket in node.inputs:
+        val = getattr(socket, 'default_value', None)
+        if val is not None and not isinstance(val, (str, int, float, bool, bpy.types.ID)):
+            val = tuple(val)
+        elif isinstance(val, bpy.types.ID):
+            val = val.name_full
+        links = tuple((link.from_node.name, link.from_socket.identifier) for link in socket.links)
+        values.append((socket.identifier, val, links))
+
+    return tuple(values)
+
+def get_material_fingerprint(mat):
+    '''
+    Get a fingerprint of everything that goes into translating a material:
+    the type, properties and links of every node in its node tree and any node
+    groups it uses, and its expanded string parameters. Two fingerprints compare
+    equal if the materials would be translated to the same shading network,
+    apart from their names and the state of their textures in the texture
+    manager (see texture_utils.get_output_textures).
+
+    Arguments:
+        mat (bpy.types.Material) - the material
+
+    Returns:
+        (tuple) - the fingerprint, or None if mat has no node tree
+    '''
+    if not mat.node_tree:
+        return None
+
+    values = [(tuple(mat.diffuse_color), mat.metallic, mat.roughness),
+              _get_rna_fingerprint(mat.renderman, list())]
+    trees = [mat.node_tree]
+    seen = set()
+    while trees:
+        nt = trees.pop(0)
+        if nt.as_pointer() in seen:
+            continue
+        seen.add(nt.as_pointer())
+        nodes = list()
+        for node in nt.nodes:
+            nodes.append((node.name, _get_node_fingerprint(node, trees)))
+        values.append(tuple(nodes))
+
+    return tuple(values)
@@ -4,7 +4,9 @@ import time
 import os
 import datetime
 import sys
+import itertools
 from collections import OrderedDict
+from functools import lru_cache
 from ..rfb_logger import rfb_log
 from ..rfb_utils import filepath_utils
 from .prefs_utils import get_pref
@@ -50,6 +52,119 @@ PARSING_EXPR = re.compile(r'<([\w\:]*[\w\.]+)(\?[\w\d\._-]+)*'  # token
                           r'(:[^>]+)*>|'                        # formatter
                           r'\$\{?([A-Z0-9_]{3,})\}?')           # env var
 
+# matches ':' that are not part of a drive letter
+DRIVE_EXPR = re.compile(r'((?<!^[A-Z])(?<!^[ ][A-Z]))\:')
+
+# segment types of a compiled expression
+SEG_TOKEN = 0
+SEG_ENV = 1
+
+# number of expanded strings kept by each StringExpression
+EXPAND_CACHE_SIZE = 4096
+
+# directories we've already created, or found to exist
+__CREATED_DIRS__ = set()
+
+# every TokenDict change gets a new generation number
+__TOKEN_GENERATION__ = itertools.count(1)
+
+
+def make_dirs(dirname):
+    """Create dirname, if it doesn't already exist. Directories are only
+    checked once, so this can be called for every expanded file path.
+
+    Args:
+    - dirname (str): the directory to create
+
+    Returns:
+    - True if the directory exists
+    """
+    if not dirname or dirname in __CREATED_DIRS__:
+        return True
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname, exist_ok=True)
+        except PermissionError as e:
+            rfb_log().error("Cannot create path: %s (%s)" % (dirname, str(e)))
+            return False
+        except OSError as e:
+            rfb_log().error("Cannot create path: %s (%s)" % (dirname, str(e)))
+            return False
+    __CREATED_DIRS__.add(dirname)
+    return True
+
+
+@lru_cache(maxsize=4096)
+def compile_expr(expr):
+    """Parse an expression into a tuple of segments. Each segment is either a
+    literal string, a (SEG_TOKEN, token, formatter) or a (SEG_ENV, env var,
+    original text) tuple.
+
+    Args:
+    - expr (str): the expression
+
+    Returns:
+    - the segments, and whether the expression uses environment variables
+    """
+    segments = []
+    has_env = False
+    pos = 0
+    for m in re.finditer(PARSING_EXPR, expr):
+        if m.start() > pos:
+            segments.append(expr[pos:m.start()])
+        if m.group(1):
+            fmt = m.group(3)[1:] if m.group(3) else None
+            segments.append((SEG_TOKEN, m.group(1), fmt))
+        else:
+            has_env = True
+            segments.append((SEG_ENV, m.group(4), m.group(0)))
+        pos = m.end()
+    if pos < len(expr):
+        segments.append(expr[pos:])
+    return (tuple(segments), has_env)
+
+
+class TokenDict(dict):
+    """A dict of tokens, that gets a new generation number every time one of
+    its values changes. This is used to know when expanded strings need to
+    be expanded again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation = next(__TOKEN_GENERATION__)
+
+    def __setitem__(self, key, value):
+        if key in self and dict.__getitem__(self, key) == value:
+            return
+        super().__setitem__(key, value)
+        self.generation = next(__TOKEN_GENERATION__)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.generation = next(__TOKEN_GENERATION__)
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        self.generation = next(__TOKEN_GENERATION__)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        self.generation = next(__TOKEN_GENERATION__)
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self.generation = next(__TOKEN_GENERATION__)
+
 
 class StringExpression(object):
 
@@ -58,7 +173,9 @@ class StringExpression(object):
         self.bl_scene = bpy.context.scene
         if bl_scene:
             self.bl_scene = bl_scene
-        self.tokens = {}
+        self.tokens = TokenDict()
+        self._expand_cache = dict()
+        self._expand_cache_generation = None
         self.update_temp_token()
         self.update_out_token()
         #self.update_blend_tokens()  
@@ -103,9 +220,10 @@ class StringExpression(object):
             if not os.path.isabs(root_path):
                 rfb_log().debug("Root path: %s is not absolute. Using default." % root_path)            
                 root_path = dflt_path
-            elif not os.path.exists(root_path):
+            elif root_path not in __CREATED_DIRS__ and not os.path.exists(root_path):
                 try:
                     os.makedirs(root_path, exist_ok=True)
+                    __CREATED_DIRS__.add(root_path)
                 except PermissionError:
                     rfb_log().debug("Cannot create root path: %s. Using default." % root_path)            
                     root_path = dflt_path
@@ -180,76 +298,80 @@ class StringExpression(object):
         if '<' not in expr and '$' not in expr:
             return expr
 
-        toks = dict(self.tokens)
-        toks.update(objTokens)
-        # print toks
-        pos = 0
-        result = ''
-        for m in re.finditer(PARSING_EXPR, expr):
-            # print 'GROUPS: %s' % str(m.groups())
-            if m.group(1):
-                # Token case
-                tok = m.group(1)
-                tok_val = None
-                # print '  |__ TOKEN: %02d-%02d: %s' % (m.start(), m.end(), tok)
-                try:
-                    tok_val = toks[tok]
-                    # result += expr[pos:m.start()] + toks[tok]
-                except KeyError:
-                    try:
-                        # forced lower-case version if first attempts failed.
-                        tok_val = toks[tok.lower()]
-                    except KeyError:
-                        # the token REALLY doesn't exist...
-                        tok_val = '<%s>' % tok
+        segments, has_env = compile_expr(expr)
 
-                # optional formating
-                if m.group(3):
-                    if isinstance(tok_val, str) and tok_val:
-                        try:
-                            tok_val = eval(tok_val)
-                        except (NameError, SyntaxError, TypeError) as err:
-                            rfb_log().debug('Eval failed: %s  -> %r', err, tok_val)
-                            result += expr[pos:m.start()] +  tok_val
-                        else:
-                            result += expr[pos:m.start()] +  m.group(3)[1:] % tok_val
-                    else:
-                        result += expr[pos:m.start()] +  m.group(3)[1:] % tok_val
-                else:
-                    result += '%s%s' % (expr[pos:m.start()], tok_val)
-            else:
-                # Environment variable case
-                tok = m.group(4)
-                # print '  |__ ENV VAR: %02d-%02d: %s' % (m.start(), m.end(), tok)
-                try:
-                    result += expr[pos: m.start()] + os.environ[tok]
-                except KeyError:
-                    result += expr[pos: m.start()] + m.group(0)
+        # results only depend on the tokens, unless objTokens are given or
+        # environment variables are used
+        use_cache = not objTokens and not has_env
+        if use_cache:
+            if self._expand_cache_generation != self.tokens.generation:
+                self._expand_cache.clear()
+                self._expand_cache_generation = self.tokens.generation
+            result = self._expand_cache.get((expr, asFilePath), None)
+            if result is not None:
+                return result
 
-            pos = m.end()
-        # append the end of the string. If no match (despite the presence of
-        # a < or $), sets result to the original expression.
-        result += expr[pos:]
+        result = self._expand_segments(segments, objTokens)
 
-        
         if asFilePath:
             # If this is meant to be a file path, substitute : with _
             # Can not have ':' after the drive descriptor on windows. Allow
             # for a leading space before the drive letter
-            result = re.sub(r'((?<!^[A-Z])(?<!^[ ][A-Z]))\:', '_', result)
+            result = DRIVE_EXPR.sub('_', result)
           
             # get the real path
             result = filepath_utils.get_real_path(result)
 
-            dirname = os.path.dirname(result)
-            if not os.path.exists(dirname):
-                try:
-                    os.makedirs(dirname, exist_ok=True)
-                except PermissionError:
-                    rfb_log().error("Cannot create path: %s" % dirname)
+            make_dirs(os.path.dirname(result))
+
+        if use_cache:
+            if len(self._expand_cache) >= EXPAND_CACHE_SIZE:
+                self._expand_cache.clear()
+            self._expand_cache[(expr, asFilePath)] = result
     
         return result
 
+    def _get_token(self, tok, objTokens):
+        for toks in (objTokens, self.tokens):
+            if tok in toks:
+                return toks[tok]
+        # forced lower-case version if first attempts failed.
+        tok_lower = tok.lower()
+        for toks in (objTokens, self.tokens):
+            if tok_lower in toks:
+                return toks[tok_lower]
+        # the token REALLY doesn't exist...
+        return '<%s>' % tok
+
+    def _expand_segments(self, segments, objTokens):
+        result = []
+        for seg in segments:
+            if isinstance(seg, str):
+                result.append(seg)
+            elif seg[0] == SEG_TOKEN:
+                # Token case
+                tok_val = self._get_token(seg[1], objTokens)
+
+                # optional formating
+                fmt = seg[2]
+                if fmt:
+                    if isinstance(tok_val, str) and tok_val:
+                        try:
+                            tok_val = eval(tok_val)
+                        except (NameError, SyntaxError, TypeError) as err:
+                            rfb_log().debug('Eval failed: %s  -> %r', err, tok_val)
+                            result.append(tok_val)
+                        else:
+                            result.append(fmt % tok_val)
+                    else:
+                        result.append(fmt % tok_val)
+                else:
+                    result.append('%s' % tok_val)
+            else:
+                # Environment variable case
+                result.append(os.environ.get(seg[1], seg[2]))
+
+        return ''.join(result)
 
 def fixup_file_name(inputNm):
     result = inputNm
@@ -1,6 +1,5 @@
-from .string_expr import StringExpression
+from .string_expr import StringExpression, make_dirs
 from . import filepath_utils
-from ..rfb_logger import rfb_log
 from bpy.app.handlers import persistent
 import bpy
 import os
@@ -129,14 +128,7 @@ def expand_string(string, display=None, glob_sequence=False, frame=None, token_d
         # get the real path
         if string and asFilePath and os.path.isabs(string):
             string = filepath_utils.get_real_path(string)
-            dirname = os.path.dirname(string)
-            if not os.path.exists(dirname):
-                try:
-                    os.makedirs(dirname, exist_ok=True)
-                except PermissionError as e:
-                    rfb_log().error("Cannot create path: %s (%s)" % (dirname, str(e)))
-                except OSError as e:
-                    rfb_log().error("Cannot create path: %s (%s)" % (dirname, str(e)))                                     
+            make_dirs(os.path.dirname(string))
         return string
 
     if __SCENE_STRING_CONVERTER__ is None:
@@ -18,6 +18,8 @@ import os
 import bpy
 import uuid
 import re
+import functools
+from collections import OrderedDict
 
 __RFB_TXMANAGER__ = None
 
@@ -71,6 +73,8 @@ class RfBTxManager(object):
                                         get_nodeid_func=get_nodeid
                                         )
         self.rman_scene = None
+        self.batch_depth = 0
+        self.pending_textures = OrderedDict()
 
     @property
     def rman_scene(self):
@@ -114,6 +118,47 @@ class RfBTxManager(object):
             
         return tex_done    
 
+    def begin_batch(self):
+        '''
+        Start collecting newly added textures, rather than adding them to the
+        texture manager list and starting txmake for each one. See end_batch
+        and batch_textures.
+        '''
+        self.batch_depth += 1
+
+    def end_batch(self):
+        '''
+        Stop collecting textures. When the outermost batch ends, all of the
+        collected textures are added to the texture manager list in one go,
+        and txmake is started once.
+        '''
+        self.batch_depth = max(0, self.batch_depth - 1)
+        if self.batch_depth == 0:
+            self.flush_pending_textures()
+
+    def texture_added(self, nodeID):
+        '''
+        Called when a new texture has been added to the txmanager.
+        '''
+        self.pending_textures[nodeID] = True
+        if self.batch_depth == 0:
+            self.flush_pending_textures()
+
+    def flush_pending_textures(self):
+        if not self.pending_textures:
+            return
+        from ..rman_ui import rman_ui_txmanager
+
+        nodeIDs = list(self.pending_textures.keys())
+        self.pending_textures.clear()
+        rfb_log().debug("Registering %d new texture(s)" % len(nodeIDs))
+        try:
+            rman_ui_txmanager.add_textures_to_list(bpy.context.scene.rman_txmgr_list, nodeIDs)
+        except (AttributeError, RuntimeError) as e:
+            # we may not be allowed to edit the scene right now
+            rfb_log().debug("Could not update the texture manager list: %s" % str(e))
+        txmake_all(blocking=False)
+
     def get_output_tex(self, txfile):
         '''
         Get the real output texture path given a TxFile 
@@ -143,10 +188,7 @@ class RfBTxManager(object):
             node_type = node.bl_label            
             self.txmanager.add_texture(plug_uuid, file_path, nodetype=node_type, category=category)    
             txfile = self.txmanager.get_txfile_from_id(plug_uuid)            
-            bpy.ops.rman_txmgr_list.add_texture('EXEC_DEFAULT', filepath=file_path, nodeID=plug_uuid)
-            txmake_all(blocking=False)
-            if txfile:
-                self.done_callback(plug_uuid, txfile)                     
+            self.texture_added(plug_uuid)
         if txfile:
             return self.get_output_tex(txfile)
 
@@ -190,11 +232,7 @@ class RfBTxManager(object):
             txfile = self.txmanager.get_txfile_from_id(plug_uuid)         
             if txfile is None or txfile.input_image != file_path:
                 self.txmanager.add_texture(plug_uuid, file_path, nodetype=node_type, category=category)    
-                bpy.ops.rman_txmgr_list.add_texture('EXEC_DEFAULT', filepath=file_path, nodeID=plug_uuid)
-                txfile = self.txmanager.get_txfile_from_id(plug_uuid)
-                txmake_all(blocking=False)
-                if txfile:
-                    self.done_callback(plug_uuid, txfile)        
+                self.texture_added(plug_uuid)
 
     def is_file_src_tex(self, node, prop_name):
         id = scene_utils.find_node_owner(node)
@@ -207,13 +245,7 @@ class RfBTxManager(object):
             file_path = getattr(node, prop_name)        
             self.txmanager.add_texture(nodeID, file_path, nodetype=node_type, category=category)    
             txfile = self.txmanager.get_txfile_from_id(nodeID)
-            try:            
-                bpy.ops.rman_txmgr_list.add_texture('EXEC_DEFAULT', filepath=file_path, nodeID=nodeID)
-            except RuntimeError:
-                pass
-            txmake_all(blocking=False)
-            if txfile:
-                self.done_callback(nodeID, txfile)                     
+            self.texture_added(nodeID)
         
         if txfile:
             return (txfile.state == txmanager.STATE_IS_TEX)  
@@ -234,6 +266,22 @@ class RfBTxManager(object):
             return True
         return False
 
+def batch_textures(f):
+    '''
+    Decorator that collects the textures found while f runs, and registers
+    them with the texture manager all at once when it returns.
+    '''
+    @functools.wraps(f)
+    def batched(*args, **kw):
+        txmanager = get_txmanager()
+        txmanager.begin_batch()
+        try:
+            return f(*args, **kw)
+        finally:
+            txmanager.end_batch()
+
+    return batched
+
 def get_txmanager():
     global __RFB_TXMANAGER__
     if __RFB_TXMANAGER__ is None:
@@ -329,6 +377,28 @@ def get_textures(id, check_exists=False, mat=None):
     for node in nodes_list:
         update_texture(node, ob=ob, check_exists=check_exists, is_library=is_library)
 
+def get_output_textures(mat):
+    '''
+    Get the textures that will be used for the textured parameters of a
+    material. These change when txmake is done converting a texture.
+
+    Arguments:
+        mat (bpy.types.Material) - the material
+
+    Returns:
+        (tuple) - the output texture of each textured parameter, or '' if
+                  the texture manager doesn't know about it yet
+    '''
+    nodes_list = list()
+    shadergraph_utils.gather_all_textured_nodes(mat, nodes_list)
+    txmanager = get_txmanager()
+    textures = list()
+    for node in nodes_list:
+        for param_name in getattr(node, 'rman_textured_params', list()):
+            txfile = txmanager.get_txfile(node, param_name, ob=mat)
+            textures.append(txmanager.get_output_tex(txfile) if txfile else '')
+    return tuple(textures)
+
 def get_blender_image_path(bl_image):
     if bl_image.packed_file:
         bl_image.unpack()
@@ -2,6 +2,7 @@ from ..rfb_utils.rfb_node_desc_utils.rfb_node_desc import RfbNodeDesc
 from ..rfb_utils import filepath_utils
 from ..rfb_utils.filepath import FilePath
 from ..rfb_utils import generate_property_utils
+from ..rfb_utils import property_utils
 from ..rfb_utils.property_callbacks import *
 from ..rfb_utils.rman_socket_utils import node_add_inputs
 from ..rfb_utils.rman_socket_utils import node_add_outputs
@@ -283,6 +284,9 @@ def class_generate_properties(node, parent_name, node_desc):
     setattr(node, 'prop_meta', prop_meta)
     setattr(node, 'output_meta', output_meta)
 
+    # bl_idname defaults to the class name
+    property_utils.build_export_plan(node.__name__, prop_meta)
+
 def generate_node_type(node_desc, is_oso=False):
     ''' Dynamically generate a node type from pattern '''
 
@@ -49,6 +49,15 @@ def despgraph_post_handler(bl_scene, depsgraph):
     for update in depsgraph.updates:
         texture_utils.depsgraph_handler(update, depsgraph)
 
+@persistent
+def undo_redo_post(bl_scene):
+    # undo/redo invalidates all bpy.types.ID references. Drop any
+    # the IPR is holding on to, so they are looked up again.
+    from .. import rman_render
+    rr = rman_render.__RMAN_RENDER__
+    if rr and getattr(rr, 'rman_scene_sync', None):
+        rr.rman_scene_sync.clear_users_index()
+
 @persistent
 def render_pre(bl_scene):
     '''
@@ -135,6 +144,12 @@ def register():
     if frame_change_post not in bpy.app.handlers.frame_change_post:
         bpy.app.handlers.frame_change_post.append(frame_change_post)        
 
+    if undo_redo_post not in bpy.app.handlers.undo_post:
+        bpy.app.handlers.undo_post.append(undo_redo_post)
+
+    if undo_redo_post not in bpy.app.handlers.redo_post:
+        bpy.app.handlers.redo_post.append(undo_redo_post)
+
     if render_pre not in bpy.app.handlers.render_pre:
         bpy.app.handlers.render_pre.append(render_pre)
 
@@ -165,6 +180,12 @@ def unregister():
     if frame_change_post in bpy.app.handlers.frame_change_post:
         bpy.app.handlers.frame_change_post.remove(frame_change_post)
 
+    if undo_redo_post in bpy.app.handlers.undo_post:
+        bpy.app.handlers.undo_post.remove(undo_redo_post)
+
+    if undo_redo_post in bpy.app.handlers.redo_post:
+        bpy.app.handlers.redo_post.remove(undo_redo_post)
+
     if render_pre in bpy.app.handlers.render_pre:
         bpy.app.handlers.render_pre.remove(render_pre)
 
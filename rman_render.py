@@ -28,6 +28,7 @@ from .rfb_utils import string_utils
 from .rfb_utils import display_utils
 from .rfb_utils import scene_utils
 from .rfb_utils import transform_utils
+from .rfb_utils import framebuffer_utils
 from .rfb_utils.prefs_utils import get_pref
 from .rfb_utils.timer_utils import time_this
 
@@ -43,9 +44,15 @@ from .rman_handlers.rman_it_handlers import add_ipr_to_it_handlers, remove_ipr_t
 __RMAN_RENDER__ = None
 __RMAN_IT_PORT__ = -1
 __BLENDER_DSPY_PLUGIN__ = None
+__BLENDER_DSPY_DIRTY_REGIONS__ = False
 __DRAW_THREAD__ = None
 __RMAN_STATS_THREAD__ = None
 
+# code reference: https://asiffer.github.io/posts/numpy/
+__RMAN_NUMPY_POINTER__ = numpy.ctypeslib.ndpointer(dtype=numpy.float32, 
+                                                   ndim=1,
+                                                   flags="C")
+
 # map Blender display file format
 # to ice format
 __BLENDER_TO_ICE_DSPY__ = {
@@ -359,7 +366,8 @@ class BlRenderResultHelper:
                                         num_channels=rp.channels, 
                                         as_flat=False, 
                                         back_fill=False,
-                                        render=self.render)
+                                        render=self.render,
+                                        reuse=True)
             if buffer is None:
                 continue
             rp.rect = buffer
@@ -437,6 +445,11 @@ class RmanRender(object):
         self.viewport_res_y = -1
         self.viewport_buckets = list()
         self._draw_viewport_buckets = False
+        self.framebuffer_pool = framebuffer_utils.FramebufferPool()
+        self.viewport_framebuffer_key = None
+        self.viewport_framebuffer = None
+        self.viewport_framebuffer_view = None
+        self.viewport_texture = None
         self.stats_mgr = RfBStatsManager(self)
         self.deleting_bl_engine = threading.Lock()
         self.stop_render_mtx = threading.Lock()
@@ -1283,6 +1296,8 @@ class RmanRender(object):
         self.rman_scene.reset()
         self.viewport_buckets.clear()
         self._draw_viewport_buckets = False                
+        self.framebuffer_pool.clear()
+        self._clear_viewport_framebuffer()
         __update_areas__()
         self.stop_render_mtx.release()
         if is_main_thread:
@@ -1296,6 +1311,15 @@ class RmanRender(object):
             if sys.platform == ("win32"):
                     ext = '.dll'
             __BLENDER_DSPY_PLUGIN__ = ctypes.CDLL(os.path.join(envconfig().rmantree, 'lib', 'plugins', 'd_blender%s' % ext))
+            __BLENDER_DSPY_PLUGIN__.GetFloatFramebuffer.argtypes = [ctypes.c_size_t, ctypes.c_size_t, __RMAN_NUMPY_POINTER__]
+
+            # older versions of the display driver don't track dirty regions
+            global __BLENDER_DSPY_DIRTY_REGIONS__
+            if hasattr(__BLENDER_DSPY_PLUGIN__, 'GetDirtyRegion') and hasattr(__BLENDER_DSPY_PLUGIN__, 'GetFloatFramebufferRegion'):
+                __BLENDER_DSPY_PLUGIN__.GetDirtyRegion.restype = ctypes.c_bool
+                __BLENDER_DSPY_PLUGIN__.GetFloatFramebufferRegion.argtypes = [ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                                             ctypes.c_size_t, __RMAN_NUMPY_POINTER__]
+                __BLENDER_DSPY_DIRTY_REGIONS__ = True
 
         return __BLENDER_DSPY_PLUGIN__
 
@@ -1311,6 +1335,30 @@ class RmanRender(object):
     def reset_buffer_updated(self):
         dspy_plugin = self.get_blender_dspy_plugin()
         dspy_plugin.ResetBufferUpdated()        
+
+    def get_dirty_region(self, image_num=0):
+        '''
+        Get the union of the regions the display driver has written to since the
+        last call, and reset it.
+
+        Args:
+            image_num (int) - index of the display
+
+        Returns:
+            (tuple) - xmin, xmax, ymin, ymax (inclusive, in framebuffer rows), or None
+                      if nothing has been written to, or the display driver doesn't
+                      track dirty regions
+        '''
+        if not __BLENDER_DSPY_DIRTY_REGIONS__:
+            return None
+        dspy_plugin = self.get_blender_dspy_plugin()
+        xmin = ctypes.c_int(0)
+        xmax = ctypes.c_int(0)
+        ymin = ctypes.c_int(0)
+        ymax = ctypes.c_int(0)
+        if not dspy_plugin.GetDirtyRegion(ctypes.c_size_t(image_num), ctypes.byref(xmin), ctypes.byref(xmax), ctypes.byref(ymin), ctypes.byref(ymax)):
+            return None
+        return (xmin.value, xmax.value, ymin.value, ymax.value)
                 
     def draw_pixels(self, width, height):
         self.viewport_res_x = width
@@ -1324,13 +1372,11 @@ class RmanRender(object):
             res_mult = self.rman_scene.viewport_render_res_mult
             width = int(self.viewport_res_x * res_mult)
             height = int(self.viewport_res_y * res_mult)
-            buffer = self._get_buffer(width, height)
-            if buffer is None:
+            texture = self._get_viewport_texture(width, height)
+            if texture is None:
                 rfb_log().debug("Buffer is None")
                 return
-            pixels = gpu.types.Buffer('FLOAT', width * height * 4, buffer)
 
-            texture = gpu.types.GPUTexture((width, height), format='RGBA32F', data=pixels)
             draw_texture_2d(texture, (0, 0), self.viewport_res_x, self.viewport_res_y)
         else:
             # (the driver will handle pixel scaling to the given viewport size)
@@ -1396,12 +1442,96 @@ class RmanRender(object):
             batch = batch_for_shader(shader, 'LINES', {"pos": vtx})
             batch.draw(shader)   
 
+    def _get_viewport_texture(self, width, height):
+        num_channels = self.get_numchannels(0)
+        if num_channels > 4 or num_channels < 0:
+            return None
+
+        # always drain the dirty region, so that it doesn't include
+        # anything we're about to copy in a full update
+        region = self.get_dirty_region(0)
+
+        pixels = None
+        key = (width, height, num_channels, self.rman_scene.viewport_render_res_mult)
+        if __BLENDER_DSPY_DIRTY_REGIONS__ and key == self.viewport_framebuffer_key \
+            and self.viewport_framebuffer_view is not None and self.viewport_texture is not None:
+            if region is None:
+                # nothing has changed since the last draw
+                return self.viewport_texture
+            pixels = self._update_viewport_region(region, width, height, num_channels)
+        if pixels is None:
+            pixels = self._get_viewport_pixels(width, height, num_channels)
+        if pixels is None:
+            self.viewport_texture = None
+            return None
+
+        # there's no way to update part of a GPUTexture from python,
+        # so the texture itself still needs to be re-created
+        self.viewport_texture = gpu.types.GPUTexture((width, height), format='RGBA32F', data=pixels)
+        return self.viewport_texture
+
+    def _update_viewport_region(self, region, width, height, num_channels):
+        # copy only the region that has changed into the viewport framebuffer
+        xmin, xmax, ymin, ymax = region
+        if xmin < 0 or ymin < 0 or xmax >= width or ymax >= height or xmin > xmax or ymin > ymax:
+            # the display driver hasn't caught up to a resize yet
+            return None
+        region_width = xmax - xmin + 1
+        region_height = ymax - ymin + 1
+
+        dspy_plugin = self.get_blender_dspy_plugin()
+        readback = self.framebuffer_pool.get(('region', 0), (width * height * num_channels,), fill=0.0)
+        region_buffer = readback[:region_width * region_height * num_channels]
+        try:
+            dspy_plugin.GetFloatFramebufferRegion(ctypes.c_size_t(0), xmin, xmax, ymin, ymax, region_buffer.size, region_buffer)
+        except Exception as e:
+            rfb_log().debug("Could not get buffer region: %s" % str(e))
+            return None
+
+        pixels = numpy.reshape(self.viewport_framebuffer_view, (height, width, 4))
+        framebuffer_utils.expand_to_rgba(region_buffer, num_channels, out=pixels[ymin:ymax+1, xmin:xmax+1])
+        return self.viewport_framebuffer
+
+    def _get_viewport_pixels(self, width, height, num_channels):
+        key = (width, height, num_channels, self.rman_scene.viewport_render_res_mult)
+        if key != self.viewport_framebuffer_key:
+            # the viewport was resized, or viewport_render_res_mult changed.
+            # Allocate a new GPU buffer for the display driver to write into.
+            self.viewport_framebuffer_key = key
+            self.viewport_framebuffer = gpu.types.Buffer('FLOAT', width * height * 4)
+            try:
+                self.viewport_framebuffer_view = numpy.asarray(memoryview(self.viewport_framebuffer)).reshape(-1)
+                if self.viewport_framebuffer_view.dtype != numpy.float32:
+                    self.viewport_framebuffer_view = None
+                else:
+                    self.viewport_framebuffer_view.fill(1.0)
+            except (TypeError, ValueError):
+                # this version of Blender doesn't expose the buffer's memory
+                self.viewport_framebuffer_view = None
+
+        if self.viewport_framebuffer_view is None:
+            buffer = self._get_buffer(width, height, num_channels=num_channels, reuse=True)
+            if buffer is None:
+                return None
+            return gpu.types.Buffer('FLOAT', width * height * 4, buffer)
+
+        buffer = self._get_buffer(width, height, num_channels=num_channels, reuse=True, out=self.viewport_framebuffer_view)
+        if buffer is None:
+            return None
+        return self.viewport_framebuffer
+
+    def _clear_viewport_framebuffer(self):
+        self.viewport_framebuffer_key = None
+        self.viewport_framebuffer = None
+        self.viewport_framebuffer_view = None
+        self.viewport_texture = None
+
     def get_numchannels(self, image_num):
         dspy_plugin = self.get_blender_dspy_plugin()
         num_channels = dspy_plugin.GetNumberOfChannels(ctypes.c_size_t(image_num))
         return num_channels
 
-    def _get_buffer(self, width, height, image_num=0, num_channels=-1, raw_buffer=False, back_fill=True, as_flat=True, render=None):
+    def _get_buffer(self, width, height, image_num=0, num_channels=-1, raw_buffer=False, back_fill=True, as_flat=True, render=None, reuse=False, out=None):
         dspy_plugin = self.get_blender_dspy_plugin()
         if num_channels == -1:
             num_channels = self.get_numchannels(image_num)
@@ -1409,92 +1539,53 @@ class RmanRender(object):
                 rfb_log().debug("Could not get buffer. Incorrect number of channels: %d" % num_channels)
                 return None
 
-        # code reference: https://asiffer.github.io/posts/numpy/
-        RMAN_NUMPY_POINTER = numpy.ctypeslib.ndpointer(dtype=numpy.float32, 
-                                      ndim=1,
-                                      flags="C")
         f = dspy_plugin.GetFloatFramebuffer
-        f.argtypes = [ctypes.c_size_t, ctypes.c_size_t, RMAN_NUMPY_POINTER]
+
+        # if reuse is True, the returned array is owned by the framebuffer pool
+        # and will be overwritten on the next call. Callers must copy it.
+        # out can be used to give a flat RGBA array to write into, for the
+        # as_flat and back_fill case. Its alpha channel should already be 1.0.
+        def _get_array(key, shape, fill):
+            if reuse:
+                return self.framebuffer_pool.get((key, image_num), shape, fill=fill)
+            return numpy.full(shape, fill, dtype=numpy.float32)
 
         try:
             array_size = width * height * num_channels
-            buffer = numpy.zeros(array_size, dtype=numpy.float32)
+            if out is not None and num_channels == 4:
+                # let the display driver write straight into out
+                f(ctypes.c_size_t(image_num), out.size, out)
+                return out
+            buffer = _get_array('readback', (array_size,), 0.0)
             f(ctypes.c_size_t(image_num), buffer.size, buffer)
 
             if raw_buffer:
                 if not as_flat:
-                    buffer.shape = (height, width, num_channels)
+                    buffer = numpy.reshape(buffer, (height, width, num_channels))
                 return buffer
 
             if as_flat:
                 if (num_channels == 4) or not back_fill:
                     return buffer
+                if out is not None:
+                    pixels = numpy.reshape(out, (width*height, 4))
                 else:
-                    p_pos = 0
-                    pixels = numpy.ones(width*height*4, dtype=numpy.float32)
-                    for y in range(0, height):
-                        i = (width * y * num_channels)
-                        
-                        for x in range(0, width):
-                            j = i + (num_channels * x)
-                            if num_channels == 3:
-                                pixels[p_pos:p_pos+3] = buffer[j:j+3]
-                            elif num_channels == 2:
-                                pixels[p_pos:p_pos+2] = buffer[j:j+2]
-                            elif num_channels == 1:
-                                pixels[p_pos] = buffer[j]
-                                pixels[p_pos+1] = buffer[j]
-                                pixels[p_pos+2] = buffer[j]
-                            p_pos += 4                                
-                    return pixels
+                    pixels = _get_array('rgba', (width*height, 4), 1.0)
+                framebuffer_utils.expand_to_rgba(buffer, num_channels, out=pixels)
+                return numpy.reshape(pixels, -1)
             else:
                 if render and render.use_border:
-                    start_x = 0
-                    end_x = width
-                    start_y = 0
-                    end_y = height
-
-                
-                    if render.border_min_y > 0.0:
-                        start_y = round(height * render.border_min_y)-1
-                    if render.border_max_y > 0.0:                        
-                        end_y = round(height * render.border_max_y)-1 
-                    if render.border_min_x > 0.0:
-                        start_x = round(width * render.border_min_x)-1
-                    if render.border_max_x < 1.0:
-                        end_x = round(width * render.border_max_x)-2
-
-                    # return the buffer as a list of lists
-                    if back_fill:
-                        pixels = numpy.ones( ((end_x-start_x)*(end_y-start_y), 4), dtype=numpy.float32 )
-                    else:
-                        pixels = numpy.zeros( ((end_x-start_x)*(end_y-start_y), num_channels) )
-                    p_pos = 0
-                    for y in range(start_y, end_y):
-                        i = (width * y * num_channels)
-
-                        for x in range(start_x, end_x):
-                            j = i + (num_channels * x)
-                            if (num_channels==4) or not back_fill:
-                                # just slice
-                                pixels[p_pos] = buffer[j:j+num_channels]
-                            else:
-                                pixels[p_pos][0] = buffer[j]                             
-                                if num_channels == 3:
-                                    pixels[p_pos][1] = buffer[j+1]
-                                    pixels[p_pos][2] = buffer[j+2]
-                                elif num_channels == 2:
-                                    pixels[p_pos][1] = buffer[j+1]
-                                elif num_channels == 1:
-                                    pixels[p_pos][1] = buffer[j]
-                                    pixels[p_pos][2] = buffer[j]
-
-                            p_pos += 1
-
-                    return pixels
+                    window = framebuffer_utils.get_border_window(width, height, render)
+                    start_x, end_x, start_y, end_y = window
+                    npixels = (end_x-start_x)*(end_y-start_y)
+                    pixels = _get_array('crop', (npixels, num_channels), 0.0)
+                    framebuffer_utils.crop_pixels(buffer, width, height, num_channels, window, out=pixels)
+                    if (num_channels == 4) or not back_fill:
+                        return pixels
+                    rgba_pixels = _get_array('crop_rgba', (npixels, 4), 1.0)
+                    return framebuffer_utils.expand_to_rgba(pixels, num_channels, out=rgba_pixels)
                 else:
-                    buffer.shape = (-1, num_channels)
-                    return buffer
+                    return numpy.reshape(buffer, (-1, num_channels))
         except Exception as e:
             rfb_log().debug("Could not get buffer: %s" % str(e))
             return None                                     
@@ -51,6 +51,41 @@ import bpy
 import os
 import sys
 
+class RmanMotionTarget:
+    '''
+    A helper class that holds everything needed to export the motion
+    samples of one instance, so that it only needs to be computed once
+    per export.
+
+    Attributes:
+        instance_id (tuple) - stable identity of the instance, see get_instance_id()
+        ob_original (bpy.types.Object) - the original Blender object
+        is_instance (bool) - whether this is an instance (ex: from a particle system)
+        proto_key (str) - the prototype key
+        rman_sg_node (RmanSgNode) - the prototype
+        rman_sg_group (RmanSgGroup) - the group node for this instance, if transforming
+        transform_samples (dict) - motion segment to transform sample index
+        deform_samples (dict) - motion segment to deformation sample index
+    '''
+    def __init__(self, instance_id, ob_original, is_instance, proto_key, rman_sg_node):
+        self.instance_id = instance_id
+        self.ob_original = ob_original
+        self.is_instance = is_instance
+        self.proto_key = proto_key
+        self.rman_sg_node = rman_sg_node
+        self.rman_sg_group = None
+        self.transform_samples = dict()
+        self.deform_samples = dict()
+
+    @staticmethod
+    def get_instance_id(ob_inst):
+        # The position of an instance in depsgraph.object_instances is not
+        # guaranteed to be the same after a frame change, so identify
+        # instances by their parent, object and persistent_id instead
+        if ob_inst.is_instance:
+            return (ob_inst.parent.original, ob_inst.instance_object.original, tuple(ob_inst.persistent_id))
+        return (None, ob_inst.object.original, None)
+
 class RmanScene(object):
     '''
     The RmanScene handles translating the Blender scene.
@@ -71,7 +106,10 @@ class RmanScene(object):
         external_render (bool) - whether we are exporting for external (RIB) renders
         is_viewport_render (bool) - whether we are rendering into Blender's viewport
         scene_solo_light (bool) - user has solo'd a light (all other lights are muted)
-        rman_materials (dict) - dictionary of scene's materials
+        rman_materials (dict) - dictionary of scene's materials. Identical materials can share
+                                the same RmanSgMaterial (see export_materials)
+        num_shared_materials (int) - number of materials that were not exported, because they
+                                     were identical to another material
         rman_translators (dict) - dictionary of all RmanTranslator(s)
         rman_particles (dict) - dictionary of all particle systems used
         rman_cameras (dict) - dictionary of all cameras in the scene
@@ -115,6 +153,7 @@ class RmanScene(object):
         self.is_xpu = False
 
         self.rman_materials = dict()
+        self.num_shared_materials = 0
         self.rman_translators = dict()
         self.rman_particles = dict()
         self.rman_cameras = dict()
@@ -179,12 +218,14 @@ class RmanScene(object):
     def reset(self):
         # clear out dictionaries etc.
         self.rman_materials.clear()
+        self.num_shared_materials = 0
         self.rman_particles.clear()
         self.rman_cameras.clear()
         self.obj_hash.clear()
         self.motion_steps = set()
         self.moving_objects.clear()
         self.rman_prototypes.clear()
+        self.rman_translators['META'].reset_family_index()
 
         self.main_camera = None
         self.render_default_light = False
@@ -204,6 +245,7 @@ class RmanScene(object):
             rfb_log().debug("Cannot set viewport_render_res_mult: %s" % str(err))
 
 
+    @texture_utils.batch_textures
     def export_for_final_render(self, depsgraph, sg_scene, bl_view_layer, is_external=False):
         self.sg_scene = sg_scene
         self.context = bpy.context
@@ -217,6 +259,7 @@ class RmanScene(object):
         self.do_motion_blur = self.bl_scene.renderman.motion_blur
         self.export()
 
+    @texture_utils.batch_textures
     def export_for_bake_render(self, depsgraph, sg_scene, bl_view_layer, is_external=False):
         self.sg_scene = sg_scene
         self.context = bpy.context
@@ -235,6 +278,7 @@ class RmanScene(object):
         else:
             self.export_bake_render_scene()
 
+    @texture_utils.batch_textures
     def export_for_interactive_render(self, context, depsgraph, sg_scene):
         self.sg_scene = sg_scene
         self.context = context
@@ -254,6 +298,7 @@ class RmanScene(object):
 
         self.export()
 
+    @texture_utils.batch_textures
     def export_for_rib_selection(self, context, sg_scene):
         self.reset()
         self.bl_scene = context.scene
@@ -272,6 +317,7 @@ class RmanScene(object):
         self.export_materials([m for m in self.depsgraph.ids if isinstance(m, bpy.types.Material)])
         self.export_data_blocks(selected_objects=True)
 
+    @texture_utils.batch_textures
     def export_for_swatch_render(self, depsgraph, sg_scene):
         self.sg_scene = sg_scene
         self.context = bpy.context #None
@@ -556,11 +602,52 @@ class RmanScene(object):
         return self.sg_scene.Root()
 
     def export_materials(self, materials):
+        # materials that are identical to one we've already exported (ex: copies
+        # of the same material brought in with linked assets) share its RixSGMaterial.
+        # RmanSceneSync.material_updated splits them back out if they change.
+        share_materials = get_pref('rman_share_identical_materials', default=True)
+        shared_materials = dict()
         for mat in materials:
+            fingerprint = None
+            if share_materials and not mat.grease_pencil:
+                fingerprint = shadergraph_utils.get_material_fingerprint(mat.original)
+                rman_sg_material = shared_materials.get(fingerprint, None)
+                if rman_sg_material:
+                    rfb_log().debug("Material %s is identical to %s. Sharing." % (mat.name, rman_sg_material.db_name))
+                    self.rman_materials[mat.original] = rman_sg_material
+                    self.num_shared_materials += 1
+                    continue
+
             db_name = object_utils.get_db_name(mat)
-            rman_sg_material = self.rman_translators['MATERIAL'].export(mat.original, db_name)
+            rman_sg_material = self.rman_translators['MATERIAL'].export(mat.original, db_name, fingerprint=fingerprint)
             if rman_sg_material:
                 self.rman_materials[mat.original] = rman_sg_material
+                if fingerprint is not None and not rman_sg_material.has_meshlight:
+                    shared_materials[fingerprint] = rman_sg_material
+
+        if self.num_shared_materials > 0:
+            rfb_log().info("Shared %d duplicate material(s)" % self.num_shared_materials)
+
+    def is_shared_material(self, rman_sg_material):
+        '''
+        Check if more than one material uses rman_sg_material
+        '''
+        count = 0
+        for v in self.rman_materials.values():
+            if v is rman_sg_material:
+                count += 1
+                if count > 1:
+                    return True
+        return False
+
+    def get_shared_materials(self, rman_sg_material):
+        '''
+        Get all of the materials that use rman_sg_material. The material it
+        was exported from comes first.
+        '''
+        materials = [k for k, v in self.rman_materials.items() if v is rman_sg_material]
+        materials.sort(key=lambda mat: object_utils.get_db_name(mat) != rman_sg_material.db_name)
+        return materials
 
     def check_visibility(self, instance):
         if not self.is_interactive:
@@ -686,6 +773,7 @@ class RmanScene(object):
 
 
     def export_data_blocks(self, selected_objects=False, objects_list=False):
+        self.rman_translators['META'].reset_family_index()
         total = len(self.depsgraph.object_instances)
         for i, ob_inst in enumerate(self.depsgraph.object_instances):
             ob = ob_inst.object
@@ -818,20 +906,96 @@ class RmanScene(object):
 
         return rman_sg_node
 
-    def export_instances_motion(self, selected_objects=False):
-        origframe = self.bl_scene.frame_current
+    def _plan_motion_samples(self, selected_objects=False, first_sample=True):
+        """Walk the instances once and collect the ones that need motion samples.
+
+        Args:
+            selected_objects (bool) - only consider selected instances
+            first_sample (bool) - whether we are planning from the first motion sample.
+                                  If so, the number of transform samples is also set on the groups.
+
+        Returns:
+            (list) - RmanMotionTarget for each instance that is transforming or deforming
+        """
+        targets = list()
+        step_indices = dict()
+        rman_group_translator = self.rman_translators['GROUP']
 
-        mb_segs = self.bl_scene.renderman.motion_segments
+        def _get_step_indices(motion_steps):
+            # map each segment to its sample index
+            key = id(motion_steps)
+            if key not in step_indices:
+                step_indices[key] = {seg: i for i, seg in enumerate(motion_steps)}
+            return step_indices[key]
+
+        total = len(self.depsgraph.object_instances)
+        for i, ob_inst in enumerate(self.depsgraph.object_instances):
+            if selected_objects and not self.is_instance_selected(ob_inst):
+                continue
+
+            if not self.check_visibility(ob_inst):
+                continue
+
+            psys = None
+            ob = ob_inst.object.evaluated_get(self.depsgraph)
+            proto_key = object_utils.prototype_key(ob_inst)
+            self.rman_render.stats_mgr.set_export_stats("Planning motion instances", i/total)
+            instance_parent = None
+            rman_parent_node = None
+            if ob_inst.is_instance:
+                psys = ob_inst.particle_system
+                instance_parent = ob_inst.parent
+                rman_parent_node = self.get_rman_prototype(object_utils.prototype_key(instance_parent))
+
+            rman_type = object_utils._detect_primitive_(ob)
+            if rman_type in object_utils._RMAN_NO_INSTANCES_:
+                continue
+
+            # object is not moving and not part of a particle system
+            if ob.name_full not in self.moving_objects and not psys:
+                continue
+
+            rman_sg_node = self.get_rman_prototype(proto_key, ob=ob)
+            if not rman_sg_node:
+                continue
+
+            target = RmanMotionTarget(RmanMotionTarget.get_instance_id(ob_inst), ob.original, ob_inst.is_instance, proto_key, rman_sg_node)
+
+            # transformation blur
+            if rman_sg_node.motion_steps and (rman_sg_node.is_transforming or psys):
+                group_db_name = object_utils.get_group_db_name(ob_inst)
+                if instance_parent:
+                    rman_sg_group = rman_parent_node.instances.get(group_db_name, None) if rman_parent_node else None
+                else:
+                    rman_sg_group = rman_sg_node.instances.get(group_db_name, None)
+                if rman_sg_group:
+                    if first_sample:
+                        rman_group_translator.update_transform_num_samples(rman_sg_group, rman_sg_node.motion_steps)
+                    target.rman_sg_group = rman_sg_group
+                    target.transform_samples = _get_step_indices(rman_sg_node.motion_steps)
+
+            # deformation blur
+            if rman_sg_node.is_deforming and rman_sg_node.rman_type in ['MESH', 'FLUID', 'CURVES']:
+                if self.rman_translators.get(rman_sg_node.rman_type, None):
+                    target.deform_samples = _get_step_indices(rman_sg_node.deform_motion_steps)
+
+            if target.transform_samples or target.deform_samples:
+                targets.append(target)
+
+        return targets
+
+    def export_instances_motion(self, selected_objects=False):
         origframe = self.bl_scene.frame_current
 
         motion_steps = sorted(list(self.motion_steps))
 
-        first_sample = False
         delta = 0.0
         if len(motion_steps) > 0:
             delta = -motion_steps[0]
-        psys_translator = self.rman_translators['PARTICLES']
         rman_group_translator = self.rman_translators['GROUP']
+        cam_motion_samples = {seg: i for i, seg in enumerate(self.main_camera.motion_steps)}
+        targets = None
+        num_instances = 0
         for samp, seg in enumerate(motion_steps):
             first_sample = (samp == 0)
             if seg < 0.0:
@@ -841,101 +1005,62 @@ class RmanScene(object):
 
             self.depsgraph.update()
             time_samp = seg + delta # get the normlized version of the segment
-            total = len(self.depsgraph.object_instances)
-            objFound = False
 
             # update camera
-            if not first_sample and self.main_camera.is_transforming and seg in self.main_camera.motion_steps:
+            if not first_sample and self.main_camera.is_transforming and seg in cam_motion_samples:
                 cam_translator =  self.rman_translators['CAMERA']
-                idx = 0
-                for i, s in enumerate(self.main_camera.motion_steps):
-                    if s == seg:
-                        idx = i
-                        break
+                idx = cam_motion_samples[seg]
                 cam_translator.update_transform(self.depsgraph.scene_eval.camera, self.main_camera, idx, time_samp)
 
+            if targets is None or num_instances != len(self.depsgraph.object_instances):
+                # only walk all of the instances once, unless the number of
+                # instances changed between samples
+                targets = self._plan_motion_samples(selected_objects=selected_objects, first_sample=first_sample)
+                num_instances = len(self.depsgraph.object_instances)
+
             rfb_log().debug(" Export Sample: %i" % samp)
-            for i, ob_inst in enumerate(self.depsgraph.object_instances):
-                if selected_objects and not self.is_instance_selected(ob_inst):
-                    continue
 
-                if not self.check_visibility(ob_inst):
+            # transformation blur
+            instance_targets = dict()
+            for target in targets:
+                idx = target.transform_samples.get(seg, None)
+                if idx is None:
                     continue
-
-                psys = None
-                ob = ob_inst.object.evaluated_get(self.depsgraph)
-                proto_key = object_utils.prototype_key(ob_inst)
-                rfb_log().debug("   Exported %d/%d motion instances... (%s)" % (i, total, ob.name))
-                self.rman_render.stats_mgr.set_export_stats("Exporting motion instances (%d) " % samp ,i/total)
-                instance_parent = None
-                rman_parent_node = None
-                if ob_inst.is_instance:
-                    psys = ob_inst.particle_system
-                    instance_parent = ob_inst.parent
-                    rman_parent_node = self.get_rman_prototype(object_utils.prototype_key(instance_parent))
-
-                rman_type = object_utils._detect_primitive_(ob)
-                if rman_type in object_utils._RMAN_NO_INSTANCES_:
+                if target.is_instance:
+                    # instances are only accessible while iterating
+                    # over depsgraph.object_instances
+                    instance_targets[target.instance_id] = target
                     continue
+                ob = target.ob_original.evaluated_get(self.depsgraph)
+                rman_group_translator.update_transform_sample(ob, target.rman_sg_group, idx, time_samp)
 
-                # check particles for motion
-                '''
-                for psys in ob.particle_systems:
-                    ob_psys = self.rman_particles.get(proto_key, None)
-                    if not ob_psys:
+            if instance_targets:
+                for ob_inst in self.depsgraph.object_instances:
+                    if not ob_inst.is_instance:
                         continue
-                    rman_sg_particles = ob_psys.get(psys.settings.original, None)
-                    if not rman_sg_particles:
+                    target = instance_targets.pop(RmanMotionTarget.get_instance_id(ob_inst), None)
+                    if target is None:
                         continue
-                    if not seg in rman_sg_particles.motion_steps:
-                        continue
-                    idx = 0
-                    for i, s in enumerate(rman_sg_particles.motion_steps):
-                        if s == seg:
-                            idx = i
-                            break
-                    psys_translator.export_deform_sample(rman_sg_particles, ob, psys, idx)
-                '''
-
-                # object is not moving and not part of a particle system
-                if ob.name_full not in self.moving_objects and not psys:
-                    continue
-
-                rman_sg_node = self.get_rman_prototype(proto_key, ob=ob)
-                if not rman_sg_node:
+                    idx = target.transform_samples[seg]
+                    rman_group_translator.update_transform_sample(ob_inst, target.rman_sg_group, idx, time_samp)
+                    if not instance_targets:
+                        break
+                if instance_targets:
+                    rfb_log().debug("   %d instance(s) not found at sample %d" % (len(instance_targets), samp))
+
+            # deformation blur
+            deformed = set()
+            total = len(targets)
+            for i, target in enumerate(targets):
+                deform_idx = target.deform_samples.get(seg, None)
+                if deform_idx is None or target.proto_key in deformed:
                     continue
-
-                # transformation blur
-                if seg in rman_sg_node.motion_steps:
-                    idx = 0
-                    for i, s in enumerate(rman_sg_node.motion_steps):
-                        if s == seg:
-                            idx = i
-                            break
-
-                    if rman_sg_node.is_transforming or psys:
-                        group_db_name = object_utils.get_group_db_name(ob_inst)
-                        if instance_parent:
-                            rman_sg_group = rman_parent_node.instances.get(group_db_name, None)
-                        else:
-                            rman_sg_group = rman_sg_node.instances.get(group_db_name, None)
-                        if rman_sg_group:
-                            if first_sample:
-                                rman_group_translator.update_transform_num_samples(rman_sg_group, rman_sg_node.motion_steps )
-                            rman_group_translator.update_transform_sample( ob_inst, rman_sg_group, idx, time_samp)
-
-                # deformation blur
-                if rman_sg_node.is_deforming and seg in rman_sg_node.deform_motion_steps:
-                    rman_type = rman_sg_node.rman_type
-                    if rman_type in ['MESH', 'FLUID', 'CURVES']:
-                        translator = self.rman_translators.get(rman_type, None)
-                        if translator:
-                            deform_idx = 0
-                            for i, s in enumerate(rman_sg_node.deform_motion_steps):
-                                if s == seg:
-                                    deform_idx = i
-                                    break
-                            translator.export_deform_sample(rman_sg_node, ob, deform_idx)
+                deformed.add(target.proto_key)
+                self.rman_render.stats_mgr.set_export_stats("Exporting motion instances (%d) " % samp, i/total)
+                ob = target.ob_original.evaluated_get(self.depsgraph)
+                rfb_log().debug("   Exported %d/%d motion instances... (%s)" % (i, total, ob.name))
+                translator = self.rman_translators[target.rman_sg_node.rman_type]
+                translator.export_deform_sample(target.rman_sg_node, ob, deform_idx)
 
         self.rman_render.bl_engine.frame_set(origframe, subframe=0)
         rfb_log().debug("   Finished exporting motion instances")
@@ -2,6 +2,7 @@
 from .rfb_utils import object_utils
 from .rfb_utils import texture_utils
 from .rfb_utils import scene_utils
+from .rfb_utils import shadergraph_utils
 from .rfb_utils.timer_utils import time_this
 from .rfb_utils import string_utils
 
@@ -11,6 +12,14 @@ from .rman_sg_nodes.rman_sg_lightfilter import RmanSgLightFilter
 from . import rman_constants
 import bpy
 
+# ID types, used with user_map, to the classes of those IDs
+_USER_ID_TYPES_ = {
+    'NODETREE': bpy.types.NodeTree,
+    'COLLECTION': bpy.types.Collection,
+    'OBJECT': bpy.types.Object,
+    'LIGHT': bpy.types.Light
+}
+
 class RmanUpdate:
     '''
     The RmanUpdate class. A helper class to indicate what kind of update
@@ -46,6 +55,9 @@ class RmanSceneSync(object):
         rman () - rman python module
         rman_scene (RmanScene) - pointer to the current RmanScene object
         sg_scene (RixSGSCene) - the RenderMan scene graph object
+        users_index (dict) - Object to the set of IDs that use it. Built once per session,
+                             and kept up to date as node trees, collections, objects and
+                             lights change. Dropped on undo/redo.
 
     '''
 
@@ -60,6 +72,8 @@ class RmanSceneSync(object):
 
         self.rman_updates = dict() # A dicitonary to hold RmanUpdate instances
         self.selected_channel = None
+        self.users_index = None # Object -> set of IDs that use it. See get_users
+        self.users_index_updates = set() # ID types whose users need refreshing in users_index
 
     @property
     def sg_scene(self):
@@ -75,6 +89,7 @@ class RmanSceneSync(object):
         self.check_all_instances = False 
         self.rman_updates = dict()
         self.selected_channel = None        
+        self.clear_users_index()
 
     def update_view(self, context, depsgraph):
         camera = depsgraph.scene.camera
@@ -104,6 +119,92 @@ class RmanSceneSync(object):
         self.rman_updates[ob_key] = rman_update   
         return rman_update                       
 
+    def get_users(self, ob):
+        '''
+        Get the IDs that use an object. The first time this is called, the users
+        of all objects are indexed with a single user_map call. Objects that are
+        not in the index yet are added as they are asked for.
+
+        Args:
+            ob (bpy.types.Object) - the original object
+
+        Returns:
+            (set) - the IDs that use ob
+        '''
+        blend_data = self.rman_scene.context.blend_data
+        if self.users_index is None:
+            rfb_log().debug("Building users index")
+            self.users_index = blend_data.user_map(key_types={'OBJECT'})
+            self.users_index_updates.clear()
+        elif self.users_index_updates:
+            self.refresh_users()
+
+        users = self.users_index.get(ob, None)
+        if users is None:
+            users = blend_data.user_map(subset={ob})[ob]
+            self.users_index[ob] = users
+        return users
+
+    def clear_users_index(self):
+        # undo/redo invalidates all bpy.types.ID references, including
+        # the ones held in the users index
+        self.users_index = None
+        self.users_index_updates.clear()
+
+    def refresh_users(self):
+        '''
+        Update the users index for the ID types in users_index_updates. Only the IDs
+        of those types are scanned, rather than the whole database.
+        '''
+        id_types = set(self.users_index_updates)
+        self.users_index_updates.clear()
+        id_classes = tuple(_USER_ID_TYPES_[t] for t in id_types)
+        rfb_log().debug("Refreshing users index for: %s" % str(id_types))
+        users = self.rman_scene.context.blend_data.user_map(key_types={'OBJECT'}, value_types=id_types)
+        for ob_users in self.users_index.values():
+            ob_users.difference_update([o for o in ob_users if isinstance(o, id_classes)])
+        for ob, ob_users in users.items():
+            self.users_index.setdefault(ob, set()).update(ob_users)
+
+    def is_user_updated(self, ob, users_updated):
+        '''
+        Check if any of the users of an object have an RmanUpdate.
+
+        Args:
+            ob (bpy.types.Object) - the original object
+            users_updated (dict) - results for objects that have already been checked 
+
+        Returns:
+            (bool) - True if a user was updated
+        '''
+        user_exist = users_updated.get(ob, None)
+        if user_exist is None:
+            user_exist = False
+            for o in self.get_users(ob):
+                if o.original in self.rman_updates:
+                    rfb_log().debug("\t%s user updated (%s)" % (ob.name, o.name))
+                    user_exist = True
+                    break
+            users_updated[ob] = user_exist
+        return user_exist
+
+    def tag_users_index(self, dps_update):
+        # keep track of updates that could have changed which IDs use an object
+        if self.users_index is None:
+            return
+        if self.num_instances_changed:
+            # objects were added or deleted
+            self.users_index = None
+        elif isinstance(dps_update.id, bpy.types.GeometryNodeTree):
+            self.users_index_updates.add('NODETREE')
+        elif isinstance(dps_update.id, bpy.types.Collection):
+            self.users_index_updates.add('COLLECTION')
+        elif isinstance(dps_update.id, bpy.types.Object) and dps_update.is_updated_geometry:
+            self.users_index_updates.add('OBJECT')
+        elif isinstance(dps_update.id, bpy.types.Light):
+            # ex: a light filter was attached to a light
+            self.users_index_updates.add('LIGHT')
+
     @time_this
     def scene_updated(self):
         # Check visible objects
@@ -188,6 +289,70 @@ class RmanSceneSync(object):
         for ob in object_list:
             ob.update_tag()
 
+    def _rebind_material(self, mat):
+        # Bind the RixSGMaterial now in rman_materials for mat on everything
+        # that uses it, the same way instances pick up a new material
+        # assignment. The geometry itself is left alone.
+        from .rfb_utils import scenegraph_utils
+        rman_sg_material = self.rman_scene.rman_materials.get(mat.original, None)
+        if not rman_sg_material or not rman_sg_material.sg_node:
+            return
+        updated = set()
+        with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):
+            for ob_inst in self.rman_scene.depsgraph.object_instances:
+                ob = ob_inst.object.evaluated_get(self.rman_scene.depsgraph)
+                if not hasattr(ob.data, 'materials'):
+                    continue
+                if ob.type in ('ARMATURE', 'CAMERA'):
+                    continue
+                # sub meshes are bound to the mesh's own materials, everything
+                # else goes through the material slots, which can also be
+                # linked to the object
+                mat_ids = [i for i, m in enumerate(ob.data.materials) if m and m.original == mat.original]
+                slot_ids = [i for i, slot in enumerate(ob.material_slots) if slot.material and slot.material.original == mat.original]
+                if not mat_ids and not slot_ids:
+                    continue
+                proto_key = object_utils.prototype_key(ob_inst)
+                rman_sg_node = self.rman_scene.get_rman_prototype(proto_key)
+                if not rman_sg_node:
+                    continue
+
+                if proto_key not in updated:
+                    updated.add(proto_key)
+                    if getattr(rman_sg_node, 'is_multi_material', False):
+                        # faces using the first slot are bound on the mesh
+                        # itself, the rest on the sub meshes
+                        if 0 in mat_ids:
+                            scenegraph_utils.set_material(rman_sg_node.sg_mesh, rman_sg_material.sg_node)
+                        for sg_sub_mesh, mat_id in zip(rman_sg_node.multi_material_children, rman_sg_node.multi_material_ids):
+                            if mat_id in mat_ids:
+                                scenegraph_utils.set_material(sg_sub_mesh, rman_sg_material.sg_node)
+
+                    for psys in ob.particle_systems:
+                        if (psys.settings.material - 1) not in slot_ids:
+                            continue
+                        rman_sg_particles = self.rman_scene.get_rman_particles(proto_key, psys, ob, create=False)
+                        if not rman_sg_particles:
+                            continue
+                        for rman_sg_psys in (rman_sg_particles.rman_sg_emitter, rman_sg_particles.rman_sg_hair):
+                            if rman_sg_psys and rman_sg_psys.sg_node:
+                                scenegraph_utils.set_material(rman_sg_psys.sg_node, rman_sg_material.sg_node)
+
+                instance_parent = None
+                psys = None
+                if ob_inst.is_instance:
+                    psys = ob_inst.particle_system
+                    instance_parent = ob_inst.parent
+                rman_sg_group = self.rman_scene.get_rman_sg_instance(ob_inst, rman_sg_node, instance_parent, psys, create=False)
+                if not rman_sg_group:
+                    continue
+                if instance_parent and object_utils.is_empty_instancer(instance_parent) and instance_parent.renderman.rman_material_override:
+                    self.rman_scene.attach_material(instance_parent, rman_sg_group)
+                elif psys:
+                    self.rman_scene.attach_particle_material(psys.settings, instance_parent, ob, rman_sg_group)
+                else:
+                    self.rman_scene.attach_material(ob, rman_sg_group)
+
     def material_updated(self, ob_update, rman_sg_material=None):
         if isinstance(ob_update, bpy.types.DepsgraphUpdate):
             mat = ob_update.id
@@ -200,6 +365,28 @@ class RmanSceneSync(object):
         if not rman_sg_material:
             # Double check if we can't find the material because of an undo
             rman_sg_material = self.update_materials_dict(mat)
+        elif self.rman_scene.is_shared_material(rman_sg_material):
+            fingerprint = shadergraph_utils.get_material_fingerprint(mat)
+            shared_materials = self.rman_scene.get_shared_materials(rman_sg_material)
+            owner = shared_materials[0]
+            other = owner if owner != mat.original else shared_materials[1]
+            if fingerprint == shadergraph_utils.get_material_fingerprint(other):
+                # still identical to the materials it shares with, but
+                # something all of them depend on may have changed (ex: the
+                # frame number). Always translate from the same material, so
+                # that the shared material is only translated once.
+                with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):
+                    translator.update(owner, rman_sg_material, fingerprint=fingerprint)
+                return
+            # this material has changed. Give it its own RixSGMaterial, and
+            # bind it on the objects that use it
+            rfb_log().debug("Material %s no longer matches %s. Stop sharing." % (mat.name, rman_sg_material.db_name))
+            with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):
+                rman_sg_material = translator.export(mat, db_name, fingerprint=fingerprint)
+                self.rman_scene.rman_materials[mat.original] = rman_sg_material
+            self.rman_scene.num_shared_materials -= 1
+            self._rebind_material(mat)
+            return
 
         with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):              
             if not rman_sg_material:
@@ -381,6 +568,7 @@ class RmanSceneSync(object):
                     self.rman_scene.rman_materials[mat.original] = rman_sg_node
                     del self.rman_scene.rman_materials[id]
                     rman_sg_material = rman_sg_node 
+                    self.clear_users_index()
                     break
         
         return rman_sg_material
@@ -541,6 +729,7 @@ class RmanSceneSync(object):
                         self.rman_updates[o.original] = rman_update        
 
     @time_this
+    @texture_utils.batch_textures
     def batch_update_scene(self, context, depsgraph):
         self.rman_scene.bl_frame_current = self.rman_scene.bl_scene.frame_current
 
@@ -550,6 +739,7 @@ class RmanSceneSync(object):
 
         self.rman_scene.bl_scene = depsgraph.scene_eval
         self.rman_scene.context = context     
+        self.rman_scene.rman_translators['META'].reset_family_index()
 
         # update the frame number
         options = self.rman_scene.sg_scene.GetOptions()
@@ -565,6 +755,7 @@ class RmanSceneSync(object):
 
         with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):  
             for dps_update in reversed(depsgraph.updates):
+                self.tag_users_index(dps_update)
                 if isinstance(dps_update.id, bpy.types.ParticleSettings):
                     self.check_particle_settings(dps_update)
 
@@ -611,6 +802,7 @@ class RmanSceneSync(object):
                 self.rman_scene.export_instances_motion()
                                   
     @time_this
+    @texture_utils.batch_textures
     def update_scene(self, context, depsgraph):
 
         #self.rman_updates = dict()
@@ -621,6 +813,7 @@ class RmanSceneSync(object):
         self.rman_scene.depsgraph = depsgraph
         self.rman_scene.bl_scene = depsgraph.scene
         self.rman_scene.context = context       
+        self.rman_scene.rman_translators['META'].reset_family_index()
 
         if len(depsgraph.updates) < 1 and depsgraph.id_type_updated('NODETREE'):
             # Updates is empty?! This seems like a Blender bug.
@@ -660,6 +853,7 @@ class RmanSceneSync(object):
             self.rman_scene.num_object_instances = len(depsgraph.object_instances)
 
         for dps_update in reversed(depsgraph.updates):
+            self.tag_users_index(dps_update)
             if isinstance(dps_update.id, bpy.types.Scene):
                 self.scene_updated()
 
@@ -732,9 +926,10 @@ class RmanSceneSync(object):
 
     @time_this
     def check_instances(self, batch_mode=False):
-        deleted_obj_keys = list(self.rman_scene.rman_prototypes) # list of potential objects to delete
-        already_udpated = list() # list of objects already updated during our loop
-        clear_instances = list() # list of objects who had their instances cleared            
+        deleted_obj_keys = set(self.rman_scene.rman_prototypes) # set of potential objects to delete
+        already_udpated = set() # set of objects already updated during our loop
+        clear_instances = set() # set of objects who had their instances cleared            
+        users_updated = dict() # whether one of the users of an object was updated
         rfb_log().debug("Updating instances")        
         with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene): 
             for instance in self.rman_scene.depsgraph.object_instances:
@@ -742,7 +937,6 @@ class RmanSceneSync(object):
                     continue
 
                 ob_key = instance.object.original
-                ob_eval = instance.object.evaluated_get(self.rman_scene.depsgraph)                
                 instance_parent = None
                 psys = None 
                 is_new_object = False
@@ -752,10 +946,20 @@ class RmanSceneSync(object):
                     ob_key = instance.instance_object.original      
                     psys = instance.particle_system
                     instance_parent = instance.parent 
-                    is_empty_instancer = object_utils.is_empty_instancer(instance_parent)
                     
-                if proto_key in deleted_obj_keys:
-                    deleted_obj_keys.remove(proto_key) 
+                deleted_obj_keys.discard(proto_key)
+
+                rman_update = self.rman_updates.get(ob_key, None)
+                if rman_update is None and not self.check_all_instances and proto_key in self.rman_scene.rman_prototypes:
+                    # nothing this instance depends on was updated. Skip it,
+                    # before doing any work.
+                    if not self.is_user_updated(ob_key, users_updated):
+                        if not instance_parent or instance_parent.original not in self.rman_updates:
+                            continue
+
+                ob_eval = instance.object.evaluated_get(self.rman_scene.depsgraph)                
+                if instance_parent:
+                    is_empty_instancer = object_utils.is_empty_instancer(instance_parent)
                
                 rman_type = object_utils._detect_primitive_(ob_eval)
                 
@@ -771,7 +975,6 @@ class RmanSceneSync(object):
                     del self.rman_scene.rman_prototypes[proto_key]
                     rman_sg_node = None
 
-                rman_update = self.rman_updates.get(ob_key, None)
                 if not rman_sg_node:
                     # this is a new object.
                     rman_sg_node = self.rman_scene.export_data_block(proto_key, ob_eval)
@@ -782,8 +985,7 @@ class RmanSceneSync(object):
 
                     if rman_type == 'LIGHTFILTER':
                         # update all lights with this light filter
-                        users = bpy.context.blend_data.user_map(subset={ob_eval.original})
-                        for o in users[ob_eval.original]:
+                        for o in self.get_users(ob_eval.original):
                             if isinstance(o, bpy.types.Light):
                                 o.node_tree.update_tag()
                         self.rman_scene.set_root_lightlinks() # update lightlinking on the root node
@@ -795,7 +997,7 @@ class RmanSceneSync(object):
                     # set update_geometry to False
                     # since we've already exported the datablock                        
                     rman_update.is_updated_geometry = False
-                    clear_instances.append(rman_sg_node)
+                    clear_instances.add(rman_sg_node)
                                                                 
                 if self.check_all_instances:
                     # check all instances in the scene
@@ -813,14 +1015,8 @@ class RmanSceneSync(object):
                     # check if one of the users of this object updated
                     # ex: the object was instanced via a GeometryNodeTree, and the 
                     # geometry node tree updated
-                    users = self.rman_scene.context.blend_data.user_map(subset={ob_eval.original})
-                    user_exist = False
-                    for o in users[ob_eval.original]:
-                        if o.original in self.rman_updates:
-                            rfb_log().debug("\t%s user updated (%s)" % (ob_eval.name, o.name))
-                            user_exist = True
-                            break
-                    if user_exist:
+                    if self.is_user_updated(ob_key, users_updated):
+                        rfb_log().debug("\t%s user updated" % ob_eval.name)
                         rman_update = self.create_rman_update(ob_key, update_transform=True)
                     else:
                         # check if the instance_parent was the thing that 
@@ -843,7 +1039,7 @@ class RmanSceneSync(object):
                             translator.update(ob_eval, rman_sg_node)  
                             rman_sg_node.shared_attrs.Clear()
                             self.update_particle_emitters(ob_eval)
-                        already_udpated.append(proto_key)   
+                        already_udpated.add(proto_key)   
 
                 if rman_type in object_utils._RMAN_NO_INSTANCES_:
                     if rman_type == 'EMPTY':
@@ -859,11 +1055,11 @@ class RmanSceneSync(object):
                         if rman_parent_node and rman_parent_node not in clear_instances:
                             rfb_log().debug("\tClearing parent instances: %s" % parent_proto_key)
                             rman_parent_node.clear_instances()
-                            clear_instances.append(rman_parent_node) 
+                            clear_instances.add(rman_parent_node) 
                     if rman_sg_node not in clear_instances:
                         rfb_log().debug("\tClearing instances: %s" % proto_key)
                         rman_sg_node.clear_instances()
-                        clear_instances.append(rman_sg_node) 
+                        clear_instances.add(rman_sg_node) 
 
                     if not self.rman_scene.check_visibility(instance):
                          # This instance is not visible in the viewport. Don't
@@ -875,8 +1071,8 @@ class RmanSceneSync(object):
                     if rman_sg_node not in clear_instances:
                         # this might be a bit werid, but we don't want another RmanUpdate
                         # instance to clear the instances afterwards, so we add to the
-                        # clear_instances list
-                        clear_instances.append(rman_sg_node) 
+                        # clear_instances set
+                        clear_instances.add(rman_sg_node) 
 
                     # simply grab the existing instance and update the transform and/or material
                     rman_sg_group = self.rman_scene.get_rman_sg_instance(instance, rman_sg_node, instance_parent, psys, create=False)
@@ -1095,6 +1291,8 @@ class RmanSceneSync(object):
         translator = self.rman_scene.rman_translators["MATERIAL"]     
         has_meshlight = rman_sg_material.has_meshlight   
         rfb_log().debug("Manual material update called for: %s." % mat.name)
+        # always retranslate when asked to
+        rman_sg_material.fingerprint = None
         with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene):                  
             translator.update(mat, rman_sg_material)
 
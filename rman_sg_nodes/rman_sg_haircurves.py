@@ -6,3 +6,10 @@ class RmanSgHairCurves(RmanSgNode):
         super().__init__(rman_scene, sg_node, db_name)
 
         self.sg_curves_list = list()
+
+        # cached from the last update, so that deformation
+        # samples only need to read the positions
+        self.curve_offsets = None
+        self.point_mask = None
+        self.chunk_ranges = list()
+        self.deform_points = None
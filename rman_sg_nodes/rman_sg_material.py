@@ -10,6 +10,7 @@ class RmanSgMaterial(RmanSgNode):
         self.sg_stroke_mat = None
         self.sg_fill_mat = None
         self.nodes_to_blnodeinfo = dict()
+        self.fingerprint = None
 
     @property
     def has_meshlight(self):
@@ -41,4 +42,12 @@ class RmanSgMaterial(RmanSgNode):
 
     @sg_fill_mat.setter
     def sg_fill_mat(self, sg_fill_mat):
-        self.__sg_fill_mat = sg_fill_mat                                  
\ No newline at end of file
+        self.__sg_fill_mat = sg_fill_mat
+
+    @property
+    def fingerprint(self):
+        return self.__fingerprint
+
+    @fingerprint.setter
+    def fingerprint(self, fingerprint):
+        self.__fingerprint = fingerprint
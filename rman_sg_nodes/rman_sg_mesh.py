@@ -12,8 +12,14 @@ class RmanSgMesh(RmanSgNode):
         self.subdiv_scheme = 'none'
         self.is_multi_material = False
         self.multi_material_children = []
+        self.multi_material_ids = [] # material slot of each multi_material_children
         self.sg_mesh = None
 
+        # (topology, points) fingerprint of the last exported geometry.
+        # Used during IPR to skip re-exporting a mesh that did not actually
+        # change, or to only update the points if the topology is the same
+        self.geometry_fingerprint = None
+
     def __del__(self):
         if self.rman_scene.rman_render.rman_running and self.rman_scene.rman_render.sg_scene:
             with self.rman_scene.rman.SGManager.ScopedEdit(self.rman_scene.sg_scene): 
@@ -1,22 +1,90 @@
 from .rman_translator import RmanTranslator
 from ..rman_sg_nodes.rman_sg_blobby import RmanSgBlobby
 from ..rfb_utils import object_utils
-from ..rfb_utils import string_utils
-from mathutils import Matrix
 
 import bpy
 import math
+import numpy as np
 
-def get_mball_parent(mball):
-    for ob in bpy.data.objects:
-        if ob.data == mball:
-            return ob
+class MetaFamilyIndex:
+    '''
+    Index of all metaballs in the file, by family name. This replaces having
+    to search bpy.data.objects for the owner of every metaball element.
+
+    Attributes:
+        families (dict) - family name to list of (metaball, owner object)
+    '''
+
+    def __init__(self):
+        self.families = dict()
+
+        # the first object that uses each metaball datablock
+        owners = dict()
+        for ob in bpy.data.objects:
+            if ob.type == 'META' and ob.data not in owners:
+                owners[ob.data] = ob
+
+        for mball in bpy.data.metaballs:
+            parent = owners.get(mball, None)
+            if parent is None:
+                continue
+            family = parent.name.split('.')[0]
+            self.families.setdefault(family, list()).append((mball, parent))
+
+    def get_family(self, family):
+        return self.families.get(family, list())
+
+def _get_family_transforms_(fam_mballs):
+    '''
+    Get the transforms for all of the elements of a family, as a flat,
+    column major, array of 4x4 matrices.
+    '''
+    tforms = []
+    for mball, parent in fam_mballs:
+        count = len(mball.elements)
+        if count < 1:
+            continue
+        co = np.zeros(count*3, dtype=np.float32)
+        radius = np.zeros(count, dtype=np.float32)
+        mball.elements.foreach_get('co', co)
+        mball.elements.foreach_get('radius', radius)
+
+        # Because all meta elements are stored in a single collection,
+        # these elements have a link to their parent MetaBall, but NOT the actual tree parent object.
+        # We need the tree parent in order to get any world transforms that alter position of the metaball.
+        # mballs that are only linked to the master by name have their own position,
+        # and have to be transformed relative to the master
+        ploc, prot, psc = parent.matrix_world.decompose()
+        ro = np.array(prot.to_matrix(), dtype=np.float32)
+
+        # translation @ scale @ rotation, for every element
+        m = np.zeros((count, 4, 4), dtype=np.float32)
+        m[:, 0:3, 0:3] = radius[:, None, None] * ro
+        m[:, 0:3, 3] = np.reshape(co, (count, 3))
+        m[:, 3, 3] = 1.0
+        m = np.array(parent.matrix_world, dtype=np.float32) @ m
+        tforms.append(np.transpose(m, (0, 2, 1)).reshape(-1))
+
+    if not tforms:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(tforms)
 
 class RmanBlobbyTranslator(RmanTranslator):
 
     def __init__(self, rman_scene):
         super().__init__(rman_scene)
         self.bl_type = 'META' 
+        self.family_index = None
+
+    def reset_family_index(self):
+        # called whenever the scene is about to be exported or updated,
+        # so that the index is only built once and shared by all families
+        self.family_index = None
+
+    def get_family_index(self):
+        if self.family_index is None:
+            self.family_index = MetaFamilyIndex()
+        return self.family_index
 
     def export(self, ob, db_name):
 
@@ -39,59 +107,26 @@ class RmanBlobbyTranslator(RmanTranslator):
         # all as one family in RiBlobby
 
         family = object_utils.get_meta_family(ob)
-        master = bpy.data.objects[family]
-
-        fam_blobs = []
-
-        for mball in bpy.data.metaballs:
-            fam_blobs.extend([el for el in mball.elements if get_mball_parent(
-                el.id_data).name.split('.')[0] == family])
+        fam_mballs = self.get_family_index().get_family(family)
 
         # transform
-        tform = []
+        tform = _get_family_transforms_(fam_mballs)
+        count = len(tform) // 16
 
         # opcodes
-        op = []
-        count = len(fam_blobs)
-        for i in range(count):
-            op.append(1001)  # only blobby ellipsoids for now...
-            op.append(i * 16)
-
-        for meta_el in fam_blobs:
-
-            # Because all meta elements are stored in a single collection,
-            # these elements have a link to their parent MetaBall, but NOT the actual tree parent object.
-            # So I have to go find the parent that owns it.  We need the tree parent in order
-            # to get any world transforms that alter position of the metaball.
-            parent = get_mball_parent(meta_el.id_data)
-
-            m = {}
-            loc = meta_el.co
-
-            # mballs that are only linked to the master by name have their own position,
-            # and have to be transformed relative to the master
-            ploc, prot, psc = parent.matrix_world.decompose()
-
-            m = Matrix.Translation(loc)
-
-            sc = Matrix(((meta_el.radius, 0, 0, 0),
-                        (0, meta_el.radius, 0, 0),
-                        (0, 0, meta_el.radius, 0),
-                        (0, 0, 0, 1)))
-
-            ro = prot.to_matrix().to_4x4()
-
-            m2 = m @ sc @ ro
-            tform = tform + string_utils.convert_val(parent.matrix_world @ m2)
-
-        op.append(0)  # blob operation:add
-        op.append(count)
-        for n in range(count):
-            op.append(n)
+        # only blobby ellipsoids for now...
+        op = np.zeros(count*2 + 2 + count, dtype=np.int32)
+        op[0:count*2:2] = 1001
+        op[1:count*2:2] = np.arange(count) * 16
+        op[count*2] = 0  # blob operation:add
+        op[count*2+1] = count
+        op[count*2+2:] = np.arange(count)
+        op = op.tolist()
+        tform = tform.tolist()
 
         primvar = rman_sg_blobby.sg_node.GetPrimVars()  
         rman_sg_blobby.sg_node.Define(count)
         primvar.SetIntegerArray(self.rman_scene.rman.Tokens.Rix.k_Ri_code, op, len(op))            
         primvar.SetFloatArray(self.rman_scene.rman.Tokens.Rix.k_Ri_floats, tform, len(tform))      
         super().export_object_primvars(ob, primvar)
-        rman_sg_blobby.sg_node.SetPrimVars(primvar)        
+        rman_sg_blobby.sg_node.SetPrimVars(primvar)
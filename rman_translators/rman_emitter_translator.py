@@ -4,6 +4,7 @@ from ..rfb_utils import object_utils
 from ..rfb_utils import transform_utils
 from ..rfb_utils import scenegraph_utils
 from ..rfb_utils import particles_utils
+from ..rfb_utils import prefs_utils
 
 import bpy
 import math
@@ -43,9 +44,12 @@ class RmanEmitterTranslator(RmanTranslator):
         inv_mtx = ob.matrix_world.inverted_safe()
         cur_frame = self.rman_scene.bl_scene.frame_current
         do_motion = do_motion = self.rman_scene.do_motion_blur
-        P, next_P, width = particles_utils.get_particles(ob, psys, inv_mtx, cur_frame, get_next_P=do_motion)
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        particle_data = particles_utils.ParticleData(psys, (cur_frame, cur_frame))
+        P, next_P, width = particles_utils.get_particles(ob, psys, inv_mtx, cur_frame, get_next_P=do_motion,
+                                                         particle_data=particle_data, as_buffer=as_buffer)
 
-        if not P:
+        if len(P) < 1:
             return
 
         rman_sg_emitter.npoints = len(P)
@@ -58,7 +62,8 @@ class RmanEmitterTranslator(RmanTranslator):
             super().set_primvar_times(rman_sg_emitter.motion_steps, primvar)
         
         
-        particles_utils.get_primvars_particle(primvar, cur_frame, psys, [cur_frame], 0)      
+        particles_utils.get_primvars_particle(primvar, cur_frame, psys, [cur_frame], 0,
+                                              particle_data=particle_data, as_buffer=as_buffer)      
         
         if self.rman_scene.do_motion_blur:
             primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, P, "vertex", 0) 
@@ -5,6 +5,7 @@ from ..rfb_utils import transform_utils
 from ..rfb_utils import string_utils
 from ..rfb_utils import scenegraph_utils
 from ..rfb_utils import particles_utils
+from ..rfb_utils import prefs_utils
 from ..rfb_utils import object_utils
 from ..rfb_utils import mesh_utils
 from ..rfb_logger import rfb_log
@@ -149,9 +150,12 @@ class RmanFluidTranslator(RmanTranslator):
         inv_mtx = ob.matrix_world.inverted_safe()
         cur_frame = self.rman_scene.bl_scene.frame_current
         do_motion = self.rman_scene.do_motion_blur
-        P, next_P, width = particles_utils.get_particles(ob, psys, inv_mtx, cur_frame, get_next_P=do_motion)        
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        particle_data = particles_utils.ParticleData(psys, (cur_frame, cur_frame))
+        P, next_P, width = particles_utils.get_particles(ob, psys, inv_mtx, cur_frame, get_next_P=do_motion,
+                                                         particle_data=particle_data, as_buffer=as_buffer)        
 
-        if not P:
+        if len(P) < 1:
             return
 
         nm_pts = len(P)
@@ -163,7 +167,8 @@ class RmanFluidTranslator(RmanTranslator):
         if do_motion and rman_sg_fluid.motion_steps:
             super().set_primvar_times(rman_sg_fluid.motion_steps, primvar)
         
-        particles_utils.get_primvars_particle(primvar, cur_frame, psys, [cur_frame], 0)      
+        particles_utils.get_primvars_particle(primvar, cur_frame, psys, [cur_frame], 0,
+                                              particle_data=particle_data, as_buffer=as_buffer)      
         
         if do_motion:
             primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, P, "vertex", 0) 
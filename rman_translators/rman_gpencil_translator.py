@@ -3,6 +3,8 @@ from ..rman_sg_nodes.rman_sg_gp import RmanSgGreaseP
 from ..rfb_utils import object_utils
 from ..rfb_utils import string_utils
 from ..rfb_utils import scenegraph_utils
+from ..rfb_utils import curve_utils
+from ..rfb_utils import prefs_utils
 from ..rfb_logger import rfb_log
 from mathutils import Vector, Matrix
 
@@ -14,6 +16,26 @@ _BIAS_ = 0.0000001
 _ADJUST_POINT_ = False
 _ADJUST_IN_NORMAL_DIR_FOR_FILLS_ = False
 
+def _get_stroke_points_(stroke, attr, ncomps):
+    num_pts = len(stroke.points)
+    data = np.zeros(num_pts*ncomps, dtype=np.float32)
+    if num_pts > 0:
+        stroke.points.foreach_get(attr, data)
+    if ncomps > 1:
+        data = np.reshape(data, (num_pts, ncomps))
+    return data
+
+def _get_triangles_(stroke):
+    # the corners of a triangle are separate int properties,
+    # so read them in bulk one corner at a time
+    num_tris = len(stroke.triangles)
+    tris = np.zeros((num_tris, 3), dtype=np.int32)
+    corner = np.zeros(num_tris, dtype=np.int32)
+    for k, attr in enumerate(('v1', 'v2', 'v3')):
+        stroke.triangles.foreach_get(attr, corner)
+        tris[:, k] = corner
+    return tris
+
 class RmanGPencilTranslator(RmanTranslator):
 
     def __init__(self, rman_scene):
@@ -42,8 +64,6 @@ class RmanGPencilTranslator(RmanTranslator):
         gp_ob = ob.data     
 
         pts = stroke.points
-        nverts = []
-        verts = []
         st = []
 
         mesh_sg = self.rman_scene.sg_scene.CreateMesh('%s-MESH-%d' % (lyr.info, i))
@@ -61,40 +81,39 @@ class RmanGPencilTranslator(RmanTranslator):
             st = np.reshape(st, (num_pts, 2))
             st = st.tolist()                
 
-        for t in stroke.triangles:
-            nverts.append(3)
-            verts.append(t.v1)
-            verts.append(t.v2)
-            verts.append(t.v3)       
+        tris = _get_triangles_(stroke)
+        nverts = [3] * len(tris)
+        verts = tris.ravel().tolist()
 
-            if adjust_point:
+        if adjust_point:
+            for v1, v2, v3 in tris.tolist():
 
                 if _ADJUST_IN_NORMAL_DIR_FOR_FILLS_:
                     # move each point in the normal direction a little bit
                     # for fills                
-                    p1 = Vector(pts[t.v1].co)
-                    p2 = Vector(pts[t.v2].co)
-                    p3 = Vector(pts[t.v3].co)
+                    p1 = Vector(pts[v1].co)
+                    p2 = Vector(pts[v2].co)
+                    p3 = Vector(pts[v3].co)
                     vec1 = p1 - p2
                     vec2 = p1 - p3
                     normal = vec2.cross(vec1).normalized()
                     epsilon = normal * i * _BIAS_
 
-                    P[t.v1] = Vector(P[t.v1]) + epsilon
-                    P[t.v2] = Vector(P[t.v2]) + epsilon
-                    P[t.v3] = Vector(P[t.v3]) + epsilon
+                    P[v1] = Vector(P[v1]) + epsilon
+                    P[v2] = Vector(P[v2]) + epsilon
+                    P[v3] = Vector(P[v3]) + epsilon
 
                 else:
                     # get camera position
                     cam_pos, rot, sca = self.rman_scene.main_camera.bl_camera.matrix_world.decompose()
 
                     epsilon = i * _BIAS_
-                    P[t.v1] = Vector(P[t.v1]) + ((cam_pos - Vector(P[t.v1])).normalized() * epsilon)
-                    P[t.v2] = Vector(P[t.v2]) + ((cam_pos - Vector(P[t.v2])).normalized() * epsilon)
-                    P[t.v3] = Vector(P[t.v3]) + ((cam_pos - Vector(P[t.v3])).normalized() * epsilon)
+                    P[v1] = Vector(P[v1]) + ((cam_pos - Vector(P[v1])).normalized() * epsilon)
+                    P[v2] = Vector(P[v2]) + ((cam_pos - Vector(P[v2])).normalized() * epsilon)
+                    P[v3] = Vector(P[v3]) + ((cam_pos - Vector(P[v3])).normalized() * epsilon)
 
 
-        num_polygons = len(stroke.triangles)
+        num_polygons = len(tris)
         num_verts = len(verts)
         mesh_sg.Define( num_polygons, num_pts, num_verts )
                             
@@ -146,7 +165,7 @@ class RmanGPencilTranslator(RmanTranslator):
 
         # Attach material
         if rman_sg_material:
-            scenegraph_utils.set_material(points_sg, rman_sg_material.sg_strok_mat)
+            scenegraph_utils.set_material(points_sg, rman_sg_material.sg_stroke_mat)
 
         rman_sg_gpencil.sg_node.AddChild(points_sg)                     
         
@@ -205,8 +224,171 @@ class RmanGPencilTranslator(RmanTranslator):
 
         rman_sg_gpencil.sg_node.AddChild(curves_sg)    
 
+    def _create_batched_mesh(self, ob, lyr, mat_index, strokes, rman_sg_gpencil, rman_sg_material, as_buffer=True):
+        P = []
+        st = []
+        verts = []
+        stroke_index = []
+        offset = 0
+        has_st = hasattr(strokes[0][1].points[0], 'uv_fill')
+
+        for i, stroke in strokes:
+            tris = _get_triangles_(stroke)
+            P.append(_get_stroke_points_(stroke, 'co', 3))
+            if has_st:
+                st.append(_get_stroke_points_(stroke, 'uv_fill', 2))
+            verts.append(tris.ravel() + offset)
+            stroke_index.append(np.full(len(tris), i, dtype=np.int32))
+            offset += len(stroke.points)
+
+        P = np.concatenate(P)
+        verts = np.concatenate(verts)
+        stroke_index = np.concatenate(stroke_index)
+        num_polygons = len(stroke_index)
+        nverts = np.full(num_polygons, 3, dtype=np.int32)
+
+        mesh_sg = self.rman_scene.sg_scene.CreateMesh('%s-MESH-%d' % (lyr.info, mat_index))
+        mesh_sg.Define( num_polygons, len(P), len(verts) )
+
+        primvar = mesh_sg.GetPrimVars()
+        primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, curve_utils.pack_primvar(P, as_buffer), "vertex")
+        primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_nvertices, curve_utils.pack_primvar(nverts, as_buffer), "uniform")
+        primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_vertices, curve_utils.pack_primvar(verts, as_buffer), "facevarying")
+        primvar.SetIntegerDetail("stroke_index", curve_utils.pack_primvar(stroke_index, as_buffer), "uniform")
+        if st:
+            primvar.SetFloatArrayDetail("st", curve_utils.pack_primvar(np.concatenate(st), as_buffer), 2, "vertex")
+        super().export_object_primvars(ob, primvar)
+        mesh_sg.SetPrimVars(primvar)
+        scenegraph_utils.set_material(mesh_sg, rman_sg_material.sg_fill_mat)
+        rman_sg_gpencil.sg_node.AddChild(mesh_sg)
+
+    def _create_batched_points(self, ob, lyr, mat_index, strokes, rman_sg_gpencil, rman_sg_material, as_buffer=True):
+        points = []
+        widths = []
+        stroke_index = []
+
+        for i, stroke in strokes:
+            points.append(_get_stroke_points_(stroke, 'co', 3))
+            widths.append(_get_stroke_points_(stroke, 'pressure', 1) * (0.0012 * stroke.line_width))
+            stroke_index.append(np.full(len(stroke.points), i, dtype=np.int32))
+
+        points = np.concatenate(points)
+        widths = np.concatenate(widths)
+        stroke_index = np.concatenate(stroke_index)
+
+        points_sg = self.rman_scene.sg_scene.CreatePoints("%s-DOTS-%d" % (lyr.info, mat_index))
+        points_sg.Define(len(points))
+        primvar = points_sg.GetPrimVars()
+
+        primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, curve_utils.pack_primvar(points, as_buffer), "vertex")
+        primvar.SetFloatDetail(self.rman_scene.rman.Tokens.Rix.k_width, curve_utils.pack_primvar(widths, as_buffer), "vertex")
+        # each point is its own primitive, so the stroke index is per vertex
+        primvar.SetIntegerDetail("stroke_index", curve_utils.pack_primvar(stroke_index, as_buffer), "vertex")
+
+        super().export_object_primvars(ob, primvar)
+        points_sg.SetPrimVars(primvar)
+
+        if rman_sg_material:
+            scenegraph_utils.set_material(points_sg, rman_sg_material.sg_stroke_mat)
+
+        rman_sg_gpencil.sg_node.AddChild(points_sg)
+
+    def _create_batched_curves(self, ob, lyr, mat_index, strokes, rman_sg_gpencil, rman_sg_material, as_buffer=True):
+        points = []
+        widths = []
+        nvertices = np.zeros(len(strokes), dtype=np.int32)
+        stroke_index = np.zeros(len(strokes), dtype=np.int32)
+
+        for j, (i, stroke) in enumerate(strokes):
+            P = _get_stroke_points_(stroke, 'co', 3)
+            width = _get_stroke_points_(stroke, 'pressure', 1) * (0.00083 * stroke.line_width)
+
+            # double the first and last
+            points.append(np.concatenate((P[:1], P, P[-1:])))
+            widths.append(np.concatenate((width[:1], width, width[-1:])))
+            nvertices[j] = len(P) + 2
+            stroke_index[j] = i
+
+        points = np.concatenate(points)
+        widths = np.concatenate(widths)
+
+        curves_sg = self.rman_scene.sg_scene.CreateCurves("%s-STROKE-%d" % (lyr.info, mat_index))
+        curves_sg.Define(self.rman_scene.rman.Tokens.Rix.k_cubic, "nonperiodic", "catmull-rom", len(nvertices), len(points))
+        primvar = curves_sg.GetPrimVars()
+
+        primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, curve_utils.pack_primvar(points, as_buffer), "vertex")
+        primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_nvertices, curve_utils.pack_primvar(nvertices, as_buffer), "uniform")
+        primvar.SetIntegerDetail("index", curve_utils.pack_primvar(np.arange(len(nvertices), dtype=np.int32), as_buffer), "uniform")
+        primvar.SetIntegerDetail("stroke_index", curve_utils.pack_primvar(stroke_index, as_buffer), "uniform")
+        primvar.SetFloatDetail(self.rman_scene.rman.Tokens.Rix.k_width, curve_utils.pack_primvar(widths, as_buffer), "vertex")
+
+        super().export_object_primvars(ob, primvar)
+        curves_sg.SetPrimVars(primvar)
+
+        if rman_sg_material:
+            scenegraph_utils.set_material(curves_sg, rman_sg_material.sg_stroke_mat)
+
+        rman_sg_gpencil.sg_node.AddChild(curves_sg)
+
+    def _get_batched_strokes_(self, ob, rman_sg_gpencil):
+        '''
+        Merge all of the strokes of a layer that use the same material into
+        one mesh for the fills, and one curves or points primitive for the
+        strokes. The index of each stroke within its layer frame is exported
+        in the "stroke_index" primvar.
+        '''
+
+        gp_ob = ob.data
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+
+        for nm,lyr in gp_ob.layers.items():
+            if lyr.hide:
+                continue
+
+            frame = lyr.active_frame
+            if not frame:
+                continue
+
+            materials = dict()
+            fills = dict()
+            curves = dict()
+            dots = dict()
+            for i, stroke in enumerate(frame.strokes):
+                if len(stroke.points) < 1:
+                    continue
+                mat_index = stroke.material_index
+                mat = gp_ob.materials[mat_index]
+                if mat.grease_pencil.hide:
+                    continue
+                rman_sg_material = self.rman_scene.rman_materials.get(mat.original, None)
+                materials[mat_index] = rman_sg_material
+
+                if len(stroke.triangles) > 0 and rman_sg_material and rman_sg_material.sg_fill_mat:
+                    fills.setdefault(mat_index, []).append((i, stroke))
+                    if not rman_sg_material.sg_stroke_mat:
+                        continue
+
+                # strokes with less than 2 points are not enough to be
+                # a curve, and are exported as points
+                if mat.grease_pencil.mode in ['DOTS', 'BOX'] or len(stroke.points) < 2:
+                    dots.setdefault(mat_index, []).append((i, stroke))
+                else:
+                    curves.setdefault(mat_index, []).append((i, stroke))
+
+            for mat_index, strokes in fills.items():
+                self._create_batched_mesh(ob, lyr, mat_index, strokes, rman_sg_gpencil, materials[mat_index], as_buffer=as_buffer)
+            for mat_index, strokes in dots.items():
+                self._create_batched_points(ob, lyr, mat_index, strokes, rman_sg_gpencil, materials[mat_index], as_buffer=as_buffer)
+            for mat_index, strokes in curves.items():
+                self._create_batched_curves(ob, lyr, mat_index, strokes, rman_sg_gpencil, materials[mat_index], as_buffer=as_buffer)
+
     def _get_strokes_(self, ob, rman_sg_gpencil):
 
+        if prefs_utils.get_pref('rman_gpencil_batch_strokes', default=True) and not _ADJUST_POINT_:
+            # the per stroke bias is not supported when strokes are batched
+            self._get_batched_strokes_(ob, rman_sg_gpencil)
+            return
+
         gp_ob = ob.data
 
         j = 0
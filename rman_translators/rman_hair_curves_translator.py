@@ -1,9 +1,10 @@
 from .rman_translator import RmanTranslator
 from ..rfb_utils import transform_utils
 from ..rfb_utils import scenegraph_utils
+from ..rfb_utils import curve_utils
+from ..rfb_utils import prefs_utils
 from ..rfb_logger import rfb_log
 from ..rman_sg_nodes.rman_sg_haircurves import RmanSgHairCurves
-from mathutils import Vector
 import math
 import bpy    
 import numpy as np
@@ -18,6 +19,15 @@ class BlHair:
         self.index = []
         self.bl_hair_attributes = []
 
+    def pack(self, as_buffer=True):
+        self.points = curve_utils.pack_primvar(self.points, as_buffer)
+        self.vertsArray = curve_utils.pack_primvar(self.vertsArray, as_buffer)
+        self.hair_width = curve_utils.pack_primvar(self.hair_width, as_buffer)
+        self.index = curve_utils.pack_primvar(self.index, as_buffer)
+        for hair_attr in self.bl_hair_attributes:
+            hair_attr.values = curve_utils.pack_primvar(hair_attr.values, as_buffer)
+        return self
+
 class BlHairAttribute:
 
     def __init__(self):
@@ -47,14 +57,35 @@ class RmanHairCurvesTranslator(RmanTranslator):
                 rman_sg_hair.sg_curves_list.clear()   
 
     def export_deform_sample(self, rman_sg_hair, ob, time_sample):
-        curves = self._get_strands_(ob)
-        for i, bl_curve in enumerate(curves):
+        db = ob.data
+        npoints = len(db.points)
+        offsets = self._get_curve_offsets_(db)
+        if rman_sg_hair.curve_offsets is None or not np.array_equal(offsets, rman_sg_hair.curve_offsets) \
+            or len(rman_sg_hair.chunk_ranges) != len(rman_sg_hair.sg_curves_list):
+            # the curves changed between time samples, turn off deformation blur
+            for curves_sg in rman_sg_hair.sg_curves_list:
+                primvar = curves_sg.GetPrimVars()
+                primvar.SetTimes([])
+                curves_sg.SetPrimVars(primvar)
+            rman_sg_hair.is_deforming = False
+            return
+
+        # only read the positions, into the array allocated for the first sample
+        if rman_sg_hair.deform_points is None or len(rman_sg_hair.deform_points) != npoints:
+            rman_sg_hair.deform_points = np.zeros((npoints, 3), dtype=np.float32)
+        db.points.foreach_get('position', np.reshape(rman_sg_hair.deform_points, -1))
+        points = rman_sg_hair.deform_points
+        if rman_sg_hair.point_mask is not None:
+            points = points[rman_sg_hair.point_mask]
+
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        for i, (first, last, first_vtx, last_vtx) in enumerate(rman_sg_hair.chunk_ranges):
             curves_sg = rman_sg_hair.sg_curves_list[i]
             if not curves_sg:
                 continue
             primvar = curves_sg.GetPrimVars()
-
-            primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, bl_curve.points, "vertex", time_sample)  
+            P = curve_utils.pack_primvar(points[first_vtx:last_vtx], as_buffer)
+            primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, P, "vertex", time_sample)  
             curves_sg.SetPrimVars(primvar)
 
     def update(self, ob, rman_sg_hair):
@@ -62,14 +93,19 @@ class RmanHairCurvesTranslator(RmanTranslator):
             if rman_sg_hair.sg_node.GetNumChildren() > 0:
                 self.clear_children(ob, rman_sg_hair)
 
-        curves = self._get_strands_(ob)
+        curves = self._get_strands_(ob, rman_sg_hair)
         if not curves:
             return
 
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+
         for i, bl_curve in enumerate(curves):
+            bl_curve.pack(as_buffer)
             curves_sg = self.rman_scene.sg_scene.CreateCurves("%s-%d" % (rman_sg_hair.db_name, i))
             curves_sg.Define(self.rman_scene.rman.Tokens.Rix.k_cubic, "nonperiodic", "catmull-rom", len(bl_curve.vertsArray), len(bl_curve.points))
             primvar = curves_sg.GetPrimVars()                  
+            if rman_sg_hair.is_deforming and len(rman_sg_hair.deform_motion_steps) > 1:
+                super().set_primvar_times(rman_sg_hair.deform_motion_steps, primvar)
             primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, bl_curve.points, "vertex")
 
             primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_nvertices, bl_curve.vertsArray, "uniform")
@@ -82,47 +118,52 @@ class RmanHairCurvesTranslator(RmanTranslator):
             for hair_attr in bl_curve.bl_hair_attributes:
                 if hair_attr.rman_detail is None:
                     continue
+                values = hair_attr.values
                 if hair_attr.rman_type == "float":
-                    primvar.SetFloatDetail(hair_attr.rman_name, hair_attr.values, hair_attr.rman_detail)
+                    primvar.SetFloatDetail(hair_attr.rman_name, values, hair_attr.rman_detail)
                 elif hair_attr.rman_type == "float2":
-                    primvar.SetFloatArrayDetail(hair_attr.rman_name, hair_attr.values, 2, hair_attr.rman_detail)
+                    primvar.SetFloatArrayDetail(hair_attr.rman_name, values, 2, hair_attr.rman_detail)
                 elif hair_attr.rman_type == "vector":
-                    primvar.SetVectorDetail(hair_attr.rman_name, hair_attr.values, hair_attr.rman_detail)
+                    primvar.SetVectorDetail(hair_attr.rman_name, values, hair_attr.rman_detail)
                 elif hair_attr.rman_type == 'color':
-                    primvar.SetColorDetail(hair_attr.rman_name, hair_attr.values, hair_attr.rman_detail)
+                    primvar.SetColorDetail(hair_attr.rman_name, values, hair_attr.rman_detail)
                 elif hair_attr.rman_type == 'integer':
-                    primvar.SetIntegerDetail(hair_attr.rman_name, hair_attr.values, hair_attr.rman_detail)
+                    primvar.SetIntegerDetail(hair_attr.rman_name, values, hair_attr.rman_detail)
                     
             curves_sg.SetPrimVars(primvar)
             rman_sg_hair.sg_node.AddChild(curves_sg)  
             rman_sg_hair.sg_curves_list.append(curves_sg)
         
-    def get_attributes(self, ob, bl_curve):
+    def get_attributes(self, ob, point_mask=None, curve_mask=None):
+        '''
+        Read every attribute of the Curves object once. If point_mask and curve_mask
+        are given, only the values of the points and curves that are exported are kept.
+        '''
+        bl_hair_attributes = []
+        npoints = len(ob.data.points)
+        ncurves = len(ob.data.curves)
         for attr in ob.data.attributes:
             if attr.name in ['position']:
                 continue
             hair_attr = None
+            nvalues = len(attr.data)
             if attr.data_type == 'FLOAT2':
                 hair_attr = BlHairAttribute()
                 hair_attr.rman_name = attr.name
                 hair_attr.rman_type = 'float2'
 
-                npoints = len(attr.data)
-                values = np.zeros(npoints*2, dtype=np.float32)
+                values = np.zeros(nvalues*2, dtype=np.float32)
                 attr.data.foreach_get('vector', values)
-                values = np.reshape(values, (npoints, 2))
-                hair_attr.values = values.tolist()
+                hair_attr.values = np.reshape(values, (nvalues, 2))
 
             elif attr.data_type == 'FLOAT_VECTOR':
                 hair_attr = BlHairAttribute()
                 hair_attr.rman_name = attr.name
                 hair_attr.rman_type = 'vector'
 
-                npoints = len(attr.data)
-                values = np.zeros(npoints*3, dtype=np.float32)
+                values = np.zeros(nvalues*3, dtype=np.float32)
                 attr.data.foreach_get('vector', values)
-                values = np.reshape(values, (npoints, 3))
-                hair_attr.values = values.tolist()
+                hair_attr.values = np.reshape(values, (nvalues, 3))
             
             elif attr.data_type in ['BYTE_COLOR', 'FLOAT_COLOR']:
                 hair_attr = BlHairAttribute()
@@ -131,11 +172,10 @@ class RmanHairCurvesTranslator(RmanTranslator):
                     hair_attr.rman_name = 'Cs'
                 hair_attr.rman_type = 'color'
 
-                npoints = len(attr.data)
-                values = np.zeros(npoints*4, dtype=np.float32)
+                values = np.zeros(nvalues*4, dtype=np.float32)
                 attr.data.foreach_get('color', values)
-                values = np.reshape(values, (npoints, 4))
-                hair_attr.values .extend(values[0:, 0:3].tolist())
+                values = np.reshape(values, (nvalues, 4))
+                hair_attr.values = np.ascontiguousarray(values[:, 0:3])
 
             elif attr.data_type == 'FLOAT':
                 hair_attr = BlHairAttribute()
@@ -143,75 +183,110 @@ class RmanHairCurvesTranslator(RmanTranslator):
                 hair_attr.rman_type = 'float'
                 hair_attr.array_len = -1
 
-                npoints = len(attr.data)
-                values = np.zeros(npoints, dtype=np.float32)
+                values = np.zeros(nvalues, dtype=np.float32)
                 attr.data.foreach_get('value', values)
-                hair_attr.values = values.tolist()                          
+                hair_attr.values = values
             elif attr.data_type in ['INT8', 'INT']:
                 hair_attr = BlHairAttribute()
                 hair_attr.rman_name = attr.name
                 hair_attr.rman_type = 'integer'
                 hair_attr.array_len = -1
 
-                npoints = len(attr.data)
-                values = np.zeros(npoints, dtype=np.int32)
+                values = np.zeros(nvalues, dtype=np.int32)
                 attr.data.foreach_get('value', values)
-                hair_attr.values = values.tolist()                
+                hair_attr.values = values
             
             if hair_attr:
-                bl_curve.bl_hair_attributes.append(hair_attr)
-                if len(attr.data) == len(ob.data.curves):
+                bl_hair_attributes.append(hair_attr)
+                if nvalues == ncurves:
                     hair_attr.rman_detail = 'uniform'
-                elif len(attr.data) == len(ob.data.points):
-                    hair_attr.rman_detail = 'vertex'        
+                    if curve_mask is not None:
+                        hair_attr.values = hair_attr.values[curve_mask]
+                elif nvalues == npoints:
+                    hair_attr.rman_detail = 'vertex'
+                    if point_mask is not None:
+                        hair_attr.values = hair_attr.values[point_mask]
 
-    def _get_strands_(self, ob):
+        return bl_hair_attributes
+
+    def _get_curve_offsets_(self, db):
+        offsets = np.zeros(len(db.curve_offset_data), dtype=np.int32)
+        db.curve_offset_data.foreach_get('value', offsets)
+        return offsets
+
+    def _get_strands_(self, ob, rman_sg_hair=None):
 
-        curve_sets = []
-        bl_curve = BlHair()
         db = ob.data
-        for curve in db.curves:
-            if curve.points_length < 4:
-                continue
+        npoints = len(db.points)
+        ncurves = len(db.curves)
+        if rman_sg_hair:
+            rman_sg_hair.curve_offsets = None
+            rman_sg_hair.point_mask = None
+            rman_sg_hair.chunk_ranges = list()
+            rman_sg_hair.deform_points = None
+        if npoints < 1 or ncurves < 1:
+            return []
+
+        points = np.zeros(npoints*3, dtype=np.float32)
+        widths = np.zeros(npoints, dtype=np.float32)
+        db.points.foreach_get('position', points)
+        db.points.foreach_get('radius', widths)
+        offsets = self._get_curve_offsets_(db)
+        points = np.reshape(points, (npoints, 3))
+        nvertices = np.diff(offsets)
+        curve_ids = np.repeat(np.arange(ncurves), nvertices)
+
+        # radius is 0. Default to 0.005
+        no_radius = np.bincount(curve_ids, weights=(widths != 0), minlength=ncurves) == 0
+        widths[no_radius[curve_ids]] = 0.005
+        widths = widths * 2
+
+        # skip curves with less than 4 points
+        curve_mask = nvertices >= 4
+        point_mask = None
+        curve_index = np.arange(ncurves, dtype=np.int32)
+        if not np.all(curve_mask):
+            point_mask = curve_mask[curve_ids]
+            points = points[point_mask]
+            widths = widths[point_mask]
+            nvertices = nvertices[curve_mask]
+            curve_index = curve_index[curve_mask]
+        else:
+            curve_mask = None
+        if len(nvertices) < 1:
+            return []
+
+        bl_hair_attributes = self.get_attributes(ob, point_mask=point_mask, curve_mask=curve_mask)
+
+        # if we get more than chunk_size vertices, start a new BlHair. This
+        # is to avoid a maxint on the array length
+        chunk_size = prefs_utils.get_pref('rman_hair_chunk_size', default=100000)
+        chunk_ranges = curve_utils.get_chunk_ranges(nvertices, chunk_size)
+        if rman_sg_hair:
+            rman_sg_hair.curve_offsets = offsets
+            rman_sg_hair.point_mask = point_mask
+            rman_sg_hair.chunk_ranges = chunk_ranges
+            if rman_sg_hair.is_deforming:
+                rman_sg_hair.deform_points = np.empty((npoints, 3), dtype=np.float32)
 
-            npoints = len(curve.points)
-            strand_points = np.zeros(npoints*3, dtype=np.float32)
-            widths = np.zeros(npoints, dtype=np.float32)
-            curve.points.foreach_get('position', strand_points)
-            curve.points.foreach_get('radius', widths)
-            strand_points = np.reshape(strand_points, (npoints, 3))
-            if np.count_nonzero(widths) == 0:
-                # radius is 0. Default to 0.005
-                widths.fill(0.005)
-            widths = widths * 2
-            strand_points = strand_points.tolist()
-            widths = widths.tolist()
-
-            '''
-            # do we really need to double the end points?
-            strand_points = strand_points[:1] + \
-                strand_points + strand_points[-1:]
-
-            widths = widths[:1] + widths + widths[-1:]
-            '''
-            vertsInStrand = len(strand_points)
-
-            bl_curve.points.extend(strand_points)
-            bl_curve.vertsArray.append(vertsInStrand)
-            bl_curve.hair_width.extend(widths)
-            bl_curve.index.append(curve.index)
-            bl_curve.nverts += vertsInStrand           
-               
-            # if we get more than 100000 vertices, start a new BlHair.  This
-            # is to avoid a maxint on the array length
-            if bl_curve.nverts > 100000:
-                self.get_attributes(ob, bl_curve)
-                curve_sets.append(bl_curve)
-                bl_curve = BlHair()
-
-        if bl_curve.nverts > 0:       
-            self.get_attributes(ob, bl_curve)
+        curve_sets = []
+        for (first, last, first_vtx, last_vtx) in chunk_ranges:
+            bl_curve = BlHair()
+            bl_curve.points = points[first_vtx:last_vtx]
+            bl_curve.vertsArray = nvertices[first:last]
+            bl_curve.hair_width = widths[first_vtx:last_vtx]
+            bl_curve.index = curve_index[first:last]
+            bl_curve.nverts = last_vtx - first_vtx
+            for hair_attr in bl_hair_attributes:
+                chunk_attr = BlHairAttribute()
+                chunk_attr.rman_type = hair_attr.rman_type
+                chunk_attr.rman_name = hair_attr.rman_name
+                chunk_attr.rman_detail = hair_attr.rman_detail
+                if hair_attr.rman_detail == 'uniform':
+                    chunk_attr.values = hair_attr.values[first:last]
+                elif hair_attr.rman_detail == 'vertex':
+                    chunk_attr.values = hair_attr.values[first_vtx:last_vtx]
+                bl_curve.bl_hair_attributes.append(chunk_attr)
             curve_sets.append(bl_curve)
 
-        return curve_sets              
-            
\ No newline at end of file
+        return curve_sets
@@ -1,9 +1,10 @@
 from .rman_translator import RmanTranslator
 from ..rfb_utils import transform_utils
 from ..rfb_utils import scenegraph_utils
+from ..rfb_utils import curve_utils
+from ..rfb_utils import prefs_utils
 from ..rfb_logger import rfb_log
 from ..rman_sg_nodes.rman_sg_hair import RmanSgHair
-from mathutils import Vector
 import math
 import bpy    
 import numpy as np
@@ -18,10 +19,22 @@ class BlHair:
         self.mcols = []
         self.nverts = 0
         self.hair_width = []
+        self.index = []
 
     @property
     def constant_width(self):
         return (len(self.hair_width) < 2)
+
+    def pack(self, as_buffer=True):
+        self.points = curve_utils.pack_primvar(self.points, as_buffer)
+        self.next_points = curve_utils.pack_primvar(self.next_points, as_buffer)
+        self.vertsArray = curve_utils.pack_primvar(self.vertsArray, as_buffer)
+        self.index = curve_utils.pack_primvar(np.arange(len(self.vertsArray), dtype=np.int32), as_buffer)
+        self.hair_width = curve_utils.pack_primvar(self.hair_width, as_buffer)
+        self.scalpST = curve_utils.pack_primvar(self.scalpST, as_buffer)
+        self.mcols = curve_utils.pack_primvar(self.mcols, as_buffer)
+        return self
+
 class RmanHairTranslator(RmanTranslator):
 
     def __init__(self, rman_scene):
@@ -69,8 +82,11 @@ class RmanHairTranslator(RmanTranslator):
         if not curves:
             return
 
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+
         ob_inv_mtx = transform_utils.convert_matrix(ob.matrix_world.inverted_safe())
         for i, bl_curve in enumerate(curves):
+            bl_curve.pack(as_buffer)
             curves_sg = self.rman_scene.sg_scene.CreateCurves("%s-%d" % (rman_sg_hair.db_name, i))
             curves_sg.SetTransform(ob_inv_mtx) # puts points in object space
             curves_sg.Define(self.rman_scene.rman.Tokens.Rix.k_cubic, "nonperiodic", "catmull-rom", len(bl_curve.vertsArray), len(bl_curve.points))
@@ -88,7 +104,7 @@ class RmanHairTranslator(RmanTranslator):
             index_nm = psys.settings.renderman.hair_index_name
             if index_nm == '':
                 index_nm = 'index'
-            primvar.SetIntegerDetail(index_nm, range(len(bl_curve.vertsArray)), "uniform")
+            primvar.SetIntegerDetail(index_nm, bl_curve.index, "uniform")
 
             width_detail = "vertex"
             if bl_curve.constant_width:
@@ -168,21 +184,28 @@ class RmanHairTranslator(RmanTranslator):
                     mcol_set = i
                     break            
 
-        curve_sets = []
-        bl_curve = BlHair()
-        if conwidth:
-            bl_curve.hair_width.append(base_width)
-        
         start_idx = 0
         if psys.settings.child_type != 'NONE' and num_children > 0:
             start_idx = num_parents
-        
+
+        if num_parents < 1 or total_hair_count <= start_idx:
+            return []
+
+        # preallocate for the worst case, where every strand has all of its
+        # steps, plus the doubled first and last points. Strands that are
+        # too short are skipped by not advancing the write position.
+        max_strands = total_hair_count - start_idx
+        points = np.empty(((steps+2) * max_strands, 3), dtype=np.float32)
+        nvertices = np.empty(max_strands, dtype=np.int32)
+        strand_ids = np.empty(max_strands, dtype=np.int64)
+        scalpST = np.empty((max_strands, 2), dtype=np.float32) if export_st else None
+        mcols = np.empty((max_strands, 3), dtype=np.float32) if export_mcol else None
+
+        nstrands = 0
+        vtx = 0
         for pindex in range(start_idx, total_hair_count):
-            particle = psys.particles[
-                (pindex - num_parents) % num_parents]           
-            strand_points = []
-            next_strand_points = []
-            # walk through each strand
+            # walk through each strand, leaving room for the doubled first point
+            npts = 0
             for step in range(0, steps):           
                 pt = psys.co_hair(ob, particle_no=pindex, step=step)
 
@@ -190,57 +213,78 @@ class RmanHairTranslator(RmanTranslator):
                     # this strand ends prematurely                    
                     break                
 
-                strand_points.append(pt)
+                points[vtx + 1 + npts] = pt
+                npts += 1
 
-            if len(strand_points) < 2:
-                # not enought points
+            if npts < 2:
+                # not enough points. Catmull-rom requires at least 4 vertices,
+                # including the doubled first and last points
                 continue
 
             # double the first and last
-            strand_points = strand_points[:1] + \
-                strand_points + strand_points[-1:]
-                
-            vertsInStrand = len(strand_points)
+            points[vtx] = points[vtx + 1]
+            points[vtx + npts + 1] = points[vtx + npts]
 
-            # catmull-rom requires at least 4 vertices
-            if vertsInStrand < 4:
-                continue
-
-            if self.rman_scene.do_motion_blur:
-                # calculate the points for the next frame using velocity
-                vel = Vector(particle.velocity / particle.lifetime )
-                next_strand_points = [p + vel for p in strand_points]
-
-            # for varying width make the width array
-            if not conwidth:
-                decr = (base_width - tip_width) / (vertsInStrand - 2)
-                bl_curve.hair_width.extend([base_width] + [(base_width - decr * i)
-                                                for i in range(vertsInStrand - 2)] +
-                                [tip_width])
-
-            bl_curve.points.extend(strand_points)
-            bl_curve.next_points.extend(next_strand_points)
-            bl_curve.vertsArray.append(vertsInStrand)
-            bl_curve.nverts += vertsInStrand
+            vertsInStrand = npts + 2
+            nvertices[nstrands] = vertsInStrand
+            strand_ids[nstrands] = pindex
                
             # get the scalp ST
             if export_st:
-                st = psys.uv_on_emitter(psys_modifier, particle=particle, particle_no=pindex, uv_no=uv_set)
-                bl_curve.scalpST.append(st)
+                particle = psys.particles[(pindex - num_parents) % num_parents]
+                scalpST[nstrands] = psys.uv_on_emitter(psys_modifier, particle=particle, particle_no=pindex, uv_no=uv_set)
 
             # get mcol
             if export_mcol:                 
-                mcol = psys.mcol_on_emitter(psys_modifier, particle=particle, particle_no=pindex, vcol_no=mcol_set)
-                bl_curve.mcols.append(mcol)
-
-            # if we get more than 100000 vertices, start a new BlHair.  This
-            # is to avoid a maxint on the array length
-            if bl_curve.nverts > 100000:
-                curve_sets.append(bl_curve)
-                bl_curve = BlHair()
-
-        if bl_curve.nverts > 0:       
+                particle = psys.particles[(pindex - num_parents) % num_parents]
+                mcols[nstrands] = psys.mcol_on_emitter(psys_modifier, particle=particle, particle_no=pindex, vcol_no=mcol_set)
+
+            nstrands += 1
+            vtx += vertsInStrand
+
+        if nstrands < 1:
+            return []
+
+        points = points[:vtx]
+        nvertices = nvertices[:nstrands]
+        strand_ids = strand_ids[:nstrands]
+
+        next_points = None
+        if self.rman_scene.do_motion_blur:
+            # calculate the points for the next frame using velocity
+            velocity = np.zeros(num_parents*3, dtype=np.float32)
+            lifetime = np.zeros(num_parents, dtype=np.float32)
+            psys.particles.foreach_get('velocity', velocity)
+            psys.particles.foreach_get('lifetime', lifetime)
+            velocity = np.reshape(velocity, (num_parents, 3)) / lifetime[:, None]
+            parents = (strand_ids - num_parents) % num_parents
+            next_points = points + np.repeat(velocity[parents], nvertices, axis=0)
+
+        # for varying width make the width array
+        hair_width = [base_width]
+        if not conwidth:
+            starts, local_index = curve_utils.get_strand_offsets(nvertices)
+            decr = np.repeat((base_width - tip_width) / (nvertices - 2), nvertices)
+            hair_width = (base_width - decr * (local_index - 1)).astype(np.float32)
+            hair_width[starts] = base_width
+            hair_width[starts + nvertices - 1] = tip_width
+
+        # if we get more than chunk_size vertices, start a new BlHair. This
+        # is to avoid a maxint on the array length
+        chunk_size = prefs_utils.get_pref('rman_hair_chunk_size', default=100000)
+        curve_sets = []
+        for (first, last, first_vtx, last_vtx) in curve_utils.get_chunk_ranges(nvertices, chunk_size):
+            bl_curve = BlHair()
+            bl_curve.points = points[first_vtx:last_vtx]
+            if next_points is not None:
+                bl_curve.next_points = next_points[first_vtx:last_vtx]
+            bl_curve.vertsArray = nvertices[first:last]
+            bl_curve.nverts = last_vtx - first_vtx
+            bl_curve.hair_width = hair_width if conwidth else hair_width[first_vtx:last_vtx]
+            if export_st:
+                bl_curve.scalpST = scalpST[first:last]
+            if export_mcol:
+                bl_curve.mcols = mcols[first:last]
             curve_sets.append(bl_curve)
 
-        return curve_sets              
-            
\ No newline at end of file
+        return curve_sets
@@ -6,6 +6,7 @@ from ..rfb_utils import shadergraph_utils
 from ..rfb_utils import color_utils
 from ..rfb_utils import gpmaterial_utils
 from ..rfb_utils import filepath_utils
+from ..rfb_utils import texture_utils
 from ..rfb_utils.shadergraph_utils import RmanConvertNode
 
 from ..rfb_logger import rfb_log
@@ -48,18 +49,32 @@ class RmanMaterialTranslator(RmanTranslator):
         super().__init__(rman_scene)
         self.bl_type = 'MATERIAL'
 
-    def export(self, mat, db_name):
+    def export(self, mat, db_name, fingerprint=None):
 
         sg_material = self.rman_scene.sg_scene.CreateMaterial(db_name)
         rman_sg_material = RmanSgMaterial(self.rman_scene, sg_material, db_name)
-        self.update(mat, rman_sg_material)
+        self.update(mat, rman_sg_material, fingerprint=fingerprint)
         return rman_sg_material
 
-    def update(self, mat, rman_sg_material, time_sample=0):
+    def update(self, mat, rman_sg_material, time_sample=0, fingerprint=None):
 
         rm = mat.renderman
         succeed = False
 
+        # if nothing that goes into the shading network changed, keep the
+        # shaders we already have. Materials with mesh lights also depend on
+        # light groups and light filters, so they are always translated.
+        use_fingerprint = not (mat.grease_pencil or rman_sg_material.has_meshlight)
+        cache_key = None
+        if use_fingerprint and rman_sg_material.fingerprint is not None:
+            # a material that was never translated can't match, so only
+            # compute the fingerprint up front if there's one to compare to
+            cache_key = self._get_cache_key_(mat, rman_sg_material, fingerprint)
+            if cache_key == rman_sg_material.fingerprint:
+                rfb_log().debug("Material %s did not change. Skip translating." % mat.name)
+                return
+        rman_sg_material.fingerprint = None
+
         rman_sg_material.has_meshlight = False
         rman_sg_material.sg_node.SetBxdf(None)        
         rman_sg_material.sg_node.SetLight(None)
@@ -77,6 +92,20 @@ class RmanMaterialTranslator(RmanTranslator):
         if not succeed:
             succeed = self.export_simple_shader(mat, rman_sg_material, mat_handle=handle)     
 
+        if use_fingerprint and not rman_sg_material.has_meshlight:
+            if cache_key is None:
+                cache_key = self._get_cache_key_(mat, rman_sg_material, fingerprint)
+            rman_sg_material.fingerprint = cache_key
+
+    def _get_cache_key_(self, mat, rman_sg_material, fingerprint=None):
+        # the key the last translation is stored under. The output
+        # textures are included, since they are not part of the node tree.
+        if fingerprint is None:
+            fingerprint = shadergraph_utils.get_material_fingerprint(mat)
+        if fingerprint is None:
+            return None
+        return (rman_sg_material.db_name, fingerprint, texture_utils.get_output_textures(mat))
+
     def export_shader_grease_pencil(self, mat, rman_sg_material, handle):
         gp_mat = mat.grease_pencil
         rman_sg_material.is_gp_material = True
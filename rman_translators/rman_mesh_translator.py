@@ -5,6 +5,7 @@ from ..rfb_utils import mesh_utils
 from ..rfb_utils import string_utils
 from ..rfb_utils import property_utils
 from ..rfb_utils import scenegraph_utils
+from ..rfb_utils import prefs_utils
 from ..rfb_logger import rfb_log
 
 import bpy
@@ -12,28 +13,43 @@ import math
 import bmesh
 import numpy as np
 
-def _get_mats_faces_(nverts, material_ids):
+def _get_mats_faces_(material_ids):
+    '''
+    Bucket face ids by material index in one pass.
 
-    mats = {}
-    for face_id, num_verts in enumerate(nverts):
-        mat_id = material_ids[face_id]
-        if mat_id not in mats:
-            mats[mat_id] = []
-        mats[mat_id].append(face_id)
-    return mats
+    Arguments:
+    material_ids (numpy.ndarray) - material index for each face
 
-def _is_multi_material_(ob, mesh):
-    if len(ob.data.materials) < 2 or len(mesh.polygons) == 0:
+    Returns:
+    (dict) - material index to an int32 array of face ids, in ascending order
+    '''
+
+    material_ids = np.asarray(material_ids, dtype=np.int32)
+    # a stable sort keeps the face ids within each faceset in ascending order
+    order = np.argsort(material_ids, kind='stable').astype(np.int32)
+    mat_ids, starts = np.unique(material_ids[order], return_index=True)
+    facesets = np.split(order, starts[1:])
+    return dict(zip(mat_ids.tolist(), facesets))
+
+def _is_multi_material_(ob, material_ids):
+    '''
+    Check if the faces of a mesh use more than one material.
+
+    Arguments:
+    ob (bpy.types.Object) - Blender object
+    material_ids (numpy.ndarray) - material index for each face, see _get_material_ids
+
+    Returns:
+    (bool) - True if the mesh needs more than one faceset
+    '''
+
+    if len(ob.data.materials) < 2 or len(material_ids) == 0:
         return False
 
-    first_mat = mesh.polygons[0].material_index
-    for p in mesh.polygons:
-        if p.material_index != first_mat:
-            return True
-    return False
+    return bool((material_ids != material_ids[0]).any())
 
 # requires facevertex interpolation
-def _get_mesh_uv_(mesh, name="", ob=None):
+def _get_mesh_uv_(mesh, name="", ob=None, as_buffer=False):
     uvs = []
     data = "uv"
     if not name:
@@ -59,13 +75,17 @@ def _get_mesh_uv_(mesh, name="", ob=None):
         return None
 
     uv_count = len(uv_loop_layer.data)
+    if as_buffer:
+        fastuvs = np.zeros(uv_count * 2, dtype=np.float32)
+        uv_loop_layer.data.foreach_get(data, fastuvs)
+        return fastuvs
     fastuvs = np.zeros(uv_count * 2)
     uv_loop_layer.data.foreach_get(data, fastuvs)   
     uvs = fastuvs.tolist()
 
     return uvs
 
-def _get_mesh_vcol_(mesh, name="", ob=None):    
+def _get_mesh_vcol_(mesh, name="", ob=None, as_buffer=False):    
     if not name:
         vcol_layer = mesh.vertex_colors.active
         if ob and not vcol_layer:
@@ -86,6 +106,11 @@ def _get_mesh_vcol_(mesh, name="", ob=None):
         return None
 
     vcol_count = len(vcol_layer.data)
+    if as_buffer:
+        fastvcols = np.zeros(vcol_count * 4, dtype=np.float32)
+        vcol_layer.data.foreach_get("color", fastvcols)
+        fastvcols = np.reshape(fastvcols, (vcol_count, 4))
+        return mesh_utils.to_primvar_buffer(fastvcols[:, :3], ncomps=3)
     fastvcols = np.zeros(vcol_count * 4)
     vcol_layer.data.foreach_get("color", fastvcols)
     fastvcols = np.reshape(fastvcols, (vcol_count, 4))
@@ -95,7 +120,7 @@ def _get_mesh_vcol_(mesh, name="", ob=None):
 
     return cols    
 
-def _get_mesh_vattr_(mesh, name=""):
+def _get_mesh_vattr_(mesh, name="", as_buffer=False):
     if not name in mesh.attributes and mesh != "":
         rfb_log().error("Cannot find color attribute ")
         return None
@@ -106,6 +131,11 @@ def _get_mesh_vattr_(mesh, name=""):
         return None
 
     vcol_count = len(vattr_layer.data)
+    if as_buffer:
+        fastvattrs = np.zeros(vcol_count * 4, dtype=np.float32)
+        vattr_layer.data.foreach_get("color", fastvattrs)
+        fastvattrs = np.reshape(fastvattrs, (vcol_count, 4))
+        return mesh_utils.to_primvar_buffer(fastvattrs[:, :3], ncomps=3)
     fastvattrs = np.zeros(vcol_count * 4)
     vattr_layer.data.foreach_get("color", fastvattrs)
     fastvattrs = np.reshape(fastvattrs, (vcol_count, 4))
@@ -115,27 +145,65 @@ def _get_mesh_vattr_(mesh, name=""):
 
     return attrs 
 
-def _get_mesh_vgroup_(ob, mesh, name=""):
-    vgroup = ob.vertex_groups[name] if name != "" else ob.vertex_groups.active
-    weights = []
-
-    if vgroup is None:
-        return None
-
+def _get_mesh_vgroups_(ob, mesh, names):
+    '''
+    Get the weights for several vertex groups in one pass over the vertices.
+
+    Arguments:
+    ob (bpy.types.Object) - Blender object the vertex groups belong to
+    mesh (bpy.types.Mesh) - Blender mesh
+    names (list) - names of the vertex groups. An empty string means the active group.
+
+    Returns:
+    (dict) - vertex group name to a float32 array of weights, one per vertex.
+             Vertices not in a group get a weight of 0.0. Missing groups are None.
+    '''
+
+    nvertices = len(mesh.vertices)
+    weights = dict()
+    columns = dict()
+    for name in names:
+        if name in weights:
+            continue
+        # evaluated meshes, ex: from geometry nodes, can carry
+        # vertex groups as point attributes
+        attr = mesh.attributes.get(name, None) if name != "" else None
+        if attr and attr.domain == 'POINT' and attr.data_type == 'FLOAT':
+            values = np.zeros(nvertices, dtype=np.float32)
+            attr.data.foreach_get('value', values)
+            weights[name] = values
+            continue
+
+        vgroup = ob.vertex_groups.get(name, None) if name != "" else ob.vertex_groups.active
+        if vgroup is None:
+            weights[name] = None
+            continue
+        columns.setdefault(vgroup.index, []).append(name)
+
+    if not columns:
+        return weights
+
+    # The deform weights of a vertex are a nested collection (v.groups), which
+    # foreach_get can't reach, and vgroup.weight() is itself one call per
+    # vertex. Walk the vertices once and fill in every requested group.
+    dense = np.zeros((len(columns), nvertices), dtype=np.float32)
+    rows = {group_index: i for i, group_index in enumerate(columns)}
     for v in mesh.vertices:
-        if len(v.groups) == 0:
-            weights.append(0.0)
-        else:
-            weights.extend([g.weight for g in v.groups
-                            if g.group == vgroup.index])
+        for g in v.groups:
+            row = rows.get(g.group, None)
+            if row is not None:
+                dense[row, v.index] = g.weight
+
+    for group_index, row in rows.items():
+        for name in columns[group_index]:
+            weights[name] = dense[row]
 
     return weights
 
 def _get_material_ids(ob, geo):        
     fast_material_ids = np.zeros(len(geo.polygons), dtype=np.int32)
     geo.polygons.foreach_get("material_index", fast_material_ids)
-    material_ids = fast_material_ids.tolist()
-    return material_ids
+    return fast_material_ids
 
 def _export_reference_pose(ob, rm, rixparams, vertex_detail):
     rman__Pref = []
@@ -176,7 +244,7 @@ def _export_reference_pose(ob, rm, rixparams, vertex_detail):
         else:
             rfb_log().error("Number of WNref primvars do not match. Please re-freeze the reference position.")
 
-def export_tangents(ob, geo, rixparams, uvmap="", name=""):
+def export_tangents(ob, geo, rixparams, uvmap="", name="", as_buffer=False):
     # also export the tangent and bitangent vectors
     try:
         if uvmap == "":
@@ -187,11 +255,15 @@ def export_tangents(ob, geo, rixparams, uvmap="", name=""):
         fasttangent = np.zeros(loops*3, dtype=np.float32)
         geo.loops.foreach_get('tangent', fasttangent)
         fasttangent = np.reshape(fasttangent, (loops, 3))
-        tangents = fasttangent.tolist()    
 
         fastbitangent = np.zeros(loops*3, dtype=np.float32)
         geo.loops.foreach_get('bitangent', fastbitangent)
-        bitangent = fastbitangent.tolist()      
+        if as_buffer:
+            tangents = fasttangent
+            bitangent = np.reshape(fastbitangent, (loops, 3))
+        else:
+            tangents = fasttangent.tolist()    
+            bitangent = fastbitangent.tolist()      
         geo.free_tangents()    
 
         if name == "":
@@ -203,7 +275,15 @@ def export_tangents(ob, geo, rixparams, uvmap="", name=""):
     except RuntimeError as err:
         rfb_log().debug("Can't export tangent vectors: %s" % str(err))       
 
-def _get_primvars_(ob, rman_sg_mesh, geo, rixparams):
+def _has_tangents_(rm):
+    if rm.export_default_uv and rm.export_default_tangents:
+        return True
+    for p in rm.prim_vars:
+        if p.data_source == 'UV_TEXTURE' and p.export_tangents:
+            return True
+    return False
+
+def _get_primvars_(ob, rman_sg_mesh, geo, rixparams, as_buffer=False):
     #rm = ob.data.renderman
     # Stange problem here : ob seems to not be in sync with the scene
     # when a geometry node is active...
@@ -213,16 +293,16 @@ def _get_primvars_(ob, rman_sg_mesh, geo, rixparams):
     facevarying_detail = rman_sg_mesh.nverts 
 
     if rm.export_default_uv:
-        uvs = _get_mesh_uv_(geo, ob=ob)
-        if uvs and len(uvs) > 0:
+        uvs = _get_mesh_uv_(geo, ob=ob, as_buffer=as_buffer)
+        if uvs is not None and len(uvs) > 0:
             detail = "facevarying" if (facevarying_detail*2) == len(uvs) else "vertex"
             rixparams.SetFloatArrayDetail("st", uvs, 2, detail)
             if rm.export_default_tangents:
-                export_tangents(ob, geo, rixparams)    
+                export_tangents(ob, geo, rixparams, as_buffer=as_buffer)    
 
     if rm.export_default_vcol:
-        vcols = _get_mesh_vcol_(geo, ob=ob)
-        if vcols and len(vcols) > 0:
+        vcols = _get_mesh_vcol_(geo, ob=ob, as_buffer=as_buffer)
+        if vcols is not None and len(vcols) > 0:
             detail = "facevarying" if facevarying_detail == len(vcols) else "vertex"
             rixparams.SetColorDetail("Cs", vcols, detail)
 
@@ -231,30 +311,35 @@ def _get_primvars_(ob, rman_sg_mesh, geo, rixparams):
         _export_reference_pose(ob, rm, rixparams, vertex_detail)
     
     # custom prim vars
+    vgroup_names = [p.data_name for p in rm.prim_vars if p.data_source == 'VERTEX_GROUP']
+    vgroup_weights = _get_mesh_vgroups_(ob, geo, vgroup_names) if vgroup_names else dict()
+
     for p in rm.prim_vars:
         if p.data_source == 'VERTEX_COLOR':
-            vcols = _get_mesh_vcol_(geo, p.data_name)
+            vcols = _get_mesh_vcol_(geo, p.data_name, as_buffer=as_buffer)
             
-            if vcols and len(vcols) > 0:
+            if vcols is not None and len(vcols) > 0:
                 detail = "facevarying" if facevarying_detail == len(vcols) else "vertex"
                 rixparams.SetColorDetail(p.name, vcols, detail)
             
         elif p.data_source == 'UV_TEXTURE':
-            uvs = _get_mesh_uv_(geo, p.data_name)
-            if uvs and len(uvs) > 0:
+            uvs = _get_mesh_uv_(geo, p.data_name, as_buffer=as_buffer)
+            if uvs is not None and len(uvs) > 0:
                 detail = "facevarying" if (facevarying_detail*2) == len(uvs) else "vertex"
                 rixparams.SetFloatArrayDetail(p.name, uvs, 2, detail)
                 if p.export_tangents:
-                    export_tangents(ob, geo, rixparams, uvmap=p.data_name, name=p.name) 
+                    export_tangents(ob, geo, rixparams, uvmap=p.data_name, name=p.name, as_buffer=as_buffer) 
 
         elif p.data_source == 'VERTEX_GROUP':
-            weights = _get_mesh_vgroup_(ob, geo, p.data_name)
-            if weights and len(weights) > 0:
+            weights = vgroup_weights.get(p.data_name, None)
+            if weights is not None and not as_buffer:
+                weights = weights.tolist()
+            if weights is not None and len(weights) > 0:
                 detail = "facevarying" if facevarying_detail == len(weights) else "vertex"
                 rixparams.SetFloatDetail(p.name, weights, detail)
         elif p.data_source == 'VERTEX_ATTR_COLOR':
-            vattr = _get_mesh_vattr_(geo, p.data_name)            
-            if vattr and len(vattr) > 0:
+            vattr = _get_mesh_vattr_(geo, p.data_name, as_buffer=as_buffer)            
+            if vattr is not None and len(vattr) > 0:
                 detail = "facevarying" if facevarying_detail == len(vattr) else "vertex"
                 rixparams.SetColorDetail(p.data_name, vattr, detail)
 
@@ -267,6 +352,29 @@ class RmanMeshTranslator(RmanTranslator):
         super().__init__(rman_scene)
         self.bl_type = 'MESH' 
 
+    def _get_geometry_fingerprint_(self, ob, mesh):
+        rm = ob.original.data.renderman
+
+        # vertex group weights are not part of the mesh
+        # so we can't tell if they changed
+        for p in rm.prim_vars:
+            if p.data_source == 'VERTEX_GROUP':
+                return None
+
+        signature = [ob.original.name_full, str(object_utils.is_subdmesh(ob))]
+        for m in ob.modifiers:
+            signature.append('%s:%s:%d:%d' % (m.name, m.type, m.show_viewport, m.show_render))
+        for mat in ob.data.materials:
+            signature.append(mat.original.name_full if mat else '')
+        for prop_name in ['export_default_uv', 'export_default_tangents', 'export_default_vcol',
+                          'rman_smoothnormals', 'rman_subdiv_scheme', 'rman_subdivInterp',
+                          'rman_subdivFacevaryingInterp', 'rman_holesFaceMap']:
+            signature.append(str(getattr(rm, prop_name, '')))
+        for p in rm.prim_vars:
+            signature.append('%s:%s:%s:%d' % (p.name, p.data_source, p.data_name, p.export_tangents))
+        return mesh_utils.get_mesh_fingerprint(mesh, signature=';'.join(signature),
+                                               reference_pose=getattr(rm, 'reference_pose', None))
+
     def _get_subd_tags_(self, ob, mesh, primvar):
         rm = mesh.renderman
 
@@ -352,7 +460,8 @@ class RmanMeshTranslator(RmanTranslator):
         if not sg_node:
             sg_node = rman_sg_mesh.sg_mesh
         primvar = sg_node.GetPrimVars()
-        P = mesh_utils.get_mesh_points_(mesh)
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        P = mesh_utils.get_mesh_points_(mesh, as_buffer=as_buffer)
         npoints = len(P)
 
         if rman_sg_mesh.npoints != npoints:
@@ -392,6 +501,44 @@ class RmanMeshTranslator(RmanTranslator):
         rman_sg_mesh.sg_node.SetPrimVars(primvars)
         ob.to_mesh_clear()
 
+    def _can_update_points_only_(self, ob, rman_sg_mesh, fingerprint):
+        if fingerprint is None or rman_sg_mesh.geometry_fingerprint is None:
+            return False
+        if _has_tangents_(ob.original.data.renderman):
+            # tangents depend on P, do a full update
+            return False
+        if rman_sg_mesh.npoints < 1:
+            return False
+        if rman_sg_mesh.is_deforming and len(rman_sg_mesh.deform_motion_steps) > 1:
+            # P has time samples
+            return False
+        topology_fingerprint = fingerprint[0]
+        return topology_fingerprint == rman_sg_mesh.geometry_fingerprint[0]
+
+    def _update_points_(self, ob, rman_sg_mesh, mesh, sg_node):
+        '''
+        Only refresh P, and N if needed, on a mesh whose topology
+        did not change since the last update.
+        '''
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        P = mesh_utils.get_mesh_points_(mesh, as_buffer=as_buffer)
+        N = []
+        use_smooth_normals = getattr(ob.data.renderman, 'rman_smoothnormals', False)
+        if not rman_sg_mesh.is_subdiv and not use_smooth_normals:
+            N = mesh_utils.get_mesh_normals(mesh, as_buffer=as_buffer)
+        N_detail = "facevarying" if len(N) == rman_sg_mesh.nverts else "uniform"
+
+        sg_nodes = [sg_node]
+        if rman_sg_mesh.is_multi_material:
+            sg_nodes.extend(rman_sg_mesh.multi_material_children)
+
+        for node in sg_nodes:
+            primvar = node.GetPrimVars()
+            primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, P, "vertex")
+            if len(N) > 0:
+                primvar.SetNormalDetail(self.rman_scene.rman.Tokens.Rix.k_N, N, N_detail)
+            node.SetPrimVars(primvar)
+
     def update(self, ob, rman_sg_mesh, input_mesh=None, sg_node=None):
         rm = ob.renderman
         mesh = input_mesh
@@ -400,16 +547,31 @@ class RmanMeshTranslator(RmanTranslator):
             if not mesh:
                 return True
 
+        fingerprint = None
         if not sg_node:
             sg_node = rman_sg_mesh.sg_mesh
-
+            if self.rman_scene.is_interactive and not input_mesh:
+                fingerprint = self._get_geometry_fingerprint_(ob, mesh)
+                if fingerprint is not None and fingerprint == rman_sg_mesh.geometry_fingerprint:
+                    rfb_log().debug("\tGeometry unchanged, skipping: %s" % rman_sg_mesh.db_name)
+                    ob.to_mesh_clear()
+                    return True
+                if self._can_update_points_only_(ob, rman_sg_mesh, fingerprint):
+                    rfb_log().debug("\tTopology unchanged, updating points: %s" % rman_sg_mesh.db_name)
+                    self._update_points_(ob, rman_sg_mesh, mesh, sg_node)
+                    rman_sg_mesh.geometry_fingerprint = fingerprint
+                    ob.to_mesh_clear()
+                    return True
+
+        rman_sg_mesh.geometry_fingerprint = fingerprint
         rman_sg_mesh.is_subdiv = object_utils.is_subdmesh(ob)
         use_smooth_normals = getattr(ob.data.renderman, 'rman_smoothnormals', False)
         get_normals = (rman_sg_mesh.is_subdiv == 0 and not use_smooth_normals)
-        (nverts, verts, P, N) = mesh_utils.get_mesh(mesh, get_normals=get_normals)
+        as_buffer = prefs_utils.get_pref('rman_primvar_buffer_mode', default=True)
+        (nverts, verts, P, N) = mesh_utils.get_mesh(mesh, get_normals=get_normals, as_buffer=as_buffer)
         
         # if this is empty continue:
-        if nverts == []:
+        if len(nverts) == 0:
             if not input_mesh:
                 ob.to_mesh_clear()
             rman_sg_mesh.npoints = 0
@@ -434,7 +596,8 @@ class RmanMeshTranslator(RmanTranslator):
         rman_sg_mesh.nverts = numnverts
 
         sg_node.Define( npolys, npoints, numnverts )
-        rman_sg_mesh.is_multi_material = _is_multi_material_(ob, mesh)
+        material_ids = _get_material_ids(ob, mesh)
+        rman_sg_mesh.is_multi_material = _is_multi_material_(ob, material_ids)
             
         primvar = sg_node.GetPrimVars()
         primvar.Clear()
@@ -443,7 +606,7 @@ class RmanMeshTranslator(RmanTranslator):
             super().set_primvar_times(rman_sg_mesh.deform_motion_steps, primvar)
         
         primvar.SetPointDetail(self.rman_scene.rman.Tokens.Rix.k_P, P, "vertex")
-        _get_primvars_(ob, rman_sg_mesh, mesh, primvar)   
+        _get_primvars_(ob, rman_sg_mesh, mesh, primvar, as_buffer=as_buffer)   
 
         primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_nvertices, nverts, "uniform")
         primvar.SetIntegerDetail(self.rman_scene.rman.Tokens.Rix.k_Ri_vertices, verts, "facevarying")                  
@@ -458,7 +621,7 @@ class RmanMeshTranslator(RmanTranslator):
 
         else:
             sg_node.SetScheme(None)
-            if N:
+            if len(N) > 0:
                 if len(N) == numnverts:
                     primvar.SetNormalDetail(self.rman_scene.rman.Tokens.Rix.k_N, N, "facevarying")         
                 else:
@@ -469,9 +632,9 @@ class RmanMeshTranslator(RmanTranslator):
         super().export_object_primvars(ob, primvar)
 
         if rman_sg_mesh.is_multi_material:
-            material_ids = _get_material_ids(ob, mesh)
-            for mat_id, faces in \
-                _get_mats_faces_(nverts, material_ids).items():
+            for mat_id, faces in _get_mats_faces_(material_ids).items():
+                if not as_buffer:
+                    faces = faces.tolist()
 
                 mat = ob.data.materials[mat_id]
                 if not mat:
@@ -495,8 +658,10 @@ class RmanMeshTranslator(RmanTranslator):
                     scenegraph_utils.set_material(sg_sub_mesh, sg_material.sg_node)
                     sg_node.AddChild(sg_sub_mesh)
                     rman_sg_mesh.multi_material_children.append(sg_sub_mesh)
+                    rman_sg_mesh.multi_material_ids.append(mat_id)
         else:
             rman_sg_mesh.multi_material_children = []
+            rman_sg_mesh.multi_material_ids = []
 
         sg_node.SetPrimVars(primvar)
 
@@ -3,6 +3,8 @@ from ..rman_sg_nodes.rman_sg_nurbs import RmanSgNurbs
 from ..rfb_utils import object_utils
 from ..rfb_utils import string_utils
 from ..rfb_utils import property_utils
+from ..rfb_utils import prefs_utils
+from ..rfb_utils import nurbs_utils
 
 import bpy
 import math
@@ -219,9 +221,9 @@ class RmanNurbsTranslator(RmanTranslator):
         if uorder == 0 or vorder == 0:
             return
 
-        P = []
-        for pt in spline.points:
-            P.append(pt.co)            
+        P = nurbs_utils.get_spline_points(spline)
+        if not prefs_utils.get_pref('rman_primvar_buffer_mode', default=True):
+            P = P.tolist()
 
         '''
         # we currently don't support use_cyclic_u and use_cuclic_v options    
@@ -245,14 +247,14 @@ class RmanNurbsTranslator(RmanTranslator):
         '''
      
         pnts_order = spline.point_count_u + spline.order_u
-        uknots = [0.0] * pnts_order
-        flag = spline.use_endpoint_u + (spline.use_bezier_u << 1)
-        calcknots(uknots, spline.point_count_u, spline.order_u, flag)
+        uknots = nurbs_utils.get_knots(spline.point_count_u, spline.order_u, 
+                                       use_endpoint=spline.use_endpoint_u, use_bezier=spline.use_bezier_u)
+        uknots = uknots[0:pnts_order].tolist()
 
         pnts_order = spline.point_count_v + spline.order_v
-        vknots = [0.0] * pnts_order
-        flag = spline.use_endpoint_v + (spline.use_bezier_v << 1)
-        calcknots(vknots, spline.point_count_v, spline.order_v, flag)
+        vknots = nurbs_utils.get_knots(spline.point_count_v, spline.order_v, 
+                                       use_endpoint=spline.use_endpoint_v, use_bezier=spline.use_bezier_v)
+        vknots = vknots[0:pnts_order].tolist()
 
         rman_sg_nurbs.sg_node.Define(nu, uorder, nv, vorder)
         
@@ -7,11 +7,14 @@ from ...rfb_logger import rfb_log
 from ...rman_constants import RMAN_AREA_LIGHT_TYPES, USE_GPU_MODULE
 from .barn_light_filter_draw_helper import BarnLightFilterDrawHelper
 from .frustrum_draw_helper import FrustumDrawHelper
+from .light_texture_cache import LightTextureCache
 from mathutils import Vector, Matrix
+from bpy_extras import view3d_utils
 from bpy.app.handlers import persistent
+from collections import OrderedDict
+from functools import lru_cache
 import mathutils
 import math
-import ice
 import bpy
 import gpu
 
@@ -26,7 +29,10 @@ _DRAW_HANDLER_ = None
 _FRUSTUM_DRAW_HELPER_ = None
 _BARN_LIGHT_DRAW_HELPER_ = None
 _PI0_5_ = 1.570796327
-_PRMAN_TEX_CACHE_ = dict()
+_PRMAN_TEX_CACHE_ = LightTextureCache()
+_SHADER_CACHE_ = dict()
+_BATCH_CACHE_ = OrderedDict()
+_BATCH_CACHE_SIZE_ = 2048
 _RMAN_TEXTURED_LIGHTS_ = ['PxrRectLight', 'PxrDomeLight', 'PxrGoboLightFilter', 'PxrCookieLightFilter']
 
 s_rmanLightLogo = dict()
@@ -593,6 +599,69 @@ def _get_indices(l):
 
     return indices   
 
+def _get_shader(name):
+    '''
+    Get one of the light shaders. Shaders are only compiled the first time
+    they are asked for.
+
+    Arguments:
+        name (str) - 'image' or 'color'
+
+    Returns:
+        (gpu.types.GPUShader) - the shader
+    '''
+    shader = _SHADER_CACHE_.get(name, None)
+    if shader:
+        return shader
+
+    if name == 'image':
+        if USE_GPU_MODULE:
+            shader = gpu.shader.create_from_info(_SHADER_IMAGE_INFO_)
+        else:
+            shader = gpu.types.GPUShader(_VERTEX_SHADER_UV_, _FRAGMENT_SHADER_TEX_)
+    else:
+        if USE_GPU_MODULE:
+            shader = gpu.shader.create_from_info(_SHADER_COLOR_INFO_)
+        else:
+            shader = gpu.types.GPUShader(_VERTEX_SHADER_, _FRAGMENT_SHADER_COL_)
+    _SHADER_CACHE_[name] = shader
+    return shader
+
+def _get_batch(key, shader, prim_type, build):
+    '''
+    Get the batch for key, or build a new one. The least recently used
+    batches are thrown away once there are more than _BATCH_CACHE_SIZE_.
+
+    Arguments:
+        key (tuple) - the name of the shape, and any parameters it depends on
+        shader (gpu.types.GPUShader) - the shader the batch is drawn with
+        prim_type (str) - primitive type, ex: 'LINES'
+        build (function) - returns the content and indices to give to
+                           batch_for_shader. Only called if there's no batch for key.
+
+    Returns:
+        (gpu.types.GPUBatch) - the batch
+    '''
+    key = (prim_type,) + key
+    batch = _BATCH_CACHE_.get(key, None)
+    if batch:
+        _BATCH_CACHE_.move_to_end(key)
+        return batch
+
+    content, indices = build()
+    batch = batch_for_shader(shader, prim_type, content, indices=indices)
+    _BATCH_CACHE_[key] = batch
+    if len(_BATCH_CACHE_) > _BATCH_CACHE_SIZE_:
+        _BATCH_CACHE_.popitem(last=False)
+    return batch
+
+def _get_light_texture(light_shader, light_shader_name):
+    if light_shader_name not in _RMAN_TEXTURED_LIGHTS_:
+        return None
+    if light_shader_name in ['PxrGoboLightFilter', 'PxrCookieLightFilter']:
+        return light_shader.map
+    return light_shader.lightColorMap
+
 def _get_sun_direction(ob):
     light = ob.data
     rm = light.renderman.get_light_node()
@@ -645,88 +714,6 @@ def _get_sun_direction(ob):
     
     return m @ sunDirection
 
-def load_gl_texture(tex):
-    global _PRMAN_TEX_CACHE_
-    real_path = string_utils.expand_string(tex)
-
-    ice._registry.Mark() 
-    iceimg = ice.Load(real_path)
-    if USE_GPU_MODULE:
-        iceimg = iceimg.TypeConvert(ice.constants.FLOAT)
-    else:
-        # quantize to 8 bits
-        iceimg = iceimg.TypeConvert(ice.constants.FRACTIONAL)
-
-    x1, x2, y1, y2 = iceimg.DataBox()
-    width = (x2 - x1) + 1
-    height = (y2 - y1) + 1 
-
-    # Resize image to be max 2k
-    maxRes = 2048
-    largestDim = height 
-    if width > height:
-        largestDim = width
-    scaledImg = None
-    if largestDim > maxRes:
-        scale = (maxRes/largestDim, maxRes/largestDim)
-        scaledImg = iceimg.Resize(scale)
-    
-    # if the image was scaled, then get values for the scaled version
-    if scaledImg:
-        iceimg = scaledImg
-        x1, x2, y1, y2 = scaledImg.DataBox()
-        width = (x2 - x1) + 1
-        height = (y2 - y1) + 1 
-
-    numChannels = iceimg.Ply()
-    if USE_GPU_MODULE:       
-        iFormat = 'RGBA32F'
-        if numChannels != 4:
-            # if this is not a 4-channel image, we create a card with an alpha
-            # and composite the image over the card
-            bg = ice.Card(ice.constants.FLOAT, [0,0,0,1])
-            iceimg = bg.Over(iceimg)
-
-        # Generate texture
-        buffer = iceimg.AsByteArray()
-        pixels = gpu.types.Buffer('FLOAT', len(buffer), buffer)
-        texture = gpu.types.GPUTexture((width, height), format=iFormat, data=pixels)
-        _PRMAN_TEX_CACHE_[tex] = texture
-    else:
-        buffer = iceimg.AsByteArray()
-        pixels = bgl.Buffer(bgl.GL_BYTE, len(buffer), buffer)
-        texture = bgl.Buffer(bgl.GL_INT, 1)
-        _PRMAN_TEX_CACHE_[tex] = texture
-
-        iFormat = bgl.GL_RGBA
-        texFormat = bgl.GL_RGBA
-        if numChannels == 1:
-            iFormat = bgl.GL_RGB
-            texFormat = bgl.GL_LUMINANCE
-        elif numChannels == 2:
-            iFormat = bgl.GL_RGB
-            texFormat = bgl.GL_LUMINANCE_ALPHA
-        elif numChannels == 3:
-            iFormat = bgl.GL_RGB
-            texFormat = bgl.GL_RGB
-                    
-        elif numChannels == 4:
-            iFormat = bgl.GL_RGBA
-            texFormat = bgl.GL_RGBA
-            
-        bgl.glGenTextures(1, texture)    
-        bgl.glActiveTexture(bgl.GL_TEXTURE0)
-        bgl.glBindTexture(bgl.GL_TEXTURE_2D, texture[0])
-        bgl.glTexImage2D(bgl.GL_TEXTURE_2D, 0, iFormat, width, height, 0, texFormat, bgl.GL_UNSIGNED_BYTE, pixels)
-        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MIN_FILTER, bgl.GL_LINEAR)
-        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MAG_FILTER, bgl.GL_LINEAR)
-        bgl.glBindTexture(bgl.GL_TEXTURE_2D, 0)   
-
-    ice._registry.RemoveToMark()
-    del iceimg   
-
-    return texture  
-
 def make_sphere():
     cols = 32
     rows = 32
@@ -811,7 +798,35 @@ def make_sphere_uvs():
 
     return uvs   
 
-def draw_solid(ob, pts, mtx, uvs=list(), indices=None, tex='', col=None):
+@lru_cache(maxsize=1)
+def _get_sphere_shape():
+    # the sphere never changes, so only build it once
+    idx_buffer = make_sphere_idx_buffer()
+    line_indices = [(idx_buffer[i], idx_buffer[i+1]) for i in range(0, len(idx_buffer)-1) ]
+    tri_indices = [(idx_buffer[i], idx_buffer[i+1], idx_buffer[i+2]) for i in range(0, len(idx_buffer)-2) ]
+    return (make_sphere(), make_sphere_uvs(), line_indices, tri_indices)
+
+def _get_solid_batch(shader, shader_name, prim_type, content, indices, key):
+    if key is None:
+        return batch_for_shader(shader, prim_type, content, indices=indices)
+    return _get_batch((shader_name,) + key, shader, prim_type, lambda: (content, indices))
+
+def _get_screen_size(pts, mtx):
+    # the size, in pixels, of the bounds of pts in the viewport
+    region = bpy.context.region
+    rv3d = bpy.context.region_data
+    xs = []
+    ys = []
+    for pt in pts:
+        co = view3d_utils.location_3d_to_region_2d(region, rv3d, mtx @ Vector(pt))
+        if co is None:
+            # behind the view, assume it fills the viewport
+            return max(region.width, region.height)
+        xs.append(co[0])
+        ys.append(co[1])
+    return max(max(xs) - min(xs), max(ys) - min(ys))
+
+def draw_solid(ob, pts, mtx, uvs=list(), indices=None, tex='', col=None, key=None, screen_size=None):
     global _PRMAN_TEX_CACHE_
 
     scene = bpy.context.scene
@@ -822,20 +837,21 @@ def draw_solid(ob, pts, mtx, uvs=list(), indices=None, tex='', col=None):
     if not prefs_utils.get_pref('rman_viewport_draw_lights_textured'):
         return
     
+    texture = None
     real_path = string_utils.expand_string(tex)
     if os.path.exists(real_path):
-        if USE_GPU_MODULE:
-            shader = gpu.shader.create_from_info(_SHADER_IMAGE_INFO_)
-        else:
-            shader = gpu.types.GPUShader(_VERTEX_SHADER_UV_, _FRAGMENT_SHADER_TEX_)
+        if screen_size is None:
+            screen_size = _get_screen_size(pts, mtx)
+        # this is None until the texture has been decoded, in which case we
+        # fall back to drawing the light color
+        texture = _PRMAN_TEX_CACHE_.get(tex, real_path, screen_size)
+
+    if texture:
+        shader = _get_shader('image')
         if indices:
-            batch = batch_for_shader(shader, 'TRIS', {"position": pts, "uv": uvs}, indices=indices)   
+            batch = _get_solid_batch(shader, 'image', 'TRIS', {"position": pts, "uv": uvs}, indices, key)
         elif uvs:
-            batch = batch_for_shader(shader, 'TRI_FAN', {"position": pts, "uv": uvs})                
-
-        texture = _PRMAN_TEX_CACHE_.get(tex, None)
-        if not texture:
-            texture = load_gl_texture(tex)
+            batch = _get_solid_batch(shader, 'image', 'TRI_FAN', {"position": pts, "uv": uvs}, None, key)
 
         if USE_GPU_MODULE:
             shader.bind()
@@ -862,15 +878,12 @@ def draw_solid(ob, pts, mtx, uvs=list(), indices=None, tex='', col=None):
             bgl.glDisable(bgl.GL_DEPTH_TEST)      
 
     elif col:
-        if USE_GPU_MODULE:
-            shader = gpu.shader.create_from_info(_SHADER_COLOR_INFO_)
-        else:
-            shader = gpu.types.GPUShader(_VERTEX_SHADER_, _FRAGMENT_SHADER_COL_)
+        shader = _get_shader('color')
 
         if indices:
-            batch = batch_for_shader(shader, 'TRIS', {"position": pts}, indices=indices)  
+            batch = _get_solid_batch(shader, 'color', 'TRIS', {"position": pts}, indices, key)
         else: 
-            batch = batch_for_shader(shader, 'TRI_FAN', {"position": pts})  
+            batch = _get_solid_batch(shader, 'color', 'TRI_FAN', {"position": pts}, None, key)
 
         lightColor = (col[0], col[1], col[2], 1.0)
         shader.bind()
@@ -891,10 +904,10 @@ def draw_solid(ob, pts, mtx, uvs=list(), indices=None, tex='', col=None):
             batch.draw(shader)           
             bgl.glDisable(bgl.GL_DEPTH_TEST)      
 
-def draw_line_shape(ob, shader, pts, indices):  
-    do_draw = ((ob in bpy.context.selected_objects) or (prefs_utils.get_pref('rman_viewport_lights_draw_wireframe')))
-    if do_draw:
-        batch = batch_for_shader(shader, 'LINES', {"pos": pts}, indices=indices)    
+def _draw_line_batch(shader, batch, mtx=None):
+    with gpu.matrix.push_pop():
+        if mtx is not None:
+            gpu.matrix.multiply_matrix(mtx)
         if USE_GPU_MODULE:
             gpu.state.depth_test_set("LESS")
             gpu.state.blend_set("ALPHA")
@@ -908,8 +921,52 @@ def draw_line_shape(ob, shader, pts, indices):
             bgl.glDisable(bgl.GL_DEPTH_TEST)    
             bgl.glDisable(bgl.GL_BLEND)
 
-def draw_rect_light(ob):
+def draw_line_shape(ob, shader, pts, indices=None, mtx=None, key=None):
+    '''
+    Draw a line shape. If key is set, the batch is cached with that key, and
+    pts are in the space of mtx. Otherwise, pts are in world space.
+    If indices is None, the points are drawn as a closed loop.
+    '''
+    do_draw = ((ob in bpy.context.selected_objects) or (prefs_utils.get_pref('rman_viewport_lights_draw_wireframe')))
+    if not do_draw:
+        return
+
+    if key:
+        batch = _get_batch(key, shader, 'LINES', lambda: ({"pos": pts}, indices if indices is not None else _get_indices(pts)))
+    else:
+        batch = batch_for_shader(shader, 'LINES', {"pos": pts}, indices=indices if indices is not None else _get_indices(pts))
+
+    _draw_line_batch(shader, batch, mtx)
+
+def draw_cone(ob, light_shader, m):
     global _FRUSTUM_DRAW_HELPER_
+
+    rm = ob.data.renderman
+    coneAngle = getattr(light_shader, 'coneAngle', 90.0)
+    if coneAngle >= 90.0:
+        return
+
+    softness = getattr(light_shader, 'coneSoftness', 0.0)
+    depth = getattr(rm, 'rman_coneAngleDepth', 5.0)
+    opacity = getattr(rm, 'rman_coneAngleOpacity', 0.5)
+    set_selection_color(ob, opacity=opacity)
+
+    def build():
+        _FRUSTUM_DRAW_HELPER_.update_input_params(method='rect',    
+                                                coneAngle=coneAngle, 
+                                                coneSoftness=softness,
+                                                rman_coneAngleDepth=depth
+                                                )
+        vtx_buffer = _FRUSTUM_DRAW_HELPER_.vtx_buffer()
+        indices = _FRUSTUM_DRAW_HELPER_.idx_buffer(len(vtx_buffer), 0, 0)
+        return ({"pos": vtx_buffer}, indices)
+
+    do_draw = ((ob in bpy.context.selected_objects) or (prefs_utils.get_pref('rman_viewport_lights_draw_wireframe')))
+    if do_draw:
+        batch = _get_batch(('frustum', coneAngle, softness, depth), _SHADER_, 'LINES', build)
+        _draw_line_batch(_SHADER_, batch, m)
+
+def draw_rect_light(ob):
     _SHADER_.bind()
 
     set_selection_color(ob)
@@ -917,44 +974,18 @@ def draw_rect_light(ob):
     ob_matrix = Matrix(ob.matrix_world)        
     m = ob_matrix @ __MTX_Y_180__ 
 
-    box = [m @ Vector(pt) for pt in s_rmanLightLogo['box']]
-    box_indices = _get_indices(s_rmanLightLogo['box'])
-    draw_line_shape(ob, _SHADER_, box, box_indices)
-
-    arrow = [m @ Vector(pt) for pt in s_rmanLightLogo['arrow']]
-    arrow_indices = _get_indices(s_rmanLightLogo['arrow'])
-    draw_line_shape(ob, _SHADER_, arrow, arrow_indices)
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['box'], mtx=m, key=('box',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['arrow'], mtx=m, key=('arrow',))
 
     m = ob_matrix
-    R_outside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_outside']]
-    R_outside_indices = _get_indices(s_rmanLightLogo['R_outside'])
-    draw_line_shape(ob, _SHADER_, R_outside, R_outside_indices)
-  
-    R_inside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_inside']]
-    R_inside_indices = _get_indices(s_rmanLightLogo['R_inside'])
-    draw_line_shape(ob, _SHADER_, R_inside, R_inside_indices)
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_outside'], mtx=m, key=('R_outside',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_inside'], mtx=m, key=('R_inside',))
 
     rm = ob.data.renderman
     light_shader = rm.get_light_node()
     light_shader_name = rm.get_light_node_name()  
 
-    m = ob_matrix
-    coneAngle = getattr(light_shader, 'coneAngle', 90.0)
-    if coneAngle < 90.0:
-        softness = getattr(light_shader, 'coneSoftness', 0.0)
-        depth = getattr(rm, 'rman_coneAngleDepth', 5.0)
-        opacity = getattr(rm, 'rman_coneAngleOpacity', 0.5)
-        set_selection_color(ob, opacity=opacity)
-        _FRUSTUM_DRAW_HELPER_.update_input_params(method='rect',    
-                                                coneAngle=coneAngle, 
-                                                coneSoftness=softness,
-                                                rman_coneAngleDepth=depth
-                                                )
-        vtx_buffer = _FRUSTUM_DRAW_HELPER_.vtx_buffer()
-
-        pts = [m @ Vector(pt) for pt in vtx_buffer ]
-        indices = _FRUSTUM_DRAW_HELPER_.idx_buffer(len(pts), 0, 0)   
-        draw_line_shape(ob, _SHADER_, pts, indices)          
+    draw_cone(ob, light_shader, ob_matrix)
 
     if light_shader_name == 'PxrRectLight':
         m = ob_matrix @ __MTX_Y_180__ 
@@ -963,11 +994,9 @@ def draw_rect_light(ob):
         
         pts = ((0.5, -0.5, 0.0), (-0.5, -0.5, 0.0), (-0.5, 0.5, 0.0), (0.5, 0.5, 0.0))
         uvs = ((1, 1), (0, 1), (0, 0), (1, 0))    
-        draw_solid(ob, pts, m, uvs=uvs, tex=tex, col=col)  
+        draw_solid(ob, pts, m, uvs=uvs, tex=tex, col=col, key=('rect',))  
 
 def draw_sphere_light(ob):
-    global _FRUSTUM_DRAW_HELPER_
-    
     _SHADER_.bind()
 
     set_selection_color(ob)
@@ -975,57 +1004,25 @@ def draw_sphere_light(ob):
     ob_matrix = Matrix(ob.matrix_world)        
     m = ob_matrix @ __MTX_Y_180__ 
 
-    disk = [m @ Vector(pt) for pt in s_diskLight]
-    disk_indices = _get_indices(s_diskLight)
-    draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-    m2 = m @ __MTX_Y_90__ 
-    disk = [m2 @ Vector(pt) for pt in s_diskLight]
-    disk_indices = _get_indices(s_diskLight)
-    draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-    m3 = m @ __MTX_X_90__ 
-    disk = [m3 @ Vector(pt) for pt in s_diskLight]
-    disk_indices = _get_indices(s_diskLight)
-    draw_line_shape(ob, _SHADER_, disk, disk_indices)
+    draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m, key=('disk',))
+    draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m @ __MTX_Y_90__, key=('disk',))
+    draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m @ __MTX_X_90__, key=('disk',))
 
     m = ob_matrix
-    R_outside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_outside']]
-    R_outside_indices = _get_indices(s_rmanLightLogo['R_outside'])
-    draw_line_shape(ob, _SHADER_, R_outside, R_outside_indices)
-
-    R_inside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_inside']]
-    R_inside_indices = _get_indices(s_rmanLightLogo['R_inside'])
-    draw_line_shape(ob, _SHADER_, R_inside, R_inside_indices)
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_outside'], mtx=m, key=('R_outside',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_inside'], mtx=m, key=('R_inside',))
 
     rm = ob.data.renderman
     light_shader = rm.get_light_node()
     light_shader_name = rm.get_light_node_name()   
 
-    m = ob_matrix
-    coneAngle = getattr(light_shader, 'coneAngle', 90.0)
-    if coneAngle < 90.0:
-        softness = getattr(light_shader, 'coneSoftness', 0.0)
-        depth = getattr(rm, 'rman_coneAngleDepth', 5.0)
-        opacity = getattr(rm, 'rman_coneAngleOpacity', 0.5)
-        set_selection_color(ob, opacity=opacity)        
-        _FRUSTUM_DRAW_HELPER_.update_input_params(method='rect',    
-                                                coneAngle=coneAngle, 
-                                                coneSoftness=softness,
-                                                rman_coneAngleDepth=depth
-                                                )
-        vtx_buffer = _FRUSTUM_DRAW_HELPER_.vtx_buffer()
-
-        pts = [m @ Vector(pt) for pt in vtx_buffer ]
-        indices = _FRUSTUM_DRAW_HELPER_.idx_buffer(len(pts), 0, 0)      
-        draw_line_shape(ob, _SHADER_, pts, indices)         
+    draw_cone(ob, light_shader, ob_matrix)
 
     m = ob_matrix @ Matrix.Scale(0.5, 4) @ __MTX_X_90__ 
-    idx_buffer = make_sphere_idx_buffer() 
     if light_shader_name in ['PxrSphereLight']:
         col = light_shader.lightColor
-        sphere_indices = [(idx_buffer[i], idx_buffer[i+1], idx_buffer[i+2]) for i in range(0, len(idx_buffer)-2) ]
-        draw_solid(ob, make_sphere(), m, col=col, indices=sphere_indices)               
+        sphere_pts, sphere_uvs, line_indices, tri_indices = _get_sphere_shape()
+        draw_solid(ob, sphere_pts, m, col=col, indices=tri_indices, key=('sphere',))               
 
 def draw_envday_light(ob): 
 
@@ -1045,49 +1042,10 @@ def draw_envday_light(ob):
     m = Matrix(ob_matrix)
     m = m @ __MTX_X_90__ 
 
-    west_rr_shape = [m @ Vector(pt) for pt in s_envday['west_rr_shape']]
-    west_rr_indices = _get_indices(s_envday['west_rr_shape'])
-    draw_line_shape(ob, _SHADER_, west_rr_shape, west_rr_indices)
-
-    east_rr_shape = [m @ Vector(pt) for pt in s_envday['east_rr_shape']]
-    east_rr_indices = _get_indices(s_envday['east_rr_shape'])
-    draw_line_shape(ob, _SHADER_, east_rr_shape, east_rr_indices)
-
-    south_rr_shape = [m @ Vector(pt) for pt in s_envday['south_rr_shape']]
-    south_rr_indices = _get_indices(s_envday['south_rr_shape'])
-    draw_line_shape(ob, _SHADER_, south_rr_shape, south_rr_indices)
-
-    north_rr_shape = [m @ Vector(pt) for pt in s_envday['north_rr_shape']]
-    north_rr_indices = _get_indices(s_envday['north_rr_shape'])
-    draw_line_shape(ob, _SHADER_, north_rr_shape, north_rr_indices)
-
-    inner_circle_rr_shape = [m @ Vector(pt) for pt in s_envday['inner_circle_rr_shape']]
-    inner_circle_rr_shape_indices = _get_indices(s_envday['inner_circle_rr_shape'])
-    draw_line_shape(ob, _SHADER_, inner_circle_rr_shape, inner_circle_rr_shape_indices)
-
-    outer_circle_rr_shape = [m @ Vector(pt) for pt in s_envday['outer_circle_rr_shape']]
-    outer_circle_rr_shape_indices = _get_indices(s_envday['outer_circle_rr_shape'])
-    draw_line_shape(ob, _SHADER_, outer_circle_rr_shape, outer_circle_rr_shape_indices)
-
-    compass_shape = [m @ Vector(pt) for pt in s_envday['compass_shape']]
-    compass_shape_indices = _get_indices(s_envday['compass_shape'])
-    draw_line_shape(ob, _SHADER_, compass_shape, compass_shape_indices)
-
-    east_arrow_shape = [m @ Vector(pt) for pt in s_envday['east_arrow_shape']]
-    east_arrow_shape_indices = _get_indices(s_envday['east_arrow_shape'])
-    draw_line_shape(ob, _SHADER_, east_arrow_shape, east_arrow_shape_indices)
-
-    west_arrow_shape = [m @ Vector(pt) for pt in s_envday['west_arrow_shape']]
-    west_arrow_shape_indices = _get_indices(s_envday['west_arrow_shape'])
-    draw_line_shape(ob, _SHADER_, west_arrow_shape, west_arrow_shape_indices)
-
-    north_arrow_shape = [m @ Vector(pt) for pt in s_envday['north_arrow_shape']]
-    north_arrow_shape_indices = _get_indices(s_envday['north_arrow_shape'])
-    draw_line_shape(ob, _SHADER_, north_arrow_shape, north_arrow_shape_indices)
-
-    south_arrow_shape = [m @ Vector(pt) for pt in s_envday['south_arrow_shape']]
-    south_arrow_shape_indices = _get_indices(s_envday['south_arrow_shape'])
-    draw_line_shape(ob, _SHADER_, south_arrow_shape, south_arrow_shape_indices)
+    for shape in ['west_rr_shape', 'east_rr_shape', 'south_rr_shape', 'north_rr_shape',
+                  'inner_circle_rr_shape', 'outer_circle_rr_shape', 'compass_shape',
+                  'east_arrow_shape', 'west_arrow_shape', 'north_arrow_shape', 'south_arrow_shape']:
+        draw_line_shape(ob, _SHADER_, s_envday[shape], mtx=m, key=('envday', shape))
 
     sunDirection = _get_sun_direction(ob)
     sunDirection =  Matrix(ob_matrix) @ Vector(sunDirection)
@@ -1098,21 +1056,11 @@ def draw_envday_light(ob):
     # draw a sphere to represent the sun
     v = sunDirection - origin
     translate = Matrix.Translation(v)
-    sphere_shape = []
-    for p in make_sphere():
-        mat = ob_matrix @ Matrix.Scale(0.10, 4)
-        pt = mat @ Vector(p)
-        pt = translate @ pt
-        sphere_shape.append( pt )
-
-    idx_buffer = make_sphere_idx_buffer()
-    sphere_indices = [(idx_buffer[i], idx_buffer[i+1]) for i in range(0, len(idx_buffer)-1) ]
-     
-    draw_line_shape(ob, _SHADER_, sphere_shape, sphere_indices)
+    m = translate @ ob_matrix @ Matrix.Scale(0.10, 4)
+    sphere_pts, sphere_uvs, line_indices, tri_indices = _get_sphere_shape()
+    draw_line_shape(ob, _SHADER_, sphere_pts, line_indices, mtx=m, key=('sphere',))
 
 def draw_disk_light(ob): 
-    global _FRUSTUM_DRAW_HELPER_
-                 
     _SHADER_.bind()
 
     set_selection_color(ob)
@@ -1120,48 +1068,21 @@ def draw_disk_light(ob):
     ob_matrix = Matrix(ob.matrix_world)        
     m = ob_matrix @ __MTX_Y_180__ 
 
-    disk = [m @ Vector(pt) for pt in s_diskLight]
-    disk_indices = _get_indices(s_diskLight)
-    draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-    arrow = [m @ Vector(pt) for pt in s_rmanLightLogo['arrow']]
-    arrow_indices = _get_indices(s_rmanLightLogo['arrow'])
-    draw_line_shape(ob, _SHADER_, arrow, arrow_indices)
+    draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m, key=('disk',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['arrow'], mtx=m, key=('arrow',))
 
     m = ob_matrix
-    R_outside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_outside']]
-    R_outside_indices = _get_indices(s_rmanLightLogo['R_outside'])
-    draw_line_shape(ob, _SHADER_, R_outside, R_outside_indices)
-  
-    R_inside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_inside']]
-    R_inside_indices = _get_indices(s_rmanLightLogo['R_inside'])
-    draw_line_shape(ob, _SHADER_, R_inside, R_inside_indices)
-
-    ob_matrix = Matrix(ob.matrix_world)   
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_outside'], mtx=m, key=('R_outside',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_inside'], mtx=m, key=('R_inside',))
+
     rm = ob.data.renderman
     light_shader = rm.get_light_node()    
 
-    m = ob_matrix
-    coneAngle = getattr(light_shader, 'coneAngle', 90.0)
-    if coneAngle < 90.0:
-        softness = getattr(light_shader, 'coneSoftness', 0.0)
-        depth = getattr(rm, 'rman_coneAngleDepth', 5.0)
-        opacity = getattr(rm, 'rman_coneAngleOpacity', 0.5)
-        set_selection_color(ob, opacity=opacity)
-        _FRUSTUM_DRAW_HELPER_.update_input_params(method='rect',    
-                                                coneAngle=coneAngle, 
-                                                coneSoftness=softness,
-                                                rman_coneAngleDepth=depth
-                                                )
-        vtx_buffer = _FRUSTUM_DRAW_HELPER_.vtx_buffer()
-
-        pts = [m @ Vector(pt) for pt in vtx_buffer ]
-        indices = _FRUSTUM_DRAW_HELPER_.idx_buffer(len(pts), 0, 0)      
-        draw_line_shape(ob, _SHADER_, pts, indices)      
+    draw_cone(ob, light_shader, ob_matrix)
  
     m = ob_matrix @ __MTX_Y_180__ 
     col = light_shader.lightColor    
-    draw_solid(ob, s_diskLight, m, col=col)   
+    draw_solid(ob, s_diskLight, m, col=col, key=('disk',))   
 
 def draw_dist_light(ob):      
     
@@ -1172,26 +1093,12 @@ def draw_dist_light(ob):
     ob_matrix = Matrix(ob.matrix_world)        
     m = ob_matrix @ __MTX_Y_180__ 
 
-    arrow1 = [m @ Vector(pt) for pt in s_distantLight['arrow1']]
-    arrow1_indices = _get_indices(s_distantLight['arrow1'])
-    draw_line_shape(ob, _SHADER_, arrow1, arrow1_indices)
-
-    arrow2 = [m @ Vector(pt) for pt in s_distantLight['arrow2']]
-    arrow2_indices = _get_indices(s_distantLight['arrow2'])
-    draw_line_shape(ob, _SHADER_, arrow2, arrow2_indices)
-
-    arrow3 = [m @ Vector(pt) for pt in s_distantLight['arrow3']]
-    arrow3_indices = _get_indices(s_distantLight['arrow3'])
-    draw_line_shape(ob, _SHADER_, arrow3, arrow3_indices)
+    for shape in ['arrow1', 'arrow2', 'arrow3']:
+        draw_line_shape(ob, _SHADER_, s_distantLight[shape], mtx=m, key=('distant', shape))
 
     m = ob_matrix
-    R_outside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_outside']]
-    R_outside_indices = _get_indices(s_rmanLightLogo['R_outside'])
-    draw_line_shape(ob, _SHADER_, R_outside, R_outside_indices)
-  
-    R_inside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_inside']]
-    R_inside_indices = _get_indices(s_rmanLightLogo['R_inside'])
-    draw_line_shape(ob, _SHADER_, R_inside, R_inside_indices)
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_outside'], mtx=m, key=('R_outside',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_inside'], mtx=m, key=('R_inside',))
 
 def draw_portal_light(ob):
     _SHADER_.bind()
@@ -1201,24 +1108,15 @@ def draw_portal_light(ob):
     ob_matrix = Matrix(ob.matrix_world)        
     m = ob_matrix
 
-    R_outside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_outside']]
-    R_outside_indices = _get_indices(s_rmanLightLogo['R_outside'])
-    draw_line_shape(ob, _SHADER_, R_outside, R_outside_indices)
-  
-    R_inside = [m @ Vector(pt) for pt in s_rmanLightLogo['R_inside']]
-    R_inside_indices = _get_indices(s_rmanLightLogo['R_inside'])
-    draw_line_shape(ob, _SHADER_, R_inside, R_inside_indices)
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_outside'], mtx=m, key=('R_outside',))
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['R_inside'], mtx=m, key=('R_inside',))
 
     m = ob_matrix @ __MTX_Y_180__ 
-    arrow = [m @ Vector(pt) for pt in s_rmanLightLogo['arrow']]
-    arrow_indices = _get_indices(s_rmanLightLogo['arrow'])
-    draw_line_shape(ob, _SHADER_, arrow, arrow_indices)    
+    draw_line_shape(ob, _SHADER_, s_rmanLightLogo['arrow'], mtx=m, key=('arrow',))
 
     m = ob_matrix @ __MTX_X_90__ 
     m = m @ Matrix.Scale(0.5, 4)
-    rays = [m @ Vector(pt) for pt in s_portalRays]
-    rays_indices = _get_indices(s_portalRays)
-    draw_line_shape(ob, _SHADER_, rays, rays_indices)
+    draw_line_shape(ob, _SHADER_, s_portalRays, mtx=m, key=('portal_rays',))
 
 def draw_dome_light(ob):
     _SHADER_.bind()
@@ -1232,54 +1130,34 @@ def draw_dome_light(ob):
     m = m @ Matrix.Scale(100 * scale, 4)
     m = m @ __MTX_X_90__ 
 
-    sphere_pts = make_sphere()
-    sphere = [m @ Vector(p) for p in sphere_pts]
-    idx_buffer = make_sphere_idx_buffer() 
-    sphere_indices = [(idx_buffer[i], idx_buffer[i+1]) for i in range(0, len(idx_buffer)-1) ]
-
-    draw_line_shape(ob, _SHADER_, sphere, sphere_indices)
+    sphere_pts, sphere_uvs, line_indices, tri_indices = _get_sphere_shape()
+    draw_line_shape(ob, _SHADER_, sphere_pts, line_indices, mtx=m, key=('sphere',))
 
     rm = ob.data.renderman
     light_shader = rm.get_light_node()
     tex = light_shader.lightColorMap
     real_path = string_utils.expand_string(tex)
     if os.path.exists(real_path):
-        sphere_indices = [(idx_buffer[i], idx_buffer[i+1], idx_buffer[i+2]) for i in range(0, len(idx_buffer)-2) ]
-        draw_solid(ob, sphere_pts, m, uvs=make_sphere_uvs(), tex=tex, indices=sphere_indices)
+        # the dome surrounds the view, so it's as large as the viewport
+        region = bpy.context.region
+        draw_solid(ob, sphere_pts, m, uvs=sphere_uvs, tex=tex, indices=tri_indices, key=('sphere',),
+                   screen_size=max(region.width, region.height))
 
 def draw_cylinder_light(ob):
-    global _FRUSTUM_DRAW_HELPER_
-
     _SHADER_.bind()
 
     set_selection_color(ob)
 
     m = Matrix(ob.matrix_world)
 
-    cylinder = [m @ Vector(pt) for pt in s_cylinderLight['vtx']]
-    draw_line_shape(ob, _SHADER_, cylinder, s_cylinderLight['indices'])
+    draw_line_shape(ob, _SHADER_, s_cylinderLight['vtx'], s_cylinderLight['indices'], mtx=m, key=('cylinder',))
 
     rm = ob.data.renderman
     light_shader = rm.get_light_node()
-    coneAngle = getattr(light_shader, 'coneAngle', 90.0)
-    if coneAngle < 90.0:
-        softness = getattr(light_shader, 'coneSoftness', 0.0)
-        depth = getattr(rm, 'rman_coneAngleDepth', 5.0)
-        opacity = getattr(rm, 'rman_coneAngleOpacity', 0.5)
-        set_selection_color(ob, opacity=opacity)        
-        _FRUSTUM_DRAW_HELPER_.update_input_params(method='rect',    
-                                                coneAngle=coneAngle, 
-                                                coneSoftness=softness,
-                                                rman_coneAngleDepth=depth
-                                                )
-        vtx_buffer = _FRUSTUM_DRAW_HELPER_.vtx_buffer()
-
-        pts = [m @ Vector(pt) for pt in vtx_buffer ]
-        indices = _FRUSTUM_DRAW_HELPER_.idx_buffer(len(pts), 0, 0)      
-        draw_line_shape(ob, _SHADER_, pts, indices)      
+    draw_cone(ob, light_shader, m)
 
     col = light_shader.lightColor
-    draw_solid(ob, s_cylinderLight['vtx'], m, col=col, indices=s_cylinderLight['indices_tris'])  
+    draw_solid(ob, s_cylinderLight['vtx'], m, col=col, indices=s_cylinderLight['indices_tris'], key=('cylinder',))  
       
 
 def draw_arc(a, b, numSteps, quadrant, xOffset, yOffset, pts):
@@ -1316,17 +1194,8 @@ def draw_rounded_rectangles(ob, left, right,
     b = radius+bottomEdge
     draw_arc(a, b, 10, 3, right, -bottom, pts)
 
-    translate = m 
-    shape_pts = [translate @ Vector(pt) for pt in pts]
-    shape_pts_indices = _get_indices(shape_pts)
-
-    draw_line_shape(ob, _SHADER_, shape_pts, shape_pts_indices)
-
-    translate = m 
-    shape_pts = [translate @ Vector(pt) for pt in pts]
-    shape_pts_indices = _get_indices(shape_pts)
-
-    draw_line_shape(ob, _SHADER_, shape_pts, shape_pts_indices)
+    key = ('rounded_rectangle', left, right, top, bottom, radius, leftEdge, rightEdge, topEdge, bottomEdge)
+    draw_line_shape(ob, _SHADER_, pts, mtx=m, key=key)
 
 def draw_rod(ob, leftEdge, rightEdge, topEdge,  bottomEdge,
             frontEdge,  backEdge,  scale, width,  radius, 
@@ -1466,32 +1335,15 @@ def draw_ramp_light_filter(ob):
 
         # begin
         begin_m = m @ Matrix.Scale(begin, 4)      
-
-        disk = [begin_m @ Vector(pt) for pt in s_diskLight]
-        disk_indices = _get_indices(s_diskLight)
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-        m2 = begin_m @ __MTX_Y_90__ 
-        disk = [m2 @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-        m3 = begin_m @ __MTX_X_90__ 
-        disk = [m3 @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=begin_m, key=('disk',))
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=begin_m @ __MTX_Y_90__, key=('disk',))
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=begin_m @ __MTX_X_90__, key=('disk',))
 
         # end
         end_m = m @ Matrix.Scale(end, 4)      
-
-        disk = [end_m @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-        m2 = end_m @ __MTX_Y_90__ 
-        disk = [m2 @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
-
-        m3 = end_m @ __MTX_X_90__ 
-        disk = [m3 @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=end_m, key=('disk',))
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=end_m @ __MTX_Y_90__, key=('disk',))
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=end_m @ __MTX_X_90__, key=('disk',))
 
     # linear
     elif rampType == 1:        
@@ -1524,16 +1376,12 @@ def draw_ramp_light_filter(ob):
         m = Matrix(ob.matrix_world)        
         m = m @ __MTX_Y_180__ 
 
-        disk_indices = _get_indices(s_diskLight)
         if begin > 0.0:
             m1 = m @ Matrix.Scale(begin, 4)      
-
-            disk = [m1 @ Vector(pt) for pt in s_diskLight]
-            draw_line_shape(ob, _SHADER_, disk, disk_indices)
+            draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m1, key=('disk',))
 
         m2 = m @ Matrix.Scale(end, 4)      
-        disk = [m2 @ Vector(pt) for pt in s_diskLight]
-        draw_line_shape(ob, _SHADER_, disk, disk_indices)
+        draw_line_shape(ob, _SHADER_, s_diskLight, mtx=m2, key=('disk',))
 
     else:
         pass
@@ -1573,7 +1421,7 @@ def draw_barn_light_filter(ob, light_shader, light_shader_name):
         pts = ((0.5*w, -0.5*h, 0.0), (-0.5*w, -0.5*h, 0.0), (-0.5*w, 0.5*h, 0.0), (0.5*w, 0.5*h, 0.0))
         #uvs = ((0, 1), (1,1), (1, 0), (0,0))
         uvs = ((1.0-u, v), (u,v), (u, 1.0-v), (1.0-u, 1.0-v))
-        draw_solid(ob, pts, m, uvs=uvs, tex=tex, col=col)  
+        draw_solid(ob, pts, m, uvs=uvs, tex=tex, col=col, key=('gobo', w, h, u, v))  
 
 def draw():
     global _PRMAN_TEX_CACHE_
@@ -1589,13 +1437,11 @@ def draw():
      
     scene = bpy.context.scene
       
+    # number of lights using each texture
+    tex_refs = dict()
+    _PRMAN_TEX_CACHE_.begin_draw()
     lights_list = [x for x in bpy.context.view_layer.objects if x.type == 'LIGHT']
     for ob in lights_list:
-        if ob.hide_get():
-            continue
-        # check the local view for this light
-        if not ob.visible_in_viewport_get(bpy.context.space_data):
-            continue        
         if not ob.data.renderman:
             continue
         rm = ob.data.renderman
@@ -1608,7 +1454,18 @@ def draw():
 
         light_shader_name = rm.get_light_node_name()
         if light_shader_name == '':
-            return
+            continue
+
+        # hidden lights still hold on to their textures
+        tex = _get_light_texture(light_shader, light_shader_name)
+        if tex:
+            tex_refs[tex] = tex_refs.get(tex, 0) + 1
+
+        if ob.hide_get():
+            continue
+        # check the local view for this light
+        if not ob.visible_in_viewport_get(bpy.context.space_data):
+            continue        
 
         if light_shader_name in RMAN_AREA_LIGHT_TYPES:
             if ob.data.type != 'AREA':
@@ -1647,55 +1504,17 @@ def draw():
         else:   
             draw_sphere_light(ob)
 
-    # Clear out any textures not used
-    remove_textures = list()
-    for k, v in _PRMAN_TEX_CACHE_.items():
-        still_exists = False
-        for ob in lights_list:  
-            rm = ob.data.renderman
-            if not rm.use_renderman_node:
-                continue
-            light_shader = rm.get_light_node()
-            if not light_shader:
-                continue
-            light_shader_name = rm.get_light_node_name()
-            if light_shader_name == '':
-                return            
-            if light_shader_name not in _RMAN_TEXTURED_LIGHTS_:
-                continue
-
-            tex = None
-            if light_shader_name in ['PxrGoboLightFilter', 'PxrCookieLightFilter']:
-                tex = light_shader.map
-            else:
-                tex = light_shader.lightColorMap
-
-            if tex == k:
-                still_exists = True
-                break
-
-        if not still_exists:
-            if USE_GPU_MODULE:
-                del v
-            else:
-                bgl.glDeleteTextures(1, v)
-            remove_textures.append(k)            
-
-    for k in remove_textures:
-        rfb_log().debug("Call glDeleteTextures for: %s" % k)
-        del _PRMAN_TEX_CACHE_[k]
+    # Clear out any textures that no light uses anymore, and
+    # keep the rest within budget
+    budget = prefs_utils.get_pref('rman_viewport_light_texture_budget', default=512) * 1024 * 1024
+    _PRMAN_TEX_CACHE_.end_draw(tex_refs, budget)
 
 @persistent 
 def clear_gl_tex_cache(bl_scene=None):
     global _PRMAN_TEX_CACHE_
-    if _PRMAN_TEX_CACHE_:
-        rfb_log().debug("Clearing _PRMAN_TEX_CACHE_.")
-        for k, v in _PRMAN_TEX_CACHE_.items():
-            if USE_GPU_MODULE:
-                del v
-            else:
-                bgl.glDeleteTextures(1, v)
-        _PRMAN_TEX_CACHE_.clear()    
+    rfb_log().debug("Clearing _PRMAN_TEX_CACHE_.")
+    _PRMAN_TEX_CACHE_.clear()
+    _BATCH_CACHE_.clear()
 
 def register():
     global _DRAW_HANDLER_
@@ -1713,3 +1532,6 @@ def unregister():
     global _DRAW_HANDLER_
     if _DRAW_HANDLER_:
         bpy.types.SpaceView3D.draw_handler_remove(_DRAW_HANDLER_, 'WINDOW')
+
+    _PRMAN_TEX_CACHE_.shutdown()
+    _BATCH_CACHE_.clear()
@@ -0,0 +1,335 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from ...rfb_logger import rfb_log
+from ...rman_constants import USE_GPU_MODULE
+import os
+import ice
+import bpy
+import gpu
+
+if not bpy.app.background:
+    if USE_GPU_MODULE:
+        bgl = None
+    else:
+        import bgl
+
+# the smallest and largest resolutions textures are loaded at
+_MIN_RES_ = 64
+_MAX_RES_ = 2048
+
+# resolution of the placeholder that is shown, while the
+# texture is decoded at the resolution it's drawn at
+_PLACEHOLDER_RES_ = _MIN_RES_
+
+def get_mip_resolution(screen_size):
+    '''
+    Get the resolution to load a texture at, when it covers screen_size
+    pixels of the viewport.
+
+    Arguments:
+        screen_size (float) - the size, in pixels, of the texture on screen
+
+    Returns:
+        (int) - a power of two between _MIN_RES_ and _MAX_RES_
+    '''
+    res = _MIN_RES_
+    while res < screen_size and res < _MAX_RES_:
+        res *= 2
+    return res
+
+def decode_texture(real_path, max_res, use_float=True):
+    '''
+    Load an image with ice, and scale it down so that its largest side is at
+    most max_res. This does not touch any Blender or GL data, so it can be run
+    on a worker thread.
+
+    Arguments:
+        real_path (str) - path to the image
+        max_res (int) - the largest the image is allowed to be
+        use_float (bool) - decode to float pixels, rather than 8 bits
+
+    Returns:
+        (tuple) - width, height, number of channels, the largest side of the
+                  original image, and the pixels
+    '''
+    ice._registry.Mark()
+    try:
+        iceimg = ice.Load(real_path)
+        if use_float:
+            iceimg = iceimg.TypeConvert(ice.constants.FLOAT)
+        else:
+            # quantize to 8 bits
+            iceimg = iceimg.TypeConvert(ice.constants.FRACTIONAL)
+
+        x1, x2, y1, y2 = iceimg.DataBox()
+        width = (x2 - x1) + 1
+        height = (y2 - y1) + 1
+        largestDim = max(width, height)
+
+        if largestDim > max_res:
+            scale = (max_res/largestDim, max_res/largestDim)
+            iceimg = iceimg.Resize(scale)
+            x1, x2, y1, y2 = iceimg.DataBox()
+            width = (x2 - x1) + 1
+            height = (y2 - y1) + 1
+
+        numChannels = iceimg.Ply()
+        if use_float and numChannels != 4:
+            # if this is not a 4-channel image, we create a card with an alpha
+            # and composite the image over the card
+            bg = ice.Card(ice.constants.FLOAT, [0,0,0,1])
+            iceimg = bg.Over(iceimg)
+
+        buffer = iceimg.AsByteArray()
+        del iceimg
+    finally:
+        ice._registry.RemoveToMark()
+
+    return (width, height, numChannels, largestDim, buffer)
+
+def create_gl_texture(width, height, numChannels, buffer):
+    '''
+    Create a texture from pixels returned by decode_texture. This
+    has to be called from the main thread.
+    '''
+    if USE_GPU_MODULE:
+        pixels = gpu.types.Buffer('FLOAT', len(buffer), buffer)
+        return gpu.types.GPUTexture((width, height), format='RGBA32F', data=pixels)
+
+    pixels = bgl.Buffer(bgl.GL_BYTE, len(buffer), buffer)
+    texture = bgl.Buffer(bgl.GL_INT, 1)
+
+    iFormat = bgl.GL_RGBA
+    texFormat = bgl.GL_RGBA
+    if numChannels == 1:
+        iFormat = bgl.GL_RGB
+        texFormat = bgl.GL_LUMINANCE
+    elif numChannels == 2:
+        iFormat = bgl.GL_RGB
+        texFormat = bgl.GL_LUMINANCE_ALPHA
+    elif numChannels == 3:
+        iFormat = bgl.GL_RGB
+        texFormat = bgl.GL_RGB
+    elif numChannels == 4:
+        iFormat = bgl.GL_RGBA
+        texFormat = bgl.GL_RGBA
+
+    bgl.glGenTextures(1, texture)
+    bgl.glActiveTexture(bgl.GL_TEXTURE0)
+    bgl.glBindTexture(bgl.GL_TEXTURE_2D, texture[0])
+    bgl.glTexImage2D(bgl.GL_TEXTURE_2D, 0, iFormat, width, height, 0, texFormat, bgl.GL_UNSIGNED_BYTE, pixels)
+    bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MIN_FILTER, bgl.GL_LINEAR)
+    bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MAG_FILTER, bgl.GL_LINEAR)
+    bgl.glBindTexture(bgl.GL_TEXTURE_2D, 0)
+
+    return texture
+
+def delete_gl_texture(texture):
+    if not USE_GPU_MODULE:
+        bgl.glDeleteTextures(1, texture)
+
+def _get_mtime(real_path):
+    try:
+        return os.path.getmtime(real_path)
+    except OSError:
+        return None
+
+class LightTexture(object):
+    '''
+    A texture that has been loaded for a light.
+
+    Attributes:
+        texture (GPUTexture) - the texture, or a bgl buffer holding the texture name
+        resolution (int) - the resolution the texture was requested at
+        full_res (bool) - whether the texture was loaded at the image's own resolution
+        nbytes (int) - the size of the texture in memory
+    '''
+
+    def __init__(self, texture, resolution, full_res, nbytes):
+        self.texture = texture
+        self.resolution = resolution
+        self.full_res = full_res
+        self.nbytes = nbytes
+
+class LightTextureCache(object):
+    '''
+    Cache of the textures that are drawn on lights in the viewport. Images are
+    decoded on a worker thread; until they are ready, get() returns a low
+    resolution placeholder, or None. Textures are loaded at a resolution based
+    on how large they are on screen, and the least recently drawn textures are
+    thrown away when the cache goes over its memory budget.
+
+    Attributes:
+        textures (OrderedDict) - texture path to LightTexture, least recently drawn first
+        jobs (dict) - (texture path, resolution) to the future decoding it, and the
+                      modification time of the image when it was submitted
+        failed (dict) - textures that could not be loaded, to the modification time
+                        of the image that failed. They are retried when the image changes.
+        drawn (set) - textures drawn since the last call to begin_draw
+    '''
+
+    def __init__(self):
+        self.textures = OrderedDict()
+        self.jobs = dict()
+        self.failed = dict()
+        self.drawn = set()
+        self._executor = None
+        self._poll_timer = None
+
+    def begin_draw(self):
+        self.drawn.clear()
+
+    def get(self, tex, real_path, screen_size):
+        '''
+        Get the texture to draw for tex.
+
+        Arguments:
+            tex (str) - the texture path, as set on the light
+            real_path (str) - tex with all tokens expanded
+            screen_size (float) - the size, in pixels, of the texture on screen
+
+        Returns:
+            (GPUTexture) - the texture, or None if it's not ready yet
+        '''
+        self._collect_jobs()
+
+        entry = self.textures.get(tex, None)
+        self.drawn.add(tex)
+        if entry:
+            self.textures.move_to_end(tex)
+
+        if tex in self.failed and self.failed[tex] != _get_mtime(real_path):
+            # the image changed since it failed to load, try again
+            del self.failed[tex]
+
+        if tex not in self.failed and not self._has_job(tex):
+            resolution = get_mip_resolution(screen_size)
+            if entry is None:
+                if resolution > _PLACEHOLDER_RES_:
+                    self._submit(tex, real_path, _PLACEHOLDER_RES_)
+                self._submit(tex, real_path, resolution)
+            elif entry.resolution < resolution and not entry.full_res:
+                self._submit(tex, real_path, resolution)
+
+        if entry:
+            return entry.texture
+        return None
+
+    def release(self, keep):
+        '''
+        Delete all of the textures that are not in keep.
+
+        Arguments:
+            keep (dict) - textures that are still used by a light
+        '''
+        for tex in [k for k in self.textures if k not in keep]:
+            rfb_log().debug("Call glDeleteTextures for: %s" % tex)
+            delete_gl_texture(self.textures.pop(tex).texture)
+
+    def end_draw(self, keep, budget):
+        '''
+        Called once all lights have been drawn. Delete the textures that are
+        not in keep, then throw away the least recently drawn textures until
+        the cache fits in budget. Textures drawn this frame are never thrown away.
+
+        Arguments:
+            keep (dict) - textures that are still used by a light
+            budget (int) - how many bytes of textures to keep around
+        '''
+        self.release(keep)
+        self._evict(budget)
+
+    def clear(self):
+        for future, mtime in self.jobs.values():
+            future.cancel()
+        self.jobs.clear()
+        self._stop_polling()
+        for entry in self.textures.values():
+            delete_gl_texture(entry.texture)
+        self.textures.clear()
+        self.failed.clear()
+        self.drawn.clear()
+
+    def shutdown(self):
+        '''
+        Clear the cache, and stop the worker thread. The cache can still
+        be used afterwards; a new worker is started when needed.
+        '''
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _has_job(self, tex):
+        for k in self.jobs:
+            if k[0] == tex:
+                return True
+        return False
+
+    def _submit(self, tex, real_path, resolution):
+        if self._executor is None:
+            # ice is not used from multiple threads, so only use one worker
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        future = self._executor.submit(decode_texture, real_path, resolution, USE_GPU_MODULE)
+        self.jobs[(tex, resolution)] = (future, _get_mtime(real_path))
+        if self._poll_timer is None:
+            # timers are unregistered by identity, so hold on to the
+            # bound method we registered
+            self._poll_timer = self._poll_jobs
+            bpy.app.timers.register(self._poll_timer, first_interval=0.1)
+
+    def _stop_polling(self):
+        if self._poll_timer is not None:
+            if bpy.app.timers.is_registered(self._poll_timer):
+                bpy.app.timers.unregister(self._poll_timer)
+            self._poll_timer = None
+
+    def _poll_jobs(self):
+        # redraw the viewports when a texture is ready to be picked up,
+        # and keep polling while other textures are still being decoded
+        if any(future.done() for future, mtime in self.jobs.values()):
+            for window in bpy.context.window_manager.windows:
+                for area in window.screen.areas:
+                    if area.type == 'VIEW_3D':
+                        area.tag_redraw()
+        if any(not future.done() for future, mtime in self.jobs.values()):
+            return 0.1
+        self._poll_timer = None
+        return None
+
+    def _collect_jobs(self):
+        for key in [k for k, (future, mtime) in self.jobs.items() if future.done()]:
+            tex, resolution = key
+            future, mtime = self.jobs.pop(key)
+            if future.cancelled():
+                continue
+            try:
+                width, height, numChannels, largestDim, buffer = future.result()
+            except Exception as e:
+                rfb_log().error("Could not load light texture %s: %s" % (tex, str(e)))
+                self.failed[tex] = mtime
+                continue
+
+            entry = self.textures.get(tex, None)
+            if entry and entry.resolution >= resolution:
+                continue
+
+            texture = create_gl_texture(width, height, numChannels, buffer)
+            nbytes = width * height * 4 * (4 if USE_GPU_MODULE else 1)
+            if entry:
+                delete_gl_texture(entry.texture)
+            self.textures[tex] = LightTexture(texture, resolution, largestDim <= resolution, nbytes)
+            self.textures.move_to_end(tex)
+
+    def _evict(self, budget):
+        # never throw away textures that are being drawn
+        total = sum(entry.nbytes for entry in self.textures.values())
+        for tex in list(self.textures.keys()):
+            if total <= budget:
+                break
+            if tex in self.drawn:
+                continue
+            entry = self.textures.pop(tex)
+            total -= entry.nbytes
+            rfb_log().debug("Evicting light texture: %s" % tex)
+            delete_gl_texture(entry.texture)
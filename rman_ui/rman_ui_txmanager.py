@@ -17,6 +17,7 @@ from rman_utils import txmanager as txmngr
 from .. import rfb_icons
 import sys
 import hashlib
+from collections import OrderedDict
 import os
 import uuid
 
@@ -475,6 +476,92 @@ class PRMAN_OT_Renderman_txmanager_apply_preset(Operator):
 
         return {'FINISHED'}
 
+def _set_txmgr_list_item(item, txfile):
+    item.name = txfile.input_image
+    params = txfile.params
+    item.texture_type = params.texture_type
+    item.s_mode = params.s_mode
+    item.t_mode = params.t_mode
+    item.texture_format = params.texture_format
+    if params.data_type is not None:
+        item.data_type = params.data_type
+    item.resize = params.resize 
+    item.state = txfile.state   
+    if txfile.state == txmngr.STATE_IS_TEX:
+        item.enable = False  
+    else:
+        item.enable = True
+    if params.ocioconvert:
+        item.ocioconvert = params.ocioconvert
+
+    if params.bumprough:
+        bumprough = params.bumprough_as_dict()
+        item.bumpRough = str(bumprough['normalmap'])
+        item.bumpRough_factor = float(bumprough['factor'])
+        item.bumpRough_invert = bool(bumprough['invert'])
+        item.bumpRough_invertU = bool(bumprough['invertU'])
+        item.bumpRough_invertV = bool(bumprough['invertV'])
+        item.bumpRough_refit = bool(bumprough['refit'])
+    else:
+        params.bumpRough = "-1"
+
+    item.tooltip = '\nNode ID: ' + item.nodeID + "\n" + str(txfile)
+    # FIXME: should also add the nodes that this texture is referenced in
+
+def add_textures_to_list(rman_txmgr_list, nodeIDs):
+    """Add textures that have been added to the txmanager to the texture manager
+    list. Items for textures that don't exist anymore, or that were replaced by
+    one of the new node IDs, are removed, and there is only one item per TxFile.
+    The list is only walked once, however many textures are added.
+
+    Args:
+    - rman_txmgr_list (bpy_prop_collection): the scene's rman_txmgr_list
+    - nodeIDs (list): the node IDs of the textures to add
+    """
+    mgr = texture_utils.get_txmanager().txmanager
+    txfiles = OrderedDict()
+    for nodeID in nodeIDs:
+        if nodeID == "":
+            continue
+        txfile = mgr.get_txfile_from_id(nodeID)
+        if txfile:
+            txfiles[nodeID] = txfile
+    if not txfiles:
+        return
+
+    # as if they were added one at a time, only the last node ID
+    # of the ones that share a TxFile gets an item
+    unique_txfiles = list()
+    for nodeID, txfile in reversed(list(txfiles.items())):
+        if txfile in unique_txfiles:
+            del txfiles[nodeID]
+        else:
+            unique_txfiles.append(txfile)
+
+    try:
+        new_txfiles = set(txfiles.values())
+    except TypeError:
+        # TxFile is not hashable
+        new_txfiles = list(txfiles.values())
+    for i in reversed(range(len(rman_txmgr_list))):
+        item = rman_txmgr_list[i]
+        if item.nodeID in txfiles:
+            continue
+        txfile_item = mgr.get_txfile_from_id(item.nodeID)
+        if txfile_item is None or txfile_item in new_txfiles:
+            rman_txmgr_list.remove(i)
+
+    items = dict()
+    for item in rman_txmgr_list:
+        items[item.nodeID] = item
+
+    for nodeID, txfile in txfiles.items():
+        item = items.get(nodeID, None)
+        if not item:
+            item = rman_txmgr_list.add()
+            item.nodeID = nodeID
+        _set_txmgr_list_item(item, txfile)
+
 class PRMAN_OT_Renderman_txmanager_add_texture(Operator):
     """Add texture."""
 
@@ -485,66 +572,7 @@ class PRMAN_OT_Renderman_txmanager_add_texture(Operator):
     nodeID: StringProperty()
 
     def execute(self, context):
-        if self.nodeID == "":
-            return {'FINISHED'}
-
-        txfile = texture_utils.get_txmanager().txmanager.get_txfile_from_id(self.nodeID)
-        if not txfile:
-            return{'FINISHED'}
-
-        item = None
-        # check if nodeID already exists in the list
-        nodeIDs = list()
-        rman_txmgr_list = context.scene.rman_txmgr_list
-        for idx, i in enumerate(rman_txmgr_list):
-            if i.nodeID == self.nodeID:
-                item = i
-                break
-            txfile_item = texture_utils.get_txmanager().txmanager.get_txfile_from_id(i.nodeID)
-            if txfile_item is None:
-                nodeIDs.append(i.nodeID)
-                continue
-            
-            if txfile_item == txfile and i.nodeID != self.nodeID:
-                nodeIDs.append(i.nodeID)
-
-        for nodeID in nodeIDs:
-            bpy.ops.rman_txmgr_list.remove_texture('EXEC_DEFAULT', nodeID=nodeID)                
-                
-        if not item:
-            item = rman_txmgr_list.add()
-            item.nodeID = self.nodeID
-        item.name = txfile.input_image
-        params = txfile.params
-        item.texture_type = params.texture_type
-        item.s_mode = params.s_mode
-        item.t_mode = params.t_mode
-        item.texture_format = params.texture_format
-        if params.data_type is not None:
-            item.data_type = params.data_type
-        item.resize = params.resize 
-        item.state = txfile.state   
-        if txfile.state == txmngr.STATE_IS_TEX:
-            item.enable = False  
-        else:
-            item.enable = True
-        if params.ocioconvert:
-            item.ocioconvert = params.ocioconvert
-
-        if params.bumprough:
-            bumprough = params.bumprough_as_dict()
-            item.bumpRough = str(bumprough['normalmap'])
-            item.bumpRough_factor = float(bumprough['factor'])
-            item.bumpRough_invert = bool(bumprough['invert'])
-            item.bumpRough_invertU = bool(bumprough['invertU'])
-            item.bumpRough_invertV = bool(bumprough['invertV'])
-            item.bumpRough_refit = bool(bumprough['refit'])
-        else:
-            params.bumpRough = "-1"
-
-        item.tooltip = '\nNode ID: ' + item.nodeID + "\n" + str(txfile)
-        # FIXME: should also add the nodes that this texture is referenced in     
-
+        add_textures_to_list(context.scene.rman_txmgr_list, [self.nodeID])
         return{'FINISHED'}        
 
 class PRMAN_OT_Renderman_txmanager_refresh(Operator):